@@ -0,0 +1,393 @@
+"""Cross-meeting analytics served from rollup tables.
+
+When a meeting ends, ``rollup_session()`` condenses its archived attendance
+into a handful of rows: a per-meeting summary (``session_rollup``), counts per
+zone, group, category and church (``dimension_rollup``) and counts per cohort,
+the meeting each attendee first came to (``cohort_rollup``). Attendees are
+told apart by normalized phone number, and ``attendee_first_visit`` remembers
+the earliest meeting each number attended.
+
+The analytics page reads only those tables, a few rows per meeting, and
+shapes them with pandas, so years of meetings answer in milliseconds without
+touching ``archived_attendance``. ``rebuild()`` recomputes everything from the
+archive. pandas and numpy are imported by the query functions on first use;
+keeping the rollups up to date does not need them, except to read meetings
+moved to the Parquet archive.
+"""
+from collections import Counter
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, insert, select, update
+
+import parquet_archive
+from database import db
+from duplicates import normalize_phone
+from models import (ArchivedAttendance, AttendeeFirstVisit, CohortRollup, DimensionRollup,
+                    MeetingSession, Person, SessionRollup)
+
+# Rollup dimension -> ArchivedAttendance attribute it counts
+DIMENSIONS = {
+    'zone': 'zone',
+    'group': 'group_name',
+    'category': 'category',
+    'church': 'church',
+}
+
+# Trend granularity -> pandas period alias and label format
+FREQUENCIES = {
+    'day': ('D', '%Y-%m-%d'),
+    'week': ('W', '%Y-%m-%d'),
+    'month': ('M', '%Y-%m'),
+}
+
+# Lines drawn per trend; the smaller values are added up as "Other"
+TREND_SERIES = 8
+
+# Phone numbers looked up per IN (...) query
+LOOKUP_CHUNK = 500
+
+# Rows fetched or written at a time when folding a meeting into the rollups
+FETCH_CHUNK = 5000
+
+
+def _label(dimension, value):
+    value = ' '.join(str(value or '').split())
+    # Church names are typed in by hand, so spellings differing only in
+    # case or spacing are counted together
+    return value.upper() if dimension == 'church' else value
+
+
+def _session_rows(meeting_session, attrs=()):
+    """Iterate (phone, *attrs) of each archived attendee of a meeting, from SQLite or its Parquet file"""
+    if parquet_archive.offloaded(meeting_session):
+        frame = parquet_archive.session_frame(meeting_session, ['phone', *attrs])
+        return parquet_archive.rows(frame)
+    return db.session.execute(select(
+        Person.phone, *[getattr(ArchivedAttendance, attr) for attr in attrs]
+    ).join(ArchivedAttendance.person).where(
+        ArchivedAttendance.meeting_session_id == meeting_session.id
+    ).execution_options(yield_per=FETCH_CHUNK))
+
+
+def _session_phones(session_id):
+    meeting_session = db.session.get(MeetingSession, session_id)
+    phones = {normalize_phone(phone) for (phone,) in _session_rows(meeting_session)}
+    phones.discard(None)
+    return phones
+
+
+def _first_visits(phones):
+    """{phone: (meeting_session_id, start_time)} for the phones seen before"""
+    phones = list(phones)
+    visits = {}
+    for i in range(0, len(phones), LOOKUP_CHUNK):
+        rows = db.session.execute(select(
+            AttendeeFirstVisit.phone, AttendeeFirstVisit.meeting_session_id, AttendeeFirstVisit.start_time
+        ).where(AttendeeFirstVisit.phone.in_(phones[i:i + LOOKUP_CHUNK])))
+        for phone, session_id, start_time in rows:
+            visits[phone] = (session_id, start_time)
+    return visits
+
+
+def _record_first_visits(meeting_session, phones):
+    """Make this meeting the first visit of phones not seen at an earlier one.
+
+    Returns the meetings that phones were moved away from, whose later
+    meetings' cohort counts are now out of date.
+    """
+    key = (meeting_session.start_time, meeting_session.id)
+    known = _first_visits(phones)
+    new = [phone for phone in phones if phone not in known]
+    moved = {phone: session_id for phone, (session_id, start_time) in known.items()
+             if (start_time, session_id) > key}
+    visit = {'meeting_session_id': meeting_session.id, 'start_time': meeting_session.start_time}
+    # In slices, so a large meeting's parameters are never all built at once
+    for i in range(0, len(new), FETCH_CHUNK):
+        db.session.execute(insert(AttendeeFirstVisit), [dict(visit, phone=phone) for phone in new[i:i + FETCH_CHUNK]])
+    moved_phones = list(moved)
+    for i in range(0, len(moved_phones), FETCH_CHUNK):
+        db.session.execute(update(AttendeeFirstVisit),
+                           [dict(visit, phone=phone) for phone in moved_phones[i:i + FETCH_CHUNK]])
+    return set(moved.values())
+
+
+def _rollup_cohorts(session_id, phones):
+    """Replace a meeting's cohort counts; returns how many came for the first time"""
+    cohorts = Counter(cohort for cohort, _ in _first_visits(phones).values())
+    db.session.execute(delete(CohortRollup).where(CohortRollup.meeting_session_id == session_id))
+    if cohorts:
+        db.session.execute(insert(CohortRollup), [
+            {'meeting_session_id': session_id, 'cohort_session_id': cohort, 'count': n}
+            for cohort, n in cohorts.items()
+        ])
+    return cohorts.get(session_id, 0)
+
+
+def _refresh_cohorts(session_id):
+    phones = _session_phones(session_id)
+    first_timers = _rollup_cohorts(session_id, phones)
+    db.session.execute(update(SessionRollup).where(SessionRollup.meeting_session_id == session_id).values(
+        first_timers=first_timers, returning_attendees=len(phones) - first_timers))
+
+
+def rollup_session(meeting_session):
+    """(Re)compute the rollups of one ended meeting from its archived rows; the caller commits"""
+    session_id = meeting_session.id
+    rows = _session_rows(meeting_session, DIMENSIONS.values())
+
+    tally = Counter()
+    phones = set()
+    total = 0
+    for phone, *values in rows:
+        total += 1
+        for dimension, value in zip(DIMENSIONS, values):
+            value = _label(dimension, value)
+            if value:
+                tally[(dimension, value)] += 1
+        phone = normalize_phone(phone)
+        if phone:
+            phones.add(phone)
+
+    db.session.execute(delete(DimensionRollup).where(DimensionRollup.meeting_session_id == session_id))
+    if tally:
+        db.session.execute(insert(DimensionRollup), [
+            {'meeting_session_id': session_id, 'dimension': dimension, 'value': value, 'count': n}
+            for (dimension, value), n in tally.items()
+        ])
+
+    moved_from = _record_first_visits(meeting_session, phones)
+    first_timers = _rollup_cohorts(session_id, phones)
+
+    db.session.execute(delete(SessionRollup).where(SessionRollup.meeting_session_id == session_id))
+    db.session.execute(insert(SessionRollup), [{
+        'meeting_session_id': session_id,
+        'meeting_date': meeting_session.start_time.date(),
+        'start_time': meeting_session.start_time,
+        'total': total,
+        'first_timers': first_timers,
+        'returning_attendees': len(phones) - first_timers,
+    }])
+
+    # Attendance added to an older meeting can turn someone's later "first"
+    # visit into a return, so the later meetings they came to are recounted
+    if moved_from:
+        later = db.session.execute(select(CohortRollup.meeting_session_id).where(
+            CohortRollup.cohort_session_id.in_(moved_from),
+            CohortRollup.meeting_session_id != session_id
+        ).distinct()).scalars().all()
+        for later_id in later:
+            _refresh_cohorts(later_id)
+
+
+def clear(session_id=None):
+    """Drop the rollups of one meeting, or of every meeting; the caller commits.
+
+    Attendees whose first visit was the dropped meeting are reassigned to the
+    next meeting they came to, so call this after its attendance is deleted.
+    """
+    if session_id is None:
+        for model in (CohortRollup, DimensionRollup, SessionRollup, AttendeeFirstVisit):
+            db.session.execute(delete(model))
+        return
+
+    later = db.session.execute(select(CohortRollup.meeting_session_id).where(
+        CohortRollup.cohort_session_id == session_id,
+        CohortRollup.meeting_session_id != session_id
+    ).distinct()).scalars().all()
+    db.session.execute(delete(CohortRollup).where(
+        (CohortRollup.meeting_session_id == session_id) | (CohortRollup.cohort_session_id == session_id)))
+    db.session.execute(delete(DimensionRollup).where(DimensionRollup.meeting_session_id == session_id))
+    db.session.execute(delete(SessionRollup).where(SessionRollup.meeting_session_id == session_id))
+    db.session.execute(delete(AttendeeFirstVisit).where(AttendeeFirstVisit.meeting_session_id == session_id))
+
+    # Oldest first, so each attendee lands on the earliest meeting left
+    if later:
+        for meeting_session in MeetingSession.query.filter(MeetingSession.id.in_(later)).order_by(
+                MeetingSession.start_time, MeetingSession.id):
+            rollup_session(meeting_session)
+
+
+def rebuild():
+    """Recompute every rollup from the archive; returns the number of meetings"""
+    clear()
+    ended = MeetingSession.query.filter_by(is_active=False).order_by(
+        MeetingSession.start_time, MeetingSession.id).all()
+    for meeting_session in ended:
+        rollup_session(meeting_session)
+    return len(ended)
+
+
+# --- Queries ---
+
+def window_start(days):
+    """First meeting date inside a window of the last ``days`` days (None for all time)"""
+    return date.today() - timedelta(days=days) if days else None
+
+
+def _frame(stmt, columns):
+    import pandas as pd
+    # Core execution: plain tuples, without the ORM's per-row processing
+    return pd.DataFrame(db.session.connection().execute(stmt).all(), columns=columns)
+
+
+def _since(stmt, since):
+    return stmt.where(SessionRollup.meeting_date >= since) if since else stmt
+
+
+def _periods(dates, freq):
+    """The start of the day, week (Monday) or month each meeting date falls in"""
+    import pandas as pd
+    return pd.to_datetime(dates).dt.to_period(FREQUENCIES[freq][0]).dt.start_time
+
+
+def _labels(index, freq):
+    # Formatted once per period rather than once per row
+    return index.strftime(FREQUENCIES[freq][1]).tolist()
+
+
+def summary(since=None):
+    """Totals over the window: meetings, sign-ins, first-timers and returning attendees.
+
+    ``people_all_time`` is the exception: distinct people at any meeting,
+    whatever the window (the rollups cannot tell who came within one).
+    """
+    meetings, sign_ins, first_timers, returning = db.session.execute(_since(select(
+        func.count(), func.coalesce(func.sum(SessionRollup.total), 0),
+        func.coalesce(func.sum(SessionRollup.first_timers), 0),
+        func.coalesce(func.sum(SessionRollup.returning_attendees), 0)
+    ), since)).one()
+    return {
+        'meetings': meetings,
+        'sign_ins': sign_ins,
+        'average': round(sign_ins / meetings, 1) if meetings else 0,
+        'first_timers': first_timers,
+        'returning': returning,
+        # Everyone has exactly one first visit, so this counts distinct people
+        'people_all_time': db.session.query(func.coalesce(func.sum(SessionRollup.first_timers), 0)).scalar(),
+    }
+
+
+def attendance_series(since=None, freq='week'):
+    """Sign-ins, first-timers and returning attendees per period"""
+    import numpy as np
+    df = _frame(_since(select(
+        SessionRollup.meeting_date, SessionRollup.total, SessionRollup.first_timers, SessionRollup.returning_attendees
+    ), since), ['meeting_date', 'total', 'first_timers', 'returning'])
+    if df.empty:
+        return []
+    df['period'] = _periods(df['meeting_date'], freq)
+    grouped = df.groupby('period', sort=True).agg(
+        meetings=('total', 'size'), total=('total', 'sum'),
+        first_timers=('first_timers', 'sum'), returning=('returning', 'sum'))
+    grouped['first_timer_share'] = np.round(
+        100 * grouped['first_timers'] / np.maximum(grouped['first_timers'] + grouped['returning'], 1), 1)
+    return [{'period': period, 'meetings': int(row.meetings), 'total': int(row.total),
+             'first_timers': int(row.first_timers), 'returning': int(row.returning),
+             'first_timer_share': float(row.first_timer_share)}
+            for period, row in zip(_labels(grouped.index, freq), grouped.itertuples())]
+
+
+def trend(dimension, since=None, freq='week'):
+    """Attendance per period for each value of a dimension (top TREND_SERIES, the rest as Other)"""
+    df = _frame(_since(select(
+        SessionRollup.meeting_date, DimensionRollup.value, DimensionRollup.count
+    ).join(SessionRollup, SessionRollup.meeting_session_id == DimensionRollup.meeting_session_id).where(
+        DimensionRollup.dimension == dimension
+    ), since), ['meeting_date', 'value', 'count'])
+    if df.empty:
+        return {'periods': [], 'series': []}
+    df['period'] = _periods(df['meeting_date'], freq)
+    table = df.groupby(['period', 'value'])['count'].sum().unstack(fill_value=0)
+    totals = table.sum().sort_values(ascending=False, kind='stable')
+    if len(totals) > TREND_SERIES:
+        keep = totals.index[:TREND_SERIES - 1]
+        other = table.drop(columns=keep).sum(axis=1)
+        table = table[keep].assign(Other=other)
+        totals = table.sum()
+    else:
+        table = table[totals.index]
+    return {
+        'periods': _labels(table.index, freq),
+        'series': [{'name': name, 'values': table[name].astype(int).tolist(), 'total': int(totals[name])}
+                   for name in table.columns],
+    }
+
+
+def top_churches(since=None, limit=10):
+    """Churches with the most sign-ins over the window, with their share and meetings attended"""
+    import numpy as np
+    df = _frame(_since(select(
+        DimensionRollup.value, func.sum(DimensionRollup.count), func.count()
+    ).join(SessionRollup, SessionRollup.meeting_session_id == DimensionRollup.meeting_session_id).where(
+        DimensionRollup.dimension == 'church'
+    ), since).group_by(DimensionRollup.value), ['church', 'sign_ins', 'meetings'])
+    if df.empty:
+        return []
+    df['share'] = np.round(100 * df['sign_ins'] / df['sign_ins'].sum(), 1)
+    top = df.nlargest(limit, 'sign_ins')
+    return [{'church': row.church, 'sign_ins': int(row.sign_ins), 'meetings': int(row.meetings),
+             'share': float(row.share)} for row in top.itertuples()]
+
+
+def retention(cohorts=12, horizon=4):
+    """Share of each recent meeting's first-timers seen again 1..horizon meetings later.
+
+    Returns (cohort rows newest first, overall rates). A rate is None where
+    that many meetings have not happened yet.
+    """
+    import numpy as np
+    import pandas as pd
+    order = _frame(select(
+        SessionRollup.meeting_session_id, SessionRollup.meeting_date, MeetingSession.meeting_name
+    ).join(MeetingSession, MeetingSession.id == SessionRollup.meeting_session_id).order_by(
+        SessionRollup.start_time, SessionRollup.meeting_session_id
+    ), ['id', 'meeting_date', 'name'])
+    if order.empty:
+        return [], [None] * horizon
+    position = pd.Series(np.arange(len(order)), index=order['id'])
+    chosen = order.iloc[-cohorts:]
+
+    df = _frame(select(
+        CohortRollup.cohort_session_id, CohortRollup.meeting_session_id, CohortRollup.count
+    ).where(CohortRollup.cohort_session_id.in_(chosen['id'].tolist())), ['cohort', 'meeting', 'count'])
+    df['offset'] = position.reindex(df['meeting']).to_numpy() - position.reindex(df['cohort']).to_numpy()
+    df = df[(df['offset'] >= 0) & (df['offset'] <= horizon)]
+    matrix = df.pivot_table(index='cohort', columns='offset', values='count', aggfunc='sum', fill_value=0)
+    matrix = matrix.reindex(index=chosen['id'], columns=range(horizon + 1), fill_value=0).to_numpy()
+
+    sizes = matrix[:, 0]
+    offsets = np.arange(1, horizon + 1)
+    # A cohort k meetings from the end has only k later meetings so far
+    happened = (len(order) - 1 - position[chosen['id']].to_numpy())[:, None] >= offsets
+    counted = happened & (sizes[:, None] > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rates = np.round(100 * matrix[:, 1:] / sizes[:, None], 1)
+        overall = np.round(100 * np.where(counted, matrix[:, 1:], 0).sum(axis=0)
+                           / np.where(counted, sizes[:, None], 0).sum(axis=0), 1)
+
+    rows = []
+    for i, cohort in enumerate(chosen.itertuples()):
+        rows.append({
+            'session_id': int(cohort.id),
+            'meeting_date': cohort.meeting_date.isoformat(),
+            'name': cohort.name,
+            'first_timers': int(sizes[i]),
+            'rates': [float(r) if ok else None for r, ok in zip(rates[i], counted[i])],
+        })
+    rows.reverse()
+    return rows, [None if np.isnan(r) else float(r) for r in overall]
+
+
+def report(days=365, freq='week', dimension='zone'):
+    """Everything the analytics page shows, as plain Python values"""
+    since = window_start(days)
+    cohorts, overall = retention()
+    return {
+        'since': since.isoformat() if since else None,
+        'summary': summary(since),
+        'attendance': attendance_series(since, freq),
+        'trend': trend(dimension, since, freq),
+        'churches': top_churches(since),
+        'retention': cohorts,
+        'retention_overall': overall,
+    }
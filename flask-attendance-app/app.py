@@ -1,15 +1,34 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session, send_file
-from database import db
-from models import Attendance, MeetingLocation, MeetingSession
+from flask import Flask, Response, jsonify, render_template, request, redirect, url_for, flash, make_response, session, send_file, stream_with_context
+from database import configure_sqlite, db
+from models import Attendance, ArchivedAttendance, MeetingLocation, MeetingSession, Person
+from ingest import IngestQueue, IngestBusy
+import analytics
+import archive
+import counters
+import exports
+import migrations
+import attendee_api
+import bulk_import
+import offline_queue
+import parquet_archive
+import people
+from pagination import encode_cursor, decode_cursor
+from meeting_cache import active_meeting_cache
+import click
+from sqlalchemy import or_, text
 from sqlalchemy.exc import IntegrityError
-import qrcode
-import io
-import base64
-from geopy.distance import geodesic
+import qr_codes
+from qr_codes import qr_cache
+from live_feed import live_feed
+from duplicates import duplicate_index
+from export_jobs import export_jobs
+from metrics import CountingConnection, request_metrics
+from rate_limit import RateLimiter
+from werkzeug.middleware.proxy_fix import ProxyFix
+import geofence
 from functools import wraps
-import pandas as pd
 from datetime import datetime
-import tempfile
+import hmac
 import os
 
 app = Flask(__name__)
@@ -23,41 +42,138 @@ ADMIN_PASSWORD = "attendance123"  # Change this in production!
 import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Use a simple database path that works on Render
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "attendance.db")}'
+# Use a simple database path that works on Render (DATABASE_URL overrides it)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "attendance.db")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Connection pool per worker; gunicorn.conf.py sizes it for threaded/gevent workers
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+}
+
+# SQLite settings applied to every pooled connection (database.py):
+# SQLITE_PROFILE=tuned uses the values below, 'default' leaves SQLite's own
+app.config['SQLITE_PROFILE'] = os.environ.get('SQLITE_PROFILE', 'tuned')
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+app.config['SQLITE_MMAP_SIZE_MB'] = int(os.environ.get('SQLITE_MMAP_SIZE_MB', 256))
+app.config['SQLITE_TEMP_STORE'] = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+
+# Attendance rows moved to the archive table per transaction when a meeting ends
+ARCHIVE_CHUNK_SIZE = 5000
+
+# Meeting sessions per archived records page
+ARCHIVE_SESSIONS_PER_PAGE = 10
+
+# Sign-in ingestion: 'direct' commits each submission in its own transaction,
+# 'batched' hands it to the group-commit queue in ingest.py. Batches only
+# group sign-ins in flight at once in one worker, so 'batched' needs gthread
+# or gevent workers; gunicorn.conf.py falls back to 'direct' for sync ones.
+# INGEST_SUBMIT_TIMEOUT is how long a sign-in waits for room in the queue.
+app.config['INGEST_MODE'] = os.environ.get('INGEST_MODE', 'direct')
+app.config['INGEST_BATCH_SIZE'] = int(os.environ.get('INGEST_BATCH_SIZE', 100))
+app.config['INGEST_FLUSH_INTERVAL'] = float(os.environ.get('INGEST_FLUSH_INTERVAL', 0.02))
+app.config['INGEST_QUEUE_SIZE'] = int(os.environ.get('INGEST_QUEUE_SIZE', 1000))
+app.config['INGEST_SUBMIT_TIMEOUT'] = float(os.environ.get('INGEST_SUBMIT_TIMEOUT', 10))
+
+# Live dashboard feed (live_feed.py); LIVE_STREAM_SECONDS=0 answers each
+# EventSource request immediately (long-poll) so sync workers stay free
+app.config['LIVE_POLL_INTERVAL'] = float(os.environ.get('LIVE_POLL_INTERVAL', 1.0))
+app.config['LIVE_STREAM_SECONDS'] = float(os.environ.get('LIVE_STREAM_SECONDS', 0))
+app.config['LIVE_RETRY_MS'] = int(os.environ.get('LIVE_RETRY_MS', 3000))
+app.config['LIVE_BUFFER_ROWS'] = int(os.environ.get('LIVE_BUFFER_ROWS', 500))
+
+# Rows per executemany transaction when bulk importing attendance (bulk_import.py)
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+
+# Turn away repeat sign-ins from the per-worker index before writing (duplicates.py)
+app.config['DUPLICATE_INDEX'] = os.environ.get('DUPLICATE_INDEX', '1').lower() in ('1', 'true', 'yes')
+
+# Reject sign-ins from outside the meeting location's radius (geofence.py)
+app.config['GEOFENCE_ENFORCE'] = os.environ.get('GEOFENCE_ENFORCE', '0').lower() in ('1', 'true', 'yes')
+
+# Sign-ins a phone queued while offline are replayed in batches of at most
+# OFFLINE_BATCH_MAX records (offline_queue.py), and still accepted up to
+# OFFLINE_SYNC_GRACE_HOURS after their meeting has ended
+app.config['OFFLINE_BATCH_MAX'] = int(os.environ.get('OFFLINE_BATCH_MAX', 100))
+app.config['OFFLINE_SYNC_GRACE_HOURS'] = float(os.environ.get('OFFLINE_SYNC_GRACE_HOURS', 24))
+
+# Phone lookups each client may make per minute on the attendance form
+# (rate_limit.py, counted per worker). Everyone on the venue's wifi can share
+# one address, so this is a brake on enumerating the registry, not a quota.
+app.config['LOOKUP_RATE_LIMIT'] = int(os.environ.get('LOOKUP_RATE_LIMIT', 30))
+
+# Proxies in front of the app (Render has one) whose X-Forwarded-For is
+# trusted for the client's address; 0 when clients connect directly
+app.config['PROXY_HOPS'] = int(os.environ.get('PROXY_HOPS', 1))
+
+# Archive exports (export_jobs.py) are built by EXPORT_WORKERS background
+# processes per worker and kept in EXPORT_DIR (default instance/exports) for
+# repeat downloads: up to EXPORT_CACHE_MAX_AGE_HOURS old, least recently
+# downloaded deleted first past EXPORT_CACHE_MAX_MB. A job silent for
+# EXPORT_STALE_SECONDS is taken to have died and is started again.
+# EXPORT_MODE=inline builds them in the request instead, and streams CSV
+# downloads as they are read without keeping a file.
+app.config['EXPORT_MODE'] = os.environ.get('EXPORT_MODE', 'background')
+app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', 1))
+app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR', '')
+app.config['EXPORT_CACHE_MAX_MB'] = float(os.environ.get('EXPORT_CACHE_MAX_MB', 500))
+app.config['EXPORT_CACHE_MAX_AGE_HOURS'] = float(os.environ.get('EXPORT_CACHE_MAX_AGE_HOURS', 24))
+app.config['EXPORT_STALE_SECONDS'] = float(os.environ.get('EXPORT_STALE_SECONDS', 300))
+
+# Parquet archive tier (parquet_archive.py, needs pyarrow): attendance of
+# meetings ended more than ARCHIVE_RETENTION_DAYS ago is moved out of SQLite
+# into one Parquet file per meeting in ARCHIVE_DIR (default instance/archive)
+# whenever a meeting ends. 0 keeps every meeting in SQLite.
+app.config['ARCHIVE_RETENTION_DAYS'] = float(os.environ.get('ARCHIVE_RETENTION_DAYS', 0))
+app.config['ARCHIVE_DIR'] = os.environ.get('ARCHIVE_DIR', '')
+app.config['ARCHIVE_COMPRESSION'] = os.environ.get('ARCHIVE_COMPRESSION', 'zstd')
+if app.config['ARCHIVE_RETENTION_DAYS'] and not parquet_archive.available():
+    # Said once here; ending a meeting then skips the move instead of failing in it
+    app.logger.error('ARCHIVE_RETENTION_DAYS is set but pyarrow is not installed: '
+                     'old meetings will stay in SQLite.')
+
+# Apply pending schema migrations when the app is imported (see below)
+app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', '1').lower() in ('1', 'true', 'yes')
+
+# Request timing and SQL counts at /metrics (metrics.py). gunicorn.conf.py
+# points METRICS_DIR at a directory shared by the workers; METRICS_TOKEN lets
+# a Prometheus scraper in without an admin login. SLOW_REQUEST_MS > 0 logs
+# requests slower than that with their slowest statements.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', '')
+app.config['METRICS_FLUSH_SECONDS'] = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))
+
+if app.config['METRICS_ENABLED'] and app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    # sqlite3 cursors that count the rows they fetch
+    app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {'factory': CountingConnection}
+
 # Initialize database
 db.init_app(app)
+configure_sqlite(app)
+active_meeting_cache.init_app(app)
+qr_cache.init_app(app)
+live_feed.init_app(app)
+export_jobs.init_app(app)
+request_metrics.init_app(app)
+ingest_queue = IngestQueue(app)
+lookup_limiter = RateLimiter()
+if app.config['PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'])
 
-# Create database tables on startup and handle migrations
-with app.app_context():
-    try:
-        # Try to create tables (handles new installations)
-        db.create_all()
-        
-        # Check if we need to migrate existing attendance records
-        # Add default values for new columns if they don't exist
-        existing_records = db.session.execute(db.text("SELECT COUNT(*) FROM attendance")).scalar()
-        if existing_records > 0:
-            # Check if new columns exist
-            try:
-                db.session.execute(db.text("SELECT zone FROM attendance LIMIT 1"))
-            except:
-                # Add new columns with default values for existing records
-                print("Adding new columns to existing attendance table...")
-                db.session.execute(db.text("ALTER TABLE attendance ADD COLUMN zone VARCHAR(50) DEFAULT 'MCA'"))
-                db.session.execute(db.text("ALTER TABLE attendance ADD COLUMN group_name VARCHAR(100) DEFAULT 'VIRTUOUS'"))
-                db.session.execute(db.text("ALTER TABLE attendance ADD COLUMN church VARCHAR(200) DEFAULT 'Unknown'"))
-                db.session.execute(db.text("ALTER TABLE attendance ADD COLUMN category VARCHAR(50) DEFAULT 'Member'"))
-                db.session.commit()
-                print("Database migration completed!")
-        
-        print("Database tables created/updated successfully!")
-    except Exception as e:
-        print(f"Database setup error: {e}")
-        # Fallback: just create tables
-        db.create_all()
+# Schema migrations (migrations.py) run once per deploy: gunicorn.conf.py
+# applies them in the master before any worker starts. Single-process runs
+# (python app.py, flask run, scripts) apply them on import unless
+# AUTO_MIGRATE=0, which costs one lookup of the schema version when current.
+if app.config['AUTO_MIGRATE']:
+    with app.app_context():
+        migrations.upgrade()
 
 # Authentication decorator
 def admin_required(f):
@@ -69,6 +185,14 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def api_admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('admin_logged_in'):
+            return jsonify(error='Admin access required.'), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
 @app.route('/admin-login', methods=['GET', 'POST'])
 def admin_login():
     if request.method == 'POST':
@@ -107,16 +231,25 @@ def attendance_form():
     
     # If no active session, redirect to home with message
     if not active_session:
+        if request.headers.get('X-Service-Worker'):
+            # Precache request from the service worker: nobody to show it to
+            return redirect(url_for('index'))
         flash('No active meeting session. Please check with the organizer.', 'error')
         return redirect(url_for('index'))
     
-    response = make_response(render_template('attendance_form.html', active_location=active_location, active_session=active_session))
+    response = make_response(render_template('attendance_form.html', active_location=active_location, active_session=active_session,
+                                             geofence_enforced=app.config['GEOFENCE_ENFORCE']))
     # Prevent caching to ensure fresh data
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
     response.headers['Pragma'] = 'no-cache' 
     response.headers['Expires'] = '0'
     return response
 
+DUPLICATE_MESSAGES = {
+    'email': 'This email address has already been registered for attendance.',
+    'phone': 'This phone number has already been registered for attendance.',
+}
+
 @app.route('/submit-attendance', methods=['POST'])
 def submit_attendance():
     # Check if there's an active meeting session
@@ -126,44 +259,61 @@ def submit_attendance():
         return redirect(url_for('index'))
     
     # Get form data
-    firstname = request.form['firstname']
-    lastname = request.form['lastname']
-    surname = request.form['surname']
-    email = request.form.get('email', None)
-    phone = request.form['phone']
-    zone = request.form['zone']
-    group_name = request.form['group_name']
-    church = request.form['church']
-    category = request.form['category']
+    phone = request.form.get('phone', '').strip()
+    # Blank optional emails are stored as NULL; a returning attendee's stays on file
+    email = request.form.get('email', '').strip() or None
+    details = {field: request.form.get(field, '').strip() for field in people.PREFILL_FIELDS}
+    
+    # A returning attendee can send just their phone number and last name:
+    # anything else left out is taken from the registry
+    if phone and not all(details.values()):
+        details = people.fill_in(phone, details)
+    if not phone or not all(details.values()):
+        flash('Please fill in all the required fields.', 'error')
+        return redirect(url_for('attendance_form'))
+    
     user_latitude = request.form.get('latitude')
     user_longitude = request.form.get('longitude')
-    # Geolocation enforcement disabled for this meeting
     user_lat = None
     user_lon = None
+    
+    # Repeat scans are turned away here, before any write transaction
+    if app.config['DUPLICATE_INDEX']:
+        duplicate = duplicate_index.check(active_session, phone, email)
+        if duplicate:
+            flash(DUPLICATE_MESSAGES[duplicate], 'error')
+            return redirect(url_for('attendance_form'))
+    
+    if app.config['GEOFENCE_ENFORCE']:
+        active_location = get_active_meeting_location()
+        try:
+            user_lat, user_lon = geofence.parse_coordinates(user_latitude, user_longitude)
+        except ValueError:
+            flash('Location access is required to sign attendance for this meeting. Please allow location and try again.', 'error')
+            return redirect(url_for('attendance_form'))
+        
+        if active_location:
+            fence = geofence.Geofence.for_location(active_location)
+            if not fence.contains(user_lat, user_lon):
+                distance = fence.distance(user_lat, user_lon)
+                flash(f'You appear to be {distance:.0f}m from the meeting location. Please sign attendance from within {active_location.radius_meters}m.', 'error')
+                return redirect(url_for('attendance_form'))
 
     try:
-        # Get the active meeting session to link this attendance record
-        active_session = get_active_meeting_session()
-        
         # Create a new Attendance record
         new_attendance = Attendance(
-            firstname=firstname,
-            lastname=lastname,
-            surname=surname,
-            email=email,
-            phone=phone,
-            zone=zone,
-            group_name=group_name,
-            church=church,
-            category=category,
+            zone=details['zone'],
+            group_name=details['group_name'],
+            church=details['church'],
+            category=details['category'],
             latitude=user_lat,
             longitude=user_lon,
             meeting_session_id=active_session.id if active_session else None
         )
 
-        #save to database
-        db.session.add(new_attendance)
-        db.session.commit()
+        #save to database, with the person it belongs to
+        save_attendance(new_attendance, dict(details, phone=phone, email=email))
+        duplicate_index.add(active_session, phone, email)
         
         # Get meeting info for success page  
         active_location = get_active_meeting_location()
@@ -173,19 +323,58 @@ def submit_attendance():
         meeting_name = active_location.name if active_location else 'the meeting'
         return redirect(url_for('success') + f'?meeting={meeting_name}&count={current_count}')
         
-    except IntegrityError as e:
-        # Handle duplicate email or phone
+    except IntegrityError:
+        # A person signing in twice: one sign-in per phone number is the only
+        # rule the database enforces (emails are checked by duplicate_index)
         db.session.rollback()
-        error_message = str(e.orig)
-        
-        if 'attendance.email' in error_message:
-            flash('This email address has already been registered for attendance.', 'error')
-        elif 'attendance.phone' in error_message:
-            flash('This phone number has already been registered for attendance.', 'error')
-        else:
-            flash('This information has already been registered. Please check your email or phone number.', 'error')
-            
+        flash(DUPLICATE_MESSAGES['phone'], 'error')
         return redirect(url_for('attendance_form'))
+    
+    except IngestBusy:
+        # The service worker keeps the submission and sends it again later
+        if request.headers.get('X-Service-Worker'):
+            return 'Busy', 503
+        flash('The server is busy right now. Please submit your attendance again.', 'error')
+        return redirect(url_for('attendance_form'))
+
+@app.route('/api/people/lookup')
+def api_people_lookup():
+    """Enough of a returning attendee's name for them to recognise it"""
+    if not lookup_limiter.allow(request.remote_addr, app.config['LOOKUP_RATE_LIMIT']):
+        return jsonify(error='Too many lookups. Please fill in the form.'), 429
+    # Only answered while a meeting is on, and never with contact details
+    person = people.lookup(request.args.get('phone', '')) if get_active_meeting_session() else None
+    if not person:
+        return jsonify(error='Not found.'), 404
+    response = jsonify(people.greeting(person))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/attendance/batch', methods=['POST'])
+def api_attendance_batch():
+    """Replay sign-ins queued on a phone while offline; one result per record"""
+    payload = request.get_json(silent=True)
+    records = payload.get('records') if isinstance(payload, dict) else None
+    if not isinstance(records, list):
+        return jsonify(error='Expected {"records": [...]}.'), 400
+    if len(records) > app.config['OFFLINE_BATCH_MAX']:
+        return jsonify(error=f"At most {app.config['OFFLINE_BATCH_MAX']} records per batch."), 413
+    
+    results = offline_queue.replay(records, app.config['IMPORT_BATCH_SIZE'])
+    if any(result['status'] == 'saved' for result in results):
+        live_feed.notify()
+    return jsonify(results=results)
+
+@app.route('/service-worker.js')
+def service_worker():
+    # Served from the root so the worker's scope covers the form and its submissions
+    response = app.send_static_file('service-worker.js')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/queued')
+def queued():
+    return render_template('queued.html')
 
 @app.route('/success')
 def success():
@@ -198,131 +387,86 @@ def success():
 def admin():
     active_location = get_active_meeting_location()
     active_session = get_active_meeting_session()
-    current_attendance_count = get_current_attendance_count()
     last_ended_session = get_last_ended_meeting_session()
     
-    # Get detailed counts
-    zone_counts = get_attendance_counts_by_zone()
-    group_counts = get_attendance_counts_by_group()
-    category_counts = get_attendance_counts_by_category()
+    # Get total and detailed counts from the session's rollup counters
+    counts = counters.session_counts(active_session.id if active_session else None)
     
     return render_template('admin.html', 
                          active_location=active_location, 
                          active_session=active_session,
-                         attendance_count=current_attendance_count,
+                         attendance_count=counts[counters.TOTAL],
                          last_ended_session=last_ended_session,
-                         zone_counts=zone_counts,
-                         group_counts=group_counts,
-                         category_counts=category_counts)
+                         zone_counts=counts['zone'],
+                         group_counts=counts['group'],
+                         category_counts=counts['category'])
 
 @app.route('/generate-qr')
 @admin_required
 def generate_qr():
+    size = request.args.get('size', 'screen')
+    fmt = request.args.get('format', 'png')
+    if size not in qr_codes.SIZES or fmt not in qr_codes.FORMATS:
+        return 'Unknown QR code size or format', 404
+    
+    # Rendered once per (URL, size, format); repeat loads revalidate to a 304
+    data, etag = qr_cache.get(get_attendance_url(), size, fmt)
+    response = make_response(data)
+    response.mimetype = qr_codes.FORMATS[fmt]
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response.make_conditional(request)
+
+def get_attendance_url():
+    """Absolute URL of the attendance form for the current request's domain"""
     # Use the current request's domain (works for both local and deployed)
     base_url = request.url_root.rstrip('/')
-    attendance_url = f"{base_url}{url_for('attendance_form')}"
-    
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(attendance_url)
-    qr.make(fit=True)
-
-    # Create QR code image
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to bytes
-    img_io = io.BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
-    
-    from flask import send_file
-    return send_file(img_io, mimetype='image/png')
+    return f"{base_url}{url_for('attendance_form')}"
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points in meters"""
-    point1 = (lat1, lon1)
-    point2 = (lat2, lon2)
-    return geodesic(point1, point2).meters
+    return geofence.geodesic_meters(lat1, lon1, lat2, lon2)
+
+def save_attendance(record, person):
+    """Persist a new attendance row and upsert its person using the configured ingestion mode"""
+    if app.config['INGEST_MODE'] == 'batched':
+        # Hand our pooled connection back while the flusher commits the batch
+        db.session.close()
+        ingest_queue.submit(record, person)
+    else:
+        record.person_id = people.upsert(person)
+        db.session.add(record)
+        counters.record_added([record])
+        db.session.commit()
+    live_feed.notify()
 
 def get_active_meeting_location():
-    """Get the currently active meeting location"""
-    return MeetingLocation.query.filter_by(is_active=True).first()
+    """Get the currently active meeting location (cached, read-only)"""
+    return active_meeting_cache.location()
 
 def get_active_meeting_session():
-    """Get the currently active meeting session"""
-    return MeetingSession.query.filter_by(is_active=True).first()
+    """Get the currently active meeting session (cached, read-only)"""
+    return active_meeting_cache.session()
 
 def get_last_ended_meeting_session():
     """Get the most recently ended meeting session"""
     return MeetingSession.query.filter_by(is_active=False).order_by(MeetingSession.end_time.desc()).first()
 
-def get_attendance_counts_by_zone():
-    """Get attendance counts by zone for current session"""
-    active_session = get_active_meeting_session()
-    if not active_session:
-        return {}
-    
-    from sqlalchemy import func
-    counts = db.session.query(
-        Attendance.zone, 
-        func.count(Attendance.id).label('count')
-    ).filter(
-        Attendance.meeting_session_id == active_session.id,
-        Attendance.zone.isnot(None),
-        Attendance.zone != ''
-    ).group_by(Attendance.zone).all()
-    
-    return {zone: count for zone, count in counts}
-
-def get_attendance_counts_by_group():
-    """Get attendance counts by group for current session"""
-    active_session = get_active_meeting_session()
-    if not active_session:
-        return {}
-    
-    from sqlalchemy import func
-    counts = db.session.query(
-        Attendance.group_name, 
-        func.count(Attendance.id).label('count')
-    ).filter(
-        Attendance.meeting_session_id == active_session.id,
-        Attendance.group_name.isnot(None),
-        Attendance.group_name != ''
-    ).group_by(Attendance.group_name).all()
-    
-    return {group: count for group, count in counts}
-
-def get_attendance_counts_by_category():
-    """Get attendance counts by category for current session"""
-    active_session = get_active_meeting_session()
-    if not active_session:
-        return {}
-    
-    from sqlalchemy import func
-    counts = db.session.query(
-        Attendance.category, 
-        func.count(Attendance.id).label('count')
-    ).filter(
-        Attendance.meeting_session_id == active_session.id,
-        Attendance.category.isnot(None),
-        Attendance.category != ''
-    ).group_by(Attendance.category).all()
-    
-    return {category: count for category, count in counts}
-
 def get_current_attendance_count():
     """Get the count of attendees for the current (non-archived) session"""
-    return Attendance.query.filter_by(is_archived=False).count()
+    active_session = get_active_meeting_session()
+    return counters.session_total(active_session.id if active_session else None)
 
 def start_new_meeting_session(meeting_name, location_id):
-    """Start a new meeting session"""
-    # End any existing active sessions
-    MeetingSession.query.filter_by(is_active=True).update({'is_active': False})
+    """Start a new meeting session, ending the one under way first"""
+    # Ended as the End Meeting button does, not just switched off: sign-ins
+    # left in the live table would later be archived under the next meeting's
+    # id, and a session without an end_time is never rolled up or offloaded
+    ended = False
+    while end_current_meeting_session():
+        ended = True
+    if ended and app.config['ARCHIVE_RETENTION_DAYS']:
+        offload_old_meetings()
     
     # Create new session
     new_session = MeetingSession(
@@ -332,29 +476,55 @@ def start_new_meeting_session(meeting_name, location_id):
     )
     db.session.add(new_session)
     db.session.commit()
+    active_meeting_cache.invalidate()
+    duplicate_index.warm(new_session)
     return new_session
 
 def end_current_meeting_session():
     """End the current meeting and archive its attendance"""
     from datetime import datetime
     
-    # Get current session
-    current_session = get_active_meeting_session()
+    # Get current session (from the database, since we are going to modify it)
+    current_session = MeetingSession.query.filter_by(is_active=True).first()
     if not current_session:
         return False
     
-    # Archive all current attendance records
-    current_attendees = Attendance.query.filter_by(is_archived=False).all()
-    for attendee in current_attendees:
-        attendee.is_archived = True
-        attendee.meeting_session_id = current_session.id
+    session_id = current_session.id
+    
+    # Unarchived rows left over from other sessions are moved into this one,
+    # so their counters have to be recomputed afterwards (normally none)
+    stray_session_ids = {sid for (sid,) in db.session.query(Attendance.meeting_session_id).filter(
+        Attendance.is_archived == False,
+        or_(Attendance.meeting_session_id != session_id, Attendance.meeting_session_id.is_(None))
+    ).distinct()}
+    
+    # Move all current attendance records into the archive table in chunks;
+    # the last chunk commits together with the session end below
+    archived_count = archive.archive_live_rows(session_id, ARCHIVE_CHUNK_SIZE)
+    
+    if stray_session_ids:
+        for sid in stray_session_ids - {None}:
+            counters.rebuild(sid)
+        counters.rebuild(session_id)
     
     # End the session
     current_session.is_active = False
     current_session.end_time = datetime.now()
-    current_session.attendee_count = len(current_attendees)
+    current_session.attendee_count = archived_count
     
     db.session.commit()
+    active_meeting_cache.invalidate()
+    
+    # Fold the meeting into the cross-meeting analytics. After the commit,
+    # so the next meeting's sign-ins are not held behind the write lock while
+    # this one's rows are read; the meeting has ended either way
+    try:
+        analytics.rollup_session(current_session)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        app.logger.exception('Analytics rollup of meeting %s failed; run flask --app app rebuild-analytics',
+                             session_id)
     return True
 
 @app.route('/location-setup')
@@ -389,9 +559,11 @@ def save_location():
         
         db.session.add(new_location)
         db.session.commit()
+        active_meeting_cache.invalidate()
         
         # Start a new meeting session for this location
         start_new_meeting_session(name, new_location.id)
+        qr_cache.prerender(get_attendance_url())
         
         flash(f'Meeting location "{name}" has been set successfully! Generate QR code below.', 'success')
         return redirect(url_for('admin'))
@@ -421,6 +593,7 @@ def start_meeting():
         try:
             # Start new meeting session
             start_new_meeting_session(meeting_name, active_location.id)
+            qr_cache.prerender(get_attendance_url())
             flash(f'Meeting "{meeting_name}" started successfully!', 'success')
             return redirect(url_for('admin'))
         except Exception as e:
@@ -446,6 +619,8 @@ def end_meeting():
         
         if success:
             flash(f'Meeting "{meeting_name}" has been ended successfully! {attendee_count} attendees archived.', 'success')
+            if app.config['ARCHIVE_RETENTION_DAYS']:
+                offload_old_meetings()
         else:
             flash('Error ending meeting.', 'error')
             
@@ -454,23 +629,45 @@ def end_meeting():
     
     return redirect(url_for('admin'))
 
+def offload_old_meetings():
+    """Move meetings past the retention period into the Parquet archive"""
+    if not parquet_archive.available():
+        # Logged when the app started
+        return
+    try:
+        parquet_archive.offload_due()
+    except Exception:
+        # The meeting has ended either way; the next one retries
+        db.session.rollback()
+        app.logger.exception('Moving old meetings to the Parquet archive failed')
+
 @app.route('/clear-all-records', methods=['POST'])
 @admin_required
 def clear_all_records():
     """Clear all attendance records and meeting sessions - DANGEROUS!"""
     try:
         # Get counts before deletion
-        attendance_count = Attendance.query.count()
+        attendance_count = Attendance.query.count() + ArchivedAttendance.query.count()
+        if MeetingSession.query.filter(MeetingSession.archive_file.isnot(None)).first():
+            attendance_count += parquet_archive.count()
         session_count = MeetingSession.query.count()
         
-        # Delete all attendance records
+        # Delete all attendance records, live and archived
         Attendance.query.delete()
+        ArchivedAttendance.query.delete()
         
-        # Delete all meeting sessions
+        # Delete all meeting sessions, their counters and analytics, and the
+        # registry of people
+        counters.clear()
+        analytics.clear()
+        Person.query.delete()
         MeetingSession.query.delete()
         
         # Commit the changes
         db.session.commit()
+        active_meeting_cache.invalidate()
+        export_jobs.discard()
+        parquet_archive.discard()
         
         flash(f'Successfully cleared all data! Deleted {attendance_count} attendance records and {session_count} meeting sessions.', 'success')
         
@@ -483,43 +680,67 @@ def clear_all_records():
 @app.route('/archived-records')
 @admin_required
 def archived_records():
-    """View all archived meeting sessions and their attendance records"""
-    # Get all ended meeting sessions (archived)
-    archived_sessions = MeetingSession.query.filter_by(is_active=False).order_by(MeetingSession.end_time.desc()).all()
+    """View archived meeting sessions, newest first, a page at a time"""
+    query = MeetingSession.query.filter_by(is_active=False)
+    
+    # Keyset pagination: the cursor is the id of the last session shown
+    cursor = request.args.get('after')
+    if cursor:
+        try:
+            (last_id,) = decode_cursor(cursor, int)
+        except ValueError:
+            return redirect(url_for('archived_records'))
+        query = query.filter(MeetingSession.id < last_id)
+    
+    page = query.order_by(MeetingSession.id.desc()).limit(ARCHIVE_SESSIONS_PER_PAGE + 1).all()
+    archived_sessions = page[:ARCHIVE_SESSIONS_PER_PAGE]
+    next_cursor = encode_cursor(archived_sessions[-1].id) if len(page) > ARCHIVE_SESSIONS_PER_PAGE else None
     
-    # Get summary stats for each session
+    # Summary stats for every session on the page in one counter query
+    all_counts = counters.sessions_counts([s.id for s in archived_sessions])
     session_data = []
     for session in archived_sessions:
-        attendee_records = Attendance.query.filter_by(meeting_session_id=session.id).all()
-        
-        # Count by organizational structure
-        zone_counts = {}
-        group_counts = {}
-        category_counts = {}
-        
-        for attendee in attendee_records:
-            # Count zones
-            if attendee.zone:
-                zone_counts[attendee.zone] = zone_counts.get(attendee.zone, 0) + 1
-            
-            # Count groups
-            if attendee.group_name:
-                group_counts[attendee.group_name] = group_counts.get(attendee.group_name, 0) + 1
-            
-            # Count categories
-            if attendee.category:
-                category_counts[attendee.category] = category_counts.get(attendee.category, 0) + 1
-        
+        counts = all_counts[session.id]
         session_data.append({
             'session': session,
-            'attendees': attendee_records,
-            'total_count': len(attendee_records),
-            'zone_counts': zone_counts,
-            'group_counts': group_counts,
-            'category_counts': category_counts
+            'total_count': counts[counters.TOTAL],
+            'zone_counts': counts['zone'],
+            'group_counts': counts['group'],
+            'category_counts': counts['category']
         })
     
-    return render_template('archived_records.html', session_data=session_data)
+    return render_template('archived_records.html', session_data=session_data,
+                           next_cursor=next_cursor, is_first_page=not cursor)
+
+ANALYTICS_WINDOWS = [(90, 'Last 3 months'), (180, 'Last 6 months'), (365, 'Last year'), (730, 'Last 2 years'), (0, 'All time')]
+
+def analytics_options():
+    """Window, granularity and trend dimension from the query string, with defaults"""
+    days = request.args.get('days', 365, type=int)
+    if days not in [d for d, _ in ANALYTICS_WINDOWS]:
+        days = 365
+    freq = request.args.get('freq', 'week')
+    if freq not in analytics.FREQUENCIES:
+        freq = 'week'
+    dimension = request.args.get('dimension', 'zone')
+    if dimension not in ('zone', 'group', 'category'):
+        dimension = 'zone'
+    return days, freq, dimension
+
+@app.route('/analytics')
+@admin_required
+def analytics_page():
+    """Attendance trends, first-timers, retention and top churches across meetings"""
+    days, freq, dimension = analytics_options()
+    return render_template('analytics.html', report=analytics.report(days, freq, dimension),
+                           days=days, freq=freq, dimension=dimension, windows=ANALYTICS_WINDOWS)
+
+@app.route('/api/analytics')
+@api_admin_required
+def api_analytics():
+    """The analytics page's figures as JSON"""
+    days, freq, dimension = analytics_options()
+    return jsonify(analytics.report(days, freq, dimension))
 
 @app.route('/download-archived-data/<format>')
 @admin_required
@@ -529,76 +750,13 @@ def download_archived_data(format):
         flash('Invalid download format. Please choose CSV or Excel.', 'error')
         return redirect(url_for('archived_records'))
     
-    # Get all ended meeting sessions and their attendance data
-    archived_sessions = MeetingSession.query.filter_by(is_active=False).order_by(MeetingSession.end_time.desc()).all()
-    
-    # Prepare data for export
-    export_data = []
-    for session in archived_sessions:
-        attendees = Attendance.query.filter_by(meeting_session_id=session.id).all()
-        
-        for attendee in attendees:
-            export_data.append({
-                'Meeting Name': session.meeting_name,
-                'Meeting Date': session.start_time.strftime('%Y-%m-%d') if session.start_time else 'N/A',
-                'Meeting Start Time': session.start_time.strftime('%H:%M:%S') if session.start_time else 'N/A',
-                'Meeting End Time': session.end_time.strftime('%H:%M:%S') if session.end_time else 'N/A',
-                'Attendee Name': f"{attendee.firstname} {attendee.lastname} {attendee.surname}".strip(),
-                'Email': attendee.email,
-                'Phone': attendee.phone,
-                'Zone': attendee.zone or 'Not Specified',
-                'Group': attendee.group_name or 'Not Specified',
-                'Church': attendee.church or 'Not Specified',
-                'Category': attendee.category or 'Not Specified',
-                'Registration Time': attendee.timestamp.strftime('%Y-%m-%d %H:%M:%S') if attendee.timestamp else 'N/A',
-                'Location': f"{attendee.latitude}, {attendee.longitude}" if attendee.latitude and attendee.longitude else 'Not Available'
-            })
-    
-    if not export_data:
+    # All ended meeting sessions joined to their attendance in one query
+    archived_sessions = MeetingSession.query.filter_by(is_active=False).order_by(MeetingSession.end_time.desc(), MeetingSession.id.desc()).all()
+    if not exports.has_rows(exports.export_statement(), archived_sessions):
         flash('No archived data available for download.', 'warning')
         return redirect(url_for('archived_records'))
     
-    # Create DataFrame
-    df = pd.DataFrame(export_data)
-    
-    # Generate filename with current timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    if format == 'csv':
-        # Create temporary CSV file
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp_file:
-            df.to_csv(tmp_file, index=False)
-            temp_filename = tmp_file.name
-        
-        filename = f'attendance_archive_{timestamp}.csv'
-        mimetype = 'text/csv'
-        
-    else:  # excel format
-        # Create temporary Excel file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_file:
-            df.to_excel(tmp_file.name, index=False, engine='openpyxl')
-            temp_filename = tmp_file.name
-        
-        filename = f'attendance_archive_{timestamp}.xlsx'
-        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    def remove_temp_file():
-        try:
-            os.unlink(temp_filename)
-        except:
-            pass
-    
-    # Schedule temp file cleanup after response
-    response = make_response(send_file(temp_filename, mimetype=mimetype, as_attachment=True, download_name=filename))
-    
-    # Clean up temp file in background (this is a simple approach)
-    # In production, you might want a more robust cleanup mechanism
-    try:
-        os.unlink(temp_filename)
-    except:
-        pass  # File might already be deleted
-    
-    return response
+    return start_export(format, archived_sessions, None, export_label())
 
 @app.route('/download-single-session/<int:session_id>/<format>')
 @admin_required
@@ -610,65 +768,107 @@ def download_single_session(session_id, format):
     
     # Get the specific session
     session_data = MeetingSession.query.get_or_404(session_id)
-    attendees = Attendance.query.filter_by(meeting_session_id=session_id).all()
     
-    if not attendees:
+    if not exports.has_rows(exports.export_statement(session_id), [session_data]):
         flash('No attendance data found for this session.', 'warning')
         return redirect(url_for('archived_records'))
     
-    # Prepare data for export
-    export_data = []
-    for attendee in attendees:
-        export_data.append({
-            'Meeting Name': session_data.meeting_name,
-            'Meeting Date': session_data.start_time.strftime('%Y-%m-%d') if session_data.start_time else 'N/A',
-            'Meeting Start Time': session_data.start_time.strftime('%H:%M:%S') if session_data.start_time else 'N/A',
-            'Meeting End Time': session_data.end_time.strftime('%H:%M:%S') if session_data.end_time else 'N/A',
-            'Attendee Name': f"{attendee.firstname} {attendee.lastname} {attendee.surname}".strip(),
-            'Email': attendee.email,
-            'Phone': attendee.phone,
-            'Zone': attendee.zone or 'Not Specified',
-            'Group': attendee.group_name or 'Not Specified',
-            'Church': attendee.church or 'Not Specified',
-            'Category': attendee.category or 'Not Specified',
-            'Registration Time': attendee.timestamp.strftime('%Y-%m-%d %H:%M:%S') if attendee.timestamp else 'N/A',
-            'Location': f"{attendee.latitude}, {attendee.longitude}" if attendee.latitude and attendee.longitude else 'Not Available'
-        })
-    
-    # Create DataFrame
-    df = pd.DataFrame(export_data)
-    
-    # Generate filename with session name and timestamp
-    safe_session_name = "".join(c for c in session_data.meeting_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    return start_export(format, [session_data], session_id, export_label(session_data))
+
+def export_label(meeting_session=None):
+    """How an export's file name starts: the session name, or the archive's"""
+    if meeting_session is None:
+        return 'attendance_archive'
+    safe_session_name = "".join(c for c in meeting_session.meeting_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    return f'{safe_session_name}_attendance'
+
+def start_export(format, sessions, session_id, label):
+    """Send a cached export straight away, or start building it and show its progress"""
+    if format == 'csv' and app.config['EXPORT_MODE'] == 'inline':
+        return stream_csv_download(exports.export_statement(session_id), sessions, label)
+    state = export_jobs.submit(format, sessions, session_id, label)
+    if state['status'] == 'done':
+        return send_export(state)
+    if state['status'] == 'failed':
+        flash(f"Error preparing the download: {state['error']}", 'error')
+        return redirect(url_for('archived_records'))
+    return redirect(url_for('export_progress', job_id=state['id']))
+
+def stream_csv_download(stmt, sessions, label):
+    """Stream export rows to the client as CSV while they are read"""
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    
-    if format == 'csv':
-        # Create temporary CSV file
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', newline='', encoding='utf-8') as tmp_file:
-            df.to_csv(tmp_file, index=False)
-            temp_filename = tmp_file.name
-        
-        filename = f'{safe_session_name}_attendance_{timestamp}.csv'
-        mimetype = 'text/csv'
-        
-    else:  # excel format
-        # Create temporary Excel file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp_file:
-            df.to_excel(tmp_file.name, index=False, engine='openpyxl')
-            temp_filename = tmp_file.name
-        
-        filename = f'{safe_session_name}_attendance_{timestamp}.xlsx'
-        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    
-    # Schedule temp file cleanup after response
-    response = make_response(send_file(temp_filename, mimetype=mimetype, as_attachment=True, download_name=filename))
-    
-    # Clean up temp file
-    try:
-        os.unlink(temp_filename)
-    except:
-        pass
-    
+    response = Response(stream_with_context(exports.iter_csv(exports.iter_rows(stmt, sessions))), mimetype='text/csv')
+    response.headers.set('Content-Disposition', 'attachment', filename=f'{label}_{timestamp}.csv')
+    return response
+
+def send_export(state):
+    """Send a finished export as an attachment, named for when it was downloaded"""
+    path, mimetype = export_jobs.open(state)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    extension = 'csv' if state['format'] == 'csv' else 'xlsx'
+    return send_file(path, mimetype=mimetype, as_attachment=True,
+                     download_name=f"{state['label']}_{timestamp}.{extension}")
+
+def export_job_json(state):
+    """An export job's progress, with its download link once it is ready"""
+    data = export_jobs.describe(state)
+    data['download_url'] = url_for('download_export', job_id=state['id']) if state['status'] == 'done' else None
+    return data
+
+@app.route('/exports/<job_id>')
+@admin_required
+def export_progress(job_id):
+    """Progress page for an export being built; it downloads the file when ready"""
+    state = export_jobs.state(job_id)
+    if state is None:
+        flash('That download has expired. Please start it again.', 'warning')
+        return redirect(url_for('archived_records'))
+    return render_template('export_progress.html', job=export_job_json(state))
+
+@app.route('/exports/<job_id>/download')
+@admin_required
+def download_export(job_id):
+    """The finished file of an export job"""
+    state = export_jobs.state(job_id)
+    if state is None:
+        flash('That download has expired. Please start it again.', 'warning')
+        return redirect(url_for('archived_records'))
+    if state['status'] != 'done':
+        return redirect(url_for('export_progress', job_id=job_id))
+    return send_export(state)
+
+@app.route('/api/exports', methods=['POST'])
+@api_admin_required
+def api_start_export():
+    """Start exporting the archive, or one session, as CSV or Excel; returns the job"""
+    payload = request.get_json(silent=True) or {}
+    format = payload.get('format')
+    if format not in ['csv', 'excel']:
+        return jsonify(error='format must be "csv" or "excel".'), 400
+    session_id = payload.get('session_id')
+    if session_id is None:
+        sessions = MeetingSession.query.filter_by(is_active=False).order_by(MeetingSession.end_time.desc(), MeetingSession.id.desc()).all()
+        label = export_label()
+    else:
+        meeting_session = db.session.get(MeetingSession, session_id) if isinstance(session_id, int) else None
+        if meeting_session is None:
+            return jsonify(error='Meeting session not found.'), 404
+        sessions = [meeting_session]
+        label = export_label(meeting_session)
+    if not exports.has_rows(exports.export_statement(session_id), sessions):
+        return jsonify(error='No archived attendance to export.'), 404
+    state = export_jobs.submit(format, sessions, session_id, label)
+    return jsonify(export_job_json(state)), 200 if state['status'] == 'done' else 202
+
+@app.route('/api/exports/<job_id>')
+@api_admin_required
+def api_export_job(job_id):
+    """Progress of an export job"""
+    state = export_jobs.state(job_id)
+    if state is None:
+        return jsonify(error='Export not found.'), 404
+    response = jsonify(export_job_json(state))
+    response.headers['Cache-Control'] = 'no-store'
     return response
 
 @app.route('/view-live-attendees')
@@ -679,31 +879,229 @@ def view_live_attendees():
     if not active_session:
         flash('No active meeting session found.', 'error')
         return redirect(url_for('admin'))
-    attendees = Attendance.query.filter_by(meeting_session_id=active_session.id, is_archived=False).all()
-    return render_template('live_attendees.html', attendees=attendees, meeting_name=active_session.meeting_name)
+    # Rows are fetched page by page from the attendee API by the page itself
+    return render_template('live_attendees.html', session_id=active_session.id,
+                           meeting_name=active_session.meeting_name,
+                           attendee_total=get_current_attendance_count())
+
+@app.route('/live-stream')
+@admin_required
+def live_stream():
+    """Server-Sent Events of new attendees and updated counts for the active session"""
+    active_session = get_active_meeting_session()
+    if not active_session:
+        return Response('event: ended\ndata: {}\n\n', mimetype='text/event-stream')
+    
+    # EventSource resends the id of the last event it saw when reconnecting
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        cursor = None
+    include_rows = request.args.get('rows', '1') != '0'
+    
+    response = Response(stream_with_context(live_feed.stream(active_session.id, cursor, include_rows)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/sessions')
+@api_admin_required
+def api_sessions():
+    """Meeting sessions newest first, with their attendance counts"""
+    try:
+        limit = attendee_api.parse_limit(request.args.get('limit'))
+        sessions, next_cursor = attendee_api.sessions_page(
+            request.args.get('after'), request.args.get('status'), limit)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(sessions=sessions, next_cursor=next_cursor)
+
+@app.route('/api/sessions/<int:session_id>/attendees')
+@api_admin_required
+def api_session_attendees(session_id):
+    """A session's attendees in sign-in order, a page at a time"""
+    meeting_session = db.session.get(MeetingSession, session_id)
+    if meeting_session is None:
+        return jsonify(error='Meeting session not found.'), 404
+    try:
+        fields = attendee_api.parse_fields(request.args.get('fields'))
+        limit = attendee_api.parse_limit(request.args.get('limit'))
+        page_args = dict(cursor=request.args.get('after'), fields=fields,
+                         filters=attendee_api.parse_filters(request.args), limit=limit)
+        if parquet_archive.offloaded(meeting_session):
+            attendees, next_cursor = attendee_api.archive_page(meeting_session, **page_args)
+        else:
+            attendees, next_cursor = attendee_api.attendee_page(
+                attendee_api.attendee_model(meeting_session), session_id, **page_args)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return jsonify(attendees=attendees, next_cursor=next_cursor)
+
+def run_import(meeting_session, rows):
+    """Import rows into a session and let the live dashboards know"""
+    report = bulk_import.import_rows(meeting_session, rows, app.config['IMPORT_BATCH_SIZE'])
+    if report['imported'] and meeting_session.is_active:
+        live_feed.notify()
+    return report
+
+@app.route('/import-attendance', methods=['GET', 'POST'])
+@admin_required
+def import_attendance():
+    """Upload attendance collected offline (CSV, Excel or JSON) into a meeting"""
+    sessions = MeetingSession.query.order_by(MeetingSession.id.desc()).limit(50).all()
+    report = None
+    selected_id = request.form.get('session_id', type=int)
+    
+    if request.method == 'POST':
+        meeting_session = db.session.get(MeetingSession, selected_id) if selected_id else None
+        upload = request.files.get('file')
+        if meeting_session is None:
+            flash('Please choose the meeting to import into.', 'error')
+        elif not upload or not upload.filename:
+            flash('Please choose a file to import.', 'error')
+        else:
+            try:
+                fmt = bulk_import.detect_format(upload.filename, upload.mimetype)
+                report = run_import(meeting_session, bulk_import.read_rows(upload.stream, fmt))
+            except bulk_import.ImportFileError as e:
+                db.session.rollback()
+                flash(str(e), 'error')
+            else:
+                flash(f"Imported {report['imported']} of {report['total']} rows into {meeting_session.meeting_name}.",
+                      'success' if report['imported'] == report['total'] else 'warning')
+    
+    return render_template('import_attendance.html', sessions=sessions, report=report, selected_id=selected_id)
+
+@app.route('/api/sessions/<int:session_id>/import', methods=['POST'])
+@api_admin_required
+def api_import_attendance(session_id):
+    """Bulk import a file upload or a JSON array of attendees; returns the per-row report"""
+    meeting_session = db.session.get(MeetingSession, session_id)
+    if meeting_session is None:
+        return jsonify(error='Meeting session not found.'), 404
+    try:
+        upload = request.files.get('file')
+        if upload:
+            fmt = bulk_import.detect_format(upload.filename, upload.mimetype)
+            rows = bulk_import.read_rows(upload.stream, fmt)
+        else:
+            rows = bulk_import.read_records(request.get_json(silent=True))
+        report = run_import(meeting_session, rows)
+    except bulk_import.ImportFileError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    return jsonify(report)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics, for a logged-in admin or a scraper sending METRICS_TOKEN"""
+    token = app.config['METRICS_TOKEN']
+    authorized = session.get('admin_logged_in') or (
+        token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'))
+    if not authorized:
+        return Response('Admin access required.\n', status=401, mimetype='text/plain')
+    if not app.config['METRICS_ENABLED']:
+        return Response('Metrics are disabled (METRICS_ENABLED=0).\n', status=404, mimetype='text/plain')
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/clear-meeting-record/<int:session_id>', methods=['POST'])
 @admin_required
 def clear_meeting_record(session_id):
     """Delete a specific meeting session and all its attendance records"""
     try:
-        # Delete attendance records for this session
+        meeting_session = db.session.get(MeetingSession, session_id)
+        archive_file = meeting_session.archive_file if meeting_session else None
+        # Delete attendance records for this session, live and archived
         Attendance.query.filter_by(meeting_session_id=session_id).delete()
+        ArchivedAttendance.query.filter_by(meeting_session_id=session_id).delete()
+        counters.clear(session_id)
+        analytics.clear(session_id)
         # Delete the meeting session itself
         MeetingSession.query.filter_by(id=session_id).delete()
         db.session.commit()
+        active_meeting_cache.invalidate()
+        export_jobs.discard(session_id)
+        if archive_file:
+            parquet_archive.discard(archive_file)
         flash('Meeting and its records deleted successfully.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting meeting record: {str(e)}', 'error')
     return redirect(url_for('archived_records'))
 
+@app.cli.command('migrate-db')
+def migrate_db_command():
+    """Apply pending schema migrations and record the schema version"""
+    applied = migrations.upgrade(log=click.echo)
+    click.echo(f'Database at schema version {migrations.current_version()}'
+               f"{'' if applied else ' (already up to date)'}.")
+
+@app.cli.command('rebuild-counters')
+@click.option('--session-id', type=int, default=None, help='Only check/rebuild this meeting session.')
+@click.option('--verify', 'verify_only', is_flag=True, help='Report mismatches without rewriting the counters.')
+def rebuild_counters_command(session_id, verify_only):
+    """Recompute the attendance rollup counters from the raw rows"""
+    mismatches = counters.verify(session_id)
+    for (sid, dimension, value), (stored, expected) in sorted(mismatches.items()):
+        click.echo(f'session {sid} {dimension} {value!r}: stored {stored}, expected {expected}')
+    if verify_only:
+        click.echo(f'{len(mismatches)} counter(s) out of step.')
+        if mismatches:
+            raise SystemExit(1)
+        return
+    counters.rebuild(session_id)
+    db.session.commit()
+    click.echo(f'Counters rebuilt ({len(mismatches)} corrected).')
+
+@app.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """Recompute the cross-meeting analytics rollups from the archived attendance"""
+    meetings = analytics.rebuild()
+    db.session.commit()
+    click.echo(f'Analytics rebuilt from {meetings} ended meeting(s).')
+
+@app.cli.command('offload-archive')
+@click.option('--days', type=float, default=None, help='Retention period (defaults to ARCHIVE_RETENTION_DAYS).')
+@click.option('--vacuum', is_flag=True, help='Rebuild the SQLite file afterwards to give the space back.')
+def offload_archive_command(days, vacuum):
+    """Move the attendance of meetings past the retention period into Parquet files"""
+    if days is not None:
+        app.config['ARCHIVE_RETENTION_DAYS'] = days
+    if not app.config['ARCHIVE_RETENTION_DAYS']:
+        raise click.ClickException('Set ARCHIVE_RETENTION_DAYS or pass --days.')
+    try:
+        meetings, rows = parquet_archive.offload_due(log=click.echo)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{rows} row(s) from {meetings} meeting(s) moved to {parquet_archive.directory()}.')
+    if vacuum and rows:
+        db.session.remove()
+        # VACUUM cannot run inside a transaction
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.execute(text('VACUUM'))
+        click.echo('Database vacuumed.')
+
+@app.cli.command('audit-geofence')
+@click.option('--session-id', type=int, required=True, help='Meeting session to re-check.')
+def audit_geofence_command(session_id):
+    """Re-check a session's recorded sign-in locations against its meeting radius"""
+    report = geofence.audit_session(session_id)
+    if report is None:
+        raise click.ClickException(f'Session {session_id} not found or has no meeting location.')
+    click.echo(f"{report['checked']} located sign-in(s) checked against {report['radius_meters']}m: "
+               f"{report['inside']} inside, {report['outside']} outside, "
+               f"{report['without_location']} without a location.")
+    if report['outside_ids']:
+        click.echo('Outside: ' + ', '.join(str(i) for i in report['outside_ids']))
+
 if __name__ == '__main__':
     import socket
     with app.app_context():
-        # Create all tables (including new MeetingSession table)
-        db.create_all()
-        print("Database tables created successfully!")
+        # Bring the database up to the latest schema version
+        migrations.upgrade()
+        print(f"Database at schema version {migrations.current_version()}.")
     
     # Get local IP address for remote access
     hostname = socket.gethostname()
@@ -0,0 +1,61 @@
+"""Moves attendance of ended meetings from the live table to the archive.
+
+The live ``attendance`` table only ever holds the current meeting's sign-ins,
+so the sign-in path, live dashboard and counters work on a small table whose
+indexes stay in cache. Ended meetings live in ``archived_attendance``, which
+the archive pages and exports read from.
+"""
+from sqlalchemy import delete, insert, literal, select
+
+from database import db
+from models import ArchivedAttendance, Attendance
+
+# Columns copied verbatim from attendance into archived_attendance
+COPIED_COLUMNS = [
+    'person_id', 'timestamp', 'latitude', 'longitude',
+    'zone', 'group_name', 'church', 'category',
+]
+
+
+def _move(where, session_id=None):
+    """Copy matching live rows into the archive and delete them; returns the count"""
+    if session_id is None:
+        session_column = Attendance.meeting_session_id
+    else:
+        session_column = literal(session_id)
+    source = select(
+        *[getattr(Attendance, name) for name in COPIED_COLUMNS], session_column
+    ).where(*where).order_by(Attendance.id)
+    moved = db.session.execute(
+        insert(ArchivedAttendance).from_select(COPIED_COLUMNS + ['meeting_session_id'], source)
+    ).rowcount
+    db.session.execute(delete(Attendance).where(*where))
+    return moved
+
+
+def archive_live_rows(session_id, chunk_size):
+    """Move every live attendance row into the archive under ``session_id``.
+
+    Rows are moved oldest first, ``chunk_size`` at a time. Full chunks are
+    committed on their own so sign-ins are not locked out for the whole run.
+    The last, partial chunk is left uncommitted so the caller can commit it
+    together with ending the session, and no new row can slip in unarchived.
+    Returns the number of rows moved.
+    """
+    moved = 0
+    while True:
+        boundary = db.session.execute(
+            select(Attendance.id).order_by(Attendance.id).offset(chunk_size - 1).limit(1)
+        ).scalar()
+        if boundary is None:
+            # Fewer than a full chunk left: move the rest in the caller's transaction
+            return moved + _move([Attendance.id.isnot(None)], session_id)
+        moved += _move([Attendance.id <= boundary], session_id)
+        db.session.commit()
+
+
+def migrate_archived_rows():
+    """Move rows archived in place by older versions into the archive table"""
+    if db.session.query(Attendance.id).filter(Attendance.is_archived == True).first() is None:
+        return 0
+    return _move([Attendance.is_archived == True])
@@ -0,0 +1,172 @@
+"""Keyset-paginated attendee and meeting session queries for the JSON API.
+
+Attendee pages are ordered by ``(timestamp, id)`` and continue from the sort
+key of the last row sent (``WHERE (timestamp, id) > (:ts, :id)``), which the
+``(meeting_session_id, timestamp, id)`` indexes answer as a range scan. The
+active meeting is read from the live ``attendance`` table and ended meetings
+from ``archived_attendance``; both have the same columns, and names and
+contacts are joined in from ``person``. Meetings moved to the Parquet archive
+are read from their file and paged in memory (``archive_page``), with the
+same cursors.
+"""
+from sqlalchemy import String, select, tuple_, type_coerce
+
+import counters
+import parquet_archive
+from database import db
+from models import ArchivedAttendance, Attendance, MeetingSession, Person
+from pagination import decode_cursor, encode_cursor, parse_datetime
+
+# Attendee fields the API can return, in output order
+FIELDS = [
+    'id', 'firstname', 'lastname', 'surname', 'email', 'phone',
+    'zone', 'group_name', 'church', 'category', 'timestamp',
+    'latitude', 'longitude', 'meeting_session_id', 'person_id',
+]
+
+# Fields read from the attendee's person row
+PERSON_FIELDS = {'firstname', 'lastname', 'surname', 'email', 'phone'}
+
+# Query parameter -> column filtered on (repeat a parameter to match any value)
+FILTERS = {
+    'zone': 'zone',
+    'group': 'group_name',
+    'category': 'category',
+    'church': 'church',
+}
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+def parse_fields(value):
+    """Turn a comma separated ``fields`` parameter into a list of FIELDS"""
+    if not value:
+        return list(FIELDS)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown) or value}")
+    return fields
+
+
+def parse_limit(value, default=DEFAULT_LIMIT):
+    if value is None or value == '':
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_filters(args):
+    """Collect zone/group/category/church filters from request args"""
+    return {column: args.getlist(param) for param, column in FILTERS.items() if args.getlist(param)}
+
+
+def serialize(row, fields):
+    """JSON-ready dict of ``fields`` from an attendee row or model instance"""
+    data = {}
+    for field in fields:
+        value = getattr(row, field)
+        if field == 'timestamp' and value is not None:
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+
+def attendee_model(session):
+    """Table holding a session's attendees: live while active, archived once ended"""
+    return Attendance if session.is_active else ArchivedAttendance
+
+
+def attendee_select(model, fields=FIELDS):
+    """Select ``fields`` (plus id) of a table's attendees, joined to their person"""
+    columns = [getattr(Person if field in PERSON_FIELDS else model, field)
+               for field in FIELDS if field in fields or field == 'id']
+    return select(*columns).join(Person, Person.id == model.person_id)
+
+
+def attendee_page(model, session_id, cursor=None, fields=FIELDS, filters=None, limit=DEFAULT_LIMIT):
+    """One page of a session's attendees after ``cursor``; returns (rows, next_cursor).
+
+    Raises ValueError for a cursor we did not produce.
+    """
+    # The sort key is read back exactly as stored so the next page's WHERE
+    # compares like with like (SQLite keeps timestamps as text, and
+    # CURRENT_TIMESTAMP defaults have no fractional seconds).
+    sort_ts = type_coerce(model.timestamp, String).label('sort_ts')
+    stmt = attendee_select(model, fields).add_columns(sort_ts).where(model.meeting_session_id == session_id)
+
+    for column, values in (filters or {}).items():
+        stmt = stmt.where(getattr(model, column).in_(values))
+    if cursor:
+        last_ts, last_id = decode_cursor(cursor, str, int)
+        stmt = stmt.where(tuple_(model.timestamp, model.id) > tuple_(type_coerce(last_ts, String), last_id))
+
+    stmt = stmt.order_by(model.timestamp, model.id).limit(limit + 1)
+    rows = db.session.execute(stmt).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].sort_ts, page[-1].id) if len(rows) > limit else None
+    return [serialize(row, fields) for row in page], next_cursor
+
+
+def archive_page(session, cursor=None, fields=FIELDS, filters=None, limit=DEFAULT_LIMIT):
+    """attendee_page for a meeting moved to the Parquet archive; returns (rows, next_cursor).
+
+    Raises ValueError for a cursor we did not produce.
+    """
+    import pandas as pd
+    filters = filters or {}
+    columns = [field for field in FIELDS if field != 'meeting_session_id'
+               and (field in fields or field in filters or field in ('id', 'timestamp'))]
+    frame = parquet_archive.session_frame(session, columns)
+    frame = frame.assign(timestamp=pd.to_datetime(frame['timestamp']), meeting_session_id=session.id)
+
+    for column, values in filters.items():
+        frame = frame[frame[column].isin(values)]
+    if cursor:
+        # Cursors from attendee_page carry the stored text, which parses the same
+        last_ts, last_id = decode_cursor(cursor, parse_datetime, int)
+        frame = frame[(frame['timestamp'] > last_ts) | ((frame['timestamp'] == last_ts) & (frame['id'] > last_id))]
+
+    rows = list(parquet_archive.rows(frame.sort_values(['timestamp', 'id']).head(limit + 1)))
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].timestamp, page[-1].id) if len(rows) > limit else None
+    return [serialize(row, fields) for row in page], next_cursor
+
+
+def session_payload(session, counts):
+    return {
+        'id': session.id,
+        'meeting_name': session.meeting_name,
+        'start_time': session.start_time.isoformat() if session.start_time else None,
+        'end_time': session.end_time.isoformat() if session.end_time else None,
+        'is_active': bool(session.is_active),
+        'attendee_total': counts[counters.TOTAL],
+        'counts': {dimension: counts[dimension] for dimension in counters.DIMENSIONS},
+    }
+
+
+def sessions_page(cursor=None, status=None, limit=DEFAULT_LIMIT):
+    """Meeting sessions newest first; returns (sessions, next_cursor).
+
+    ``status`` is 'active', 'ended' or None for both. Raises ValueError for
+    a bad cursor or status.
+    """
+    query = MeetingSession.query
+    if status == 'active':
+        query = query.filter(MeetingSession.is_active == True)
+    elif status == 'ended':
+        query = query.filter(MeetingSession.is_active == False)
+    elif status:
+        raise ValueError("status must be 'active' or 'ended'")
+    if cursor:
+        (last_id,) = decode_cursor(cursor, int)
+        query = query.filter(MeetingSession.id < last_id)
+
+    rows = query.order_by(MeetingSession.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    next_cursor = encode_cursor(page[-1].id) if len(rows) > limit else None
+    all_counts = counters.sessions_counts([s.id for s in page])
+    return [session_payload(s, all_counts[s.id]) for s in page], next_cursor
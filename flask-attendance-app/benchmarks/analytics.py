@@ -0,0 +1,169 @@
+"""Benchmark the analytics rollups against computing the same figures from raw rows.
+
+Seeds a throwaway SQLite database with ``--years`` of ended meetings
+(``--per-week`` a week, ``--attendees`` each) drawn from a congregation where
+most people come back and some are new each time. It then times:
+
+- ``rollup``: folding one more meeting in, as ending a meeting does;
+- each analytics query over all time, read from the rollup tables;
+- ``raw``: first-timers per meeting and top churches computed with pandas
+  straight from ``archived_attendance``, which is what the page would cost
+  without rollups.
+
+    python benchmarks/analytics.py
+    python benchmarks/analytics.py --years 5 --attendees 3000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+ZONES = ['MCA', 'ZONE 1', 'ZONE 2']
+GROUPS = ['VIRTUOUS', 'AUXANO', 'DUNAMIS', 'ZOE', 'KOINONIA', 'AGAPE']
+CATEGORIES = ['Member', 'Leader', 'Volunteer', 'Visitor']
+
+
+def seed(db, models, meetings, attendees, rng):
+    import people as people_module
+    start = datetime.now() - meetings[-1] - timedelta(days=7)
+    churches = [f'Church {n}' for n in range(60)]
+    population = 0
+    regulars = []
+    for n, when in enumerate(meetings):
+        session = models.MeetingSession(meeting_name=f'Meeting {n}', start_time=start + when,
+                                        end_time=start + when + timedelta(hours=2), is_active=False,
+                                        attendee_count=attendees)
+        db.session.add(session)
+        db.session.flush()
+        # About a fifth of each meeting is new; the rest come from earlier ones
+        new = attendees if not regulars else attendees // 5
+        people = list(range(population, population + new))
+        population += new
+        people += rng.sample(regulars, min(attendees - new, len(regulars)))
+        regulars.extend(people[:new])
+        db.session.execute(models.ArchivedAttendance.__table__.insert(), people_module.attach([
+            {
+                'firstname': 'First', 'lastname': 'Last', 'surname': 'Sur', 'phone': f'080{p:08d}',
+                'timestamp': session.start_time, 'zone': ZONES[p % 3], 'group_name': GROUPS[p % 6],
+                'church': churches[int(rng.paretovariate(1.2)) % 60], 'category': CATEGORIES[p % 4],
+                'meeting_session_id': session.id,
+            }
+            for p in people
+        ]))
+    db.session.commit()
+    return population
+
+
+def timed(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 2)
+
+
+def raw_figures(db, models):
+    import pandas as pd
+    from duplicates import normalize_phone
+    rows = db.session.execute(db.select(
+        models.ArchivedAttendance.meeting_session_id, models.Person.phone,
+        models.ArchivedAttendance.church, models.MeetingSession.start_time
+    ).join(models.MeetingSession).join(models.Person)).all()
+    df = pd.DataFrame(rows, columns=['session', 'phone', 'church', 'start'])
+    df['phone'] = df['phone'].map(normalize_phone)
+    df = df.sort_values('start', kind='stable')
+    first = df.groupby('phone')['session'].transform('first')
+    first_timers = (df['session'] == first).groupby(df['session']).sum()
+    churches = df['church'].str.upper().value_counts().head(10)
+    return first_timers, churches
+
+
+def run_one(years, per_week, attendees, repeats):
+    import app as attendance_app
+    import analytics
+    import models
+    import people as people_module
+    db = attendance_app.db
+    rng = random.Random(1)
+
+    meetings = [timedelta(days=7 * week + 3 * n) for week in range(52 * years) for n in range(per_week)]
+    with attendance_app.app.app_context():
+        people = seed(db, models, meetings[:-1], attendees, rng)
+        start = time.perf_counter()
+        analytics.rebuild()
+        db.session.commit()
+        rebuild_seconds = time.perf_counter() - start
+
+        # Ending one more meeting folds it into the rollups
+        seed_last = models.MeetingSession.query.order_by(models.MeetingSession.id.desc()).first()
+        last = models.MeetingSession(meeting_name='Last', start_time=seed_last.start_time + timedelta(days=3),
+                                     is_active=False)
+        db.session.add(last)
+        db.session.flush()
+        db.session.execute(models.ArchivedAttendance.__table__.insert(), people_module.attach([
+            {
+                'firstname': 'First', 'lastname': 'Last', 'surname': 'Sur', 'phone': f'080{p:08d}',
+                'timestamp': last.start_time, 'zone': 'MCA', 'group_name': 'ZOE', 'church': 'Church 1',
+                'category': 'Member', 'meeting_session_id': last.id,
+            }
+            for p in rng.sample(range(people + attendees // 5), attendees)
+        ]))
+        db.session.commit()
+
+        def rollup():
+            analytics.rollup_session(last)
+            db.session.commit()
+
+        result = {
+            'meetings': len(meetings),
+            'attendees_per_meeting': attendees,
+            'people': people,
+            'rebuild_seconds': round(rebuild_seconds, 2),
+            'rollup_ms': timed(rollup, repeats),
+        }
+        for name, fn in [
+            ('summary_ms', lambda: analytics.summary()),
+            ('attendance_weekly_ms', lambda: analytics.attendance_series(freq='week')),
+            ('trend_group_monthly_ms', lambda: analytics.trend('group', freq='month')),
+            ('top_churches_ms', lambda: analytics.top_churches()),
+            ('retention_ms', lambda: analytics.retention()),
+            ('report_ms', lambda: analytics.report(days=0)),
+        ]:
+            result[name] = timed(fn, repeats)
+        result['raw_ms'] = timed(lambda: raw_figures(db, models), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--per-week', type=int, default=2)
+    parser.add_argument('--attendees', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_one(args.years, args.per_week, args.attendees, args.repeats)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        cmd = [sys.executable, __file__, '--worker', '--years', str(args.years), '--per-week', str(args.per_week),
+               '--attendees', str(args.attendees), '--repeats', str(args.repeats)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env, cwd=tmp)
+    print(out.stdout.strip().splitlines()[-1], flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Benchmark the Parquet archive tier: offload time, disk use and archive reads.
+
+Seeds a throwaway database with ``--sessions`` meetings of ``--attendees``
+each (the last one running), then times the reads that scan archived
+attendance with every ended meeting in SQLite, moves them all into Parquet
+files (``--compression``) and times the same reads again:
+
+- a CSV export of the whole archive, built straight from the rows;
+- ``counters.compute()``, what ``verify-counters`` and ``rebuild-counters`` run;
+- ``analytics.rebuild()``;
+- every page of one ended meeting from the attendee API.
+
+It also reports the offload time and the SQLite file size before and after
+(vacuumed) against the total size of the Parquet files. Needs pyarrow.
+
+    python benchmarks/archive_tier.py
+    python benchmarks/archive_tier.py --sessions 50 --attendees 10000 --compression snappy
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def mb(size):
+    return round(size / 2 ** 20, 2)
+
+
+def timed(fn):
+    began = time.perf_counter()
+    fn()
+    return round((time.perf_counter() - began) * 1000, 1)
+
+
+def reads(app, client, session_id):
+    import analytics
+    import counters
+    import exports
+    from database import db
+    from models import MeetingSession
+
+    def export_csv():
+        with app.app_context():
+            sessions = MeetingSession.query.filter_by(is_active=False).order_by(
+                MeetingSession.end_time.desc(), MeetingSession.id.desc()).all()
+            for _ in exports.iter_csv(exports.iter_rows(exports.export_statement(), sessions)):
+                pass
+
+    def compute_counters():
+        with app.app_context():
+            counters.compute()
+
+    def rebuild_analytics():
+        with app.app_context():
+            analytics.rebuild()
+            db.session.commit()
+
+    def api_pages():
+        cursor = None
+        while True:
+            page = client.get(f'/api/sessions/{session_id}/attendees?limit=500'
+                              + (f'&after={cursor}' if cursor else '')).get_json()
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+    return {
+        'export_csv_ms': timed(export_csv),
+        'counters_compute_ms': timed(compute_counters),
+        'analytics_rebuild_ms': timed(rebuild_analytics),
+        'api_pages_ms': timed(api_pages),
+    }
+
+
+def run(args, db_path):
+    import parquet_archive
+    import suite
+    from sqlalchemy import text
+    from app import app
+    from database import db
+
+    with app.app_context():
+        suite.seed(args.sessions, args.attendees, random.Random(1))
+        db.session.remove()
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['admin_logged_in'] = True
+
+    result = {'sessions': args.sessions, 'attendees': args.attendees, 'compression': args.compression}
+    result['sqlite'] = reads(app, client, 1)
+    result['sqlite_mb'] = mb(os.path.getsize(db_path))
+
+    app.config['ARCHIVE_RETENTION_DAYS'] = 1
+    app.config['ARCHIVE_COMPRESSION'] = args.compression
+    with app.app_context():
+        began = time.perf_counter()
+        meetings, rows = parquet_archive.offload_due()
+        result['offload_ms'] = round((time.perf_counter() - began) * 1000, 1)
+        result['offloaded_meetings'] = meetings
+        result['offloaded_rows'] = rows
+        directory = parquet_archive.directory()
+        db.session.remove()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            began = time.perf_counter()
+            connection.execute(text('VACUUM'))
+            result['vacuum_ms'] = round((time.perf_counter() - began) * 1000, 1)
+    result['sqlite_vacuumed_mb'] = mb(os.path.getsize(db_path))
+    result['parquet_mb'] = mb(sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)))
+    result['parquet'] = reads(app, client, 1)
+    print(json.dumps(result), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--attendees', type=int, default=5000)
+    parser.add_argument('--compression', default='zstd')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run(args, args.worker)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'archive.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', ARCHIVE_DIR=os.path.join(tmp, 'archive'),
+                   EXPORT_DIR=os.path.join(tmp, 'exports'), METRICS_ENABLED='0')
+        subprocess.run([sys.executable, __file__, '--worker', db_path] + sys.argv[1:],
+                       check=True, env=env, cwd=tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark a bulk attendance import at different batch sizes.
+
+Writes a CSV of ``--rows`` attendees (with ``--duplicate-rate`` of them
+repeating an earlier phone number, as when two sheets overlap), starts a
+meeting in a throwaway SQLite database and imports the file through the
+``/api/sessions/<id>/import`` upload. Each batch size runs in a fresh subprocess.
+
+    python benchmarks/bulk_import.py
+    python benchmarks/bulk_import.py --rows 50000 --batch-sizes 1,100,1000,5000
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+HEADER = ['First Name', 'Last Name', 'Surname', 'Email', 'Phone Number', 'Zone', 'Group', 'Church', 'Category']
+
+
+def sheet(rows, duplicate_rate, seed):
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER)
+    for n in range(rows):
+        person = rng.randrange(n) if n and rng.random() < duplicate_rate else n
+        writer.writerow(['First', 'Last', str(person), f'person{person}@example.com', f'080{person:08d}',
+                         'MCA', 'WUSE', 'Church', 'Member'])
+    return out.getvalue().encode()
+
+
+def worker(args):
+    from app import app
+
+    data = sheet(args.rows, args.duplicate_rate, args.seed)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    client.post('/save-location', data={'name': 'Import', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'})
+    session_id = client.get('/api/sessions').get_json()['sessions'][0]['id']
+
+    start = time.perf_counter()
+    response = client.post(f'/api/sessions/{session_id}/import', data={'file': (io.BytesIO(data), 'sheet.csv')},
+                           content_type='multipart/form-data')
+    elapsed = time.perf_counter() - start
+    report = response.get_json()
+
+    print(json.dumps({
+        'batch_size': app.config['IMPORT_BATCH_SIZE'],
+        'rows': report['total'],
+        'imported': report['imported'],
+        'duplicates': report['duplicates'],
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(report['total'] / elapsed),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--batch-sizes', default='1,100,1000,5000')
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    for batch_size in args.batch_sizes.split(','):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, IMPORT_BATCH_SIZE=batch_size,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'import.db')}")
+            out = subprocess.run(
+                [sys.executable, __file__, '--worker', '--rows', str(args.rows),
+                 '--duplicate-rate', str(args.duplicate_rate), '--seed', str(args.seed)],
+                cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1], flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark a duplicate-heavy sign-in burst with and without the duplicate index.
+
+Opens a meeting in a throwaway SQLite database, then submits the attendance
+form for ``--people`` people from ``--threads`` threads, each person scanning
+``--repeats`` times on average, in random order. Counts the write
+transactions that reached the attendance table (each takes SQLite's write
+lock) and the ones rolled back on the unique email/phone constraint. Each
+mode runs in a fresh subprocess.
+
+    python benchmarks/duplicate_burst.py
+    python benchmarks/duplicate_burst.py --people 1000 --repeats 3
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+def submissions(people, repeats, seed):
+    rng = random.Random(seed)
+    forms = []
+    for n in range(people):
+        form = {
+            'firstname': 'First', 'lastname': 'Last', 'surname': str(n),
+            'email': f'person{n}@example.com', 'phone': f'080{n:08d}',
+            'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Church', 'category': 'Member',
+        }
+        # One scan each plus on average repeats - 1 more
+        forms.extend([form] * (1 + round(rng.uniform(0, 2 * (repeats - 1)))))
+    rng.shuffle(forms)
+    return forms
+
+
+def worker(args):
+    from sqlalchemy import event
+    from sqlalchemy.exc import IntegrityError
+
+    from app import app
+    from database import db
+
+    stats = {'insert_attempts': 0, 'integrity_rollbacks': 0}
+    lock = threading.Lock()
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO attendance '):
+            with lock:
+                stats['insert_attempts'] += 1
+
+    @event.listens_for(engine, 'handle_error')
+    def count_rollbacks(context):
+        if isinstance(context.sqlalchemy_exception, IntegrityError):
+            with lock:
+                stats['integrity_rollbacks'] += 1
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    client.post('/save-location', data={'name': 'Burst', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'})
+
+    forms = submissions(args.people, args.repeats, args.seed)
+
+    def submit(form):
+        # A fresh client per submission, like separate phones
+        return app.test_client().post('/submit-attendance', data=form).headers.get('Location', '')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        locations = list(pool.map(submit, forms))
+    elapsed = time.perf_counter() - start
+
+    saved = sum(1 for location in locations if '/success' in location)
+    print(json.dumps({
+        'duplicate_index': app.config['DUPLICATE_INDEX'],
+        'people': args.people,
+        'submissions': len(forms),
+        'saved': saved,
+        'turned_away': len(forms) - saved,
+        'insert_attempts': stats['insert_attempts'],
+        'integrity_rollbacks': stats['integrity_rollbacks'],
+        'seconds': round(elapsed, 2),
+        'ms_per_submission': round(elapsed / len(forms) * 1000, 2),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=500)
+    parser.add_argument('--repeats', type=float, default=2.0, help='average scans per person')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    for enabled in ('0', '1'):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DUPLICATE_INDEX=enabled,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'burst.db')}")
+            out = subprocess.run(
+                [sys.executable, __file__, '--worker', '--people', str(args.people),
+                 '--repeats', str(args.repeats), '--threads', str(args.threads), '--seed', str(args.seed)],
+                cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1], flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark ending a meeting: archive time and memory growth.
+
+Seeds a throwaway SQLite database with one active session of N attendees,
+then times end_current_meeting_session(). Each size runs in a fresh
+subprocess so peak RSS is measured per run. ``--legacy`` runs the original
+load-every-row-and-flush approach (flagging rows in place) for comparison.
+
+    python benchmarks/end_meeting.py
+    python benchmarks/end_meeting.py --sizes 50000 --legacy
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed(db, models, attendees):
+    import people
+    location = models.MeetingLocation(name='Hall', latitude=9.0, longitude=7.4, radius_meters=30)
+    db.session.add(location)
+    db.session.flush()
+    session = models.MeetingSession(meeting_name='Benchmark', location_id=location.id, is_active=True)
+    db.session.add(session)
+    db.session.flush()
+    # Insert in slices so seeding does not set the peak RSS we measure
+    for offset in range(0, attendees, 5000):
+        db.session.execute(models.Attendance.__table__.insert(), people.attach([
+            {
+                'firstname': 'First', 'lastname': 'Last', 'surname': 'Sur',
+                'email': f'person{i}@example.com', 'phone': f'080{i:08d}',
+                'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Church', 'category': 'Member',
+                'meeting_session_id': session.id, 'is_archived': False,
+            }
+            for i in range(offset, min(offset + 5000, attendees))
+        ]))
+    db.session.commit()
+
+
+def legacy_end(db, models):
+    from datetime import datetime
+    current_session = models.MeetingSession.query.filter_by(is_active=True).first()
+    current_attendees = models.Attendance.query.filter_by(is_archived=False).all()
+    for attendee in current_attendees:
+        attendee.is_archived = True
+        attendee.meeting_session_id = current_session.id
+    current_session.is_active = False
+    current_session.end_time = datetime.now()
+    current_session.attendee_count = len(current_attendees)
+    db.session.commit()
+
+
+def run_one(attendees, legacy):
+    import app as attendance_app
+    import models
+    db = attendance_app.db
+
+    with attendance_app.app.app_context():
+        seed(db, models, attendees)
+        db.session.remove()
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+        if legacy:
+            legacy_end(db, models)
+        else:
+            attendance_app.end_current_meeting_session()
+        elapsed = time.perf_counter() - start
+        archived = models.MeetingSession.query.filter_by(is_active=False).first().attendee_count
+
+    return {
+        'mode': 'legacy' if legacy else 'set-based',
+        'attendees': attendees,
+        'archived': archived,
+        'seconds': round(elapsed, 3),
+        'peak_rss_growth_mb': round(peak_rss_mb() - baseline, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='5000,50000')
+    parser.add_argument('--legacy', action='store_true')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_one(args.single, args.legacy)))
+        return
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            cmd = [sys.executable, __file__, '--single', str(size)] + (['--legacy'] if args.legacy else [])
+            out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env, cwd=tmp)
+        print(out.stdout.strip().splitlines()[-1], flush=True)
+
+
+if __name__ == '__main__':
+    main()
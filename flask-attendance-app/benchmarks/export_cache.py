@@ -0,0 +1,112 @@
+"""Benchmark archive exports: request time, build time and cached downloads.
+
+Seeds a throwaway database with ``--sessions`` meetings of ``--attendees``
+each (the last one running), then for each format downloads the whole
+archive three ways through the Flask test client:
+
+- ``inline``: EXPORT_MODE=inline streams CSV, or builds the Excel file,
+  inside the request, which is how long a worker is held (and what
+  gunicorn's timeout has to cover);
+- ``background``: the request that starts the job, and how long the job
+  takes until its file is ready, polling the progress API;
+- ``cached``: ``--repeats`` repeat downloads of the unchanged archive.
+
+    python benchmarks/export_cache.py
+    python benchmarks/export_cache.py --sessions 30 --attendees 10000 --formats excel
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed_get(client, path):
+    began = time.perf_counter()
+    response = client.get(path)
+    size = len(response.get_data())
+    return (time.perf_counter() - began) * 1000, response, size
+
+
+def run(args):
+    import suite
+    from app import app
+    from database import db
+    from export_jobs import export_jobs
+
+    with app.app_context():
+        suite.seed(args.sessions, args.attendees, random.Random(1))
+        db.session.remove()
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['admin_logged_in'] = True
+
+    for fmt in args.formats.split(','):
+        path = f'/download-archived-data/{fmt}'
+        result = {'format': fmt, 'sessions': args.sessions, 'attendees': args.attendees}
+
+        export_jobs.discard()
+        app.config['EXPORT_MODE'] = 'inline'
+        ms, response, size = timed_get(client, path)
+        assert response.status_code == 200, response.status_code
+        result['inline_request_ms'] = round(ms, 1)
+        result['mb'] = round(size / 2 ** 20, 2)
+
+        export_jobs.discard()
+        app.config['EXPORT_MODE'] = 'background'
+        began = time.perf_counter()
+        ms, response, _ = timed_get(client, path)
+        assert response.status_code == 302, response.status_code
+        result['background_request_ms'] = round(ms, 1)
+        job_id = response.location.rstrip('/').rsplit('/', 1)[-1]
+        polls = 0
+        while True:
+            job = client.get(f'/api/exports/{job_id}').get_json()
+            polls += 1
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        assert job['status'] == 'done', job['error']
+        # Includes starting the pool process and importing the app in it
+        result['background_ready_ms'] = round((time.perf_counter() - began) * 1000, 1)
+        result['progress_polls'] = polls
+
+        times = []
+        for _ in range(args.repeats):
+            ms, response, _ = timed_get(client, path)
+            assert response.status_code == 200, response.status_code
+            times.append(ms)
+        result['cached_p50_ms'] = round(statistics.median(times), 1)
+        result['cached_max_ms'] = round(max(times), 1)
+        print(json.dumps(result), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--attendees', type=int, default=5000)
+    parser.add_argument('--formats', default='csv,excel')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'exports.db')}",
+                   EXPORT_DIR=os.path.join(tmp, 'exports'), METRICS_ENABLED='0')
+        subprocess.run([sys.executable, __file__, '--worker'] + sys.argv[1:], check=True, env=env, cwd=tmp)
+
+
+if __name__ == '__main__':
+    main()
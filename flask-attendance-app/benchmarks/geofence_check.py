@@ -0,0 +1,92 @@
+"""Benchmark the geofence check against geopy's geodesic.
+
+For a range of latitudes and meeting radii, places random points around the
+fence (at up to 3x the radius, exact distances via geopy) and reports the
+worst difference between the fast distance and geopy's, how many
+accept/reject decisions differ, and the cost per check of ``contains``,
+of ``check_many`` on a batch, and of a plain geodesic solve.
+
+    python benchmarks/geofence_check.py
+    python benchmarks/geofence_check.py --points 2000 --radii 30,100,1000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from geopy.distance import geodesic  # noqa: E402
+
+from geofence import Geofence, geodesic_meters  # noqa: E402
+
+LATITUDES = [0.0, 9.07, 45.0, 70.0, -33.9]
+
+
+def sample(fence, points, rng):
+    """Random (lat, lon, exact distance) points up to 3x the radius from the centre"""
+    out = []
+    for _ in range(points):
+        point = geodesic(meters=rng.uniform(0, 3 * fence.radius)).destination(
+            (fence.latitude, fence.longitude), rng.uniform(0, 360))
+        exact = geodesic_meters(fence.latitude, fence.longitude, point.latitude, point.longitude)
+        out.append((point.latitude, point.longitude, exact))
+    return out
+
+
+def run(radius, points, rng):
+    worst = 0.0
+    mismatches = 0
+    fences = [Geofence(lat, 7.4, radius) for lat in LATITUDES]
+    fences = [(fence, sample(fence, points, rng)) for fence in fences]
+    for fence, pts in fences:
+        for lat, lon, exact in pts:
+            worst = max(worst, abs(fence.fast_distance(lat, lon) - exact))
+            if fence.contains(lat, lon) != (exact <= radius):
+                mismatches += 1
+
+    fence, pts = fences[1]
+    lats = [p[0] for p in pts]
+    lons = [p[1] for p in pts]
+    start = time.perf_counter()
+    for lat, lon in zip(lats, lons):
+        fence.contains(lat, lon)
+    contains_us = (time.perf_counter() - start) / len(pts) * 1e6
+
+    start = time.perf_counter()
+    fence.check_many(lats, lons)
+    batch_us = (time.perf_counter() - start) / len(pts) * 1e6
+
+    start = time.perf_counter()
+    for lat, lon in zip(lats, lons):
+        geodesic_meters(fence.latitude, fence.longitude, lat, lon)
+    geodesic_us = (time.perf_counter() - start) / len(pts) * 1e6
+
+    return {
+        'radius_meters': radius,
+        'points': points * len(LATITUDES),
+        'max_error_meters': round(worst, 4),
+        'decision_mismatches': mismatches,
+        'contains_us': round(contains_us, 2),
+        'check_many_us': round(batch_us, 2),
+        'geodesic_us': round(geodesic_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--radii', default='10,30,100,1000')
+    parser.add_argument('--points', type=int, default=1000, help='points per latitude')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for radius in (int(r) for r in args.radii.split(',')):
+        print(json.dumps(run(radius, args.points, rng)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
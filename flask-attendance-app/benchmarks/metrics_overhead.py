@@ -0,0 +1,81 @@
+"""Benchmark the cost of request metrics: the same requests with them off and on.
+
+Seeds a meeting with ``--attendees`` sign-ins and times requests to a few
+routes through the test client (best of ``--rounds`` rounds of ``--requests``,
+which filters out noise from the rest of the machine), with METRICS_ENABLED=0 and
+=1 (and, with ``--slow-log``, with SLOW_REQUEST_MS=1 so every statement is
+tracked for the slow log). Each mode runs in a fresh subprocess.
+
+    python benchmarks/metrics_overhead.py
+    python benchmarks/metrics_overhead.py --rounds 50 --slow-log
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+ROUTES = ['/about', '/api/sessions', '/admin', '/api/sessions/1/attendees?limit=100']
+
+
+def worker(args):
+    from app import app
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    client.post('/save-location', data={'name': 'Overhead', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'})
+    for n in range(args.attendees):
+        client.post('/submit-attendance', data={
+            'firstname': 'First', 'lastname': 'Last', 'surname': str(n), 'phone': f'080{n:08d}',
+            'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Church', 'category': 'Member'})
+
+    result = {'metrics': app.config['METRICS_ENABLED'], 'slow_log': app.config['SLOW_REQUEST_MS'] > 0}
+    app.logger.disabled = True
+    for route in ROUTES:
+        for _ in range(20):
+            client.get(route)
+        best = float('inf')
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.get(route)
+            best = min(best, (time.perf_counter() - start) / args.requests)
+        result[route] = round(best * 1e6, 1)
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100, help='requests per round')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--attendees', type=int, default=200)
+    parser.add_argument('--slow-log', action='store_true')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    modes = [{'METRICS_ENABLED': '0'}, {'METRICS_ENABLED': '1'}]
+    if args.slow_log:
+        modes.append({'METRICS_ENABLED': '1', 'SLOW_REQUEST_MS': '1'})
+    print(json.dumps({'unit': 'microseconds per request'}))
+    for mode in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'overhead.db')}", **mode)
+            out = subprocess.run(
+                [sys.executable, __file__, '--worker', '--requests', str(args.requests), '--rounds', str(args.rounds),
+                 '--attendees', str(args.attendees)],
+                cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1], flush=True)
+
+
+if __name__ == '__main__':
+    main()
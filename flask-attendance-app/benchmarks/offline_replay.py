@@ -0,0 +1,118 @@
+"""Benchmark replaying queued offline sign-ins: one form post each vs batches.
+
+Simulates ``--phones`` phones that each queued ``--queued`` sign-ins (plus
+``--duplicate-rate`` of repeats, as when someone scanned twice before giving
+up) while the venue network was down, then replays them all at once from
+``--threads`` threads, either by posting the attendance form once per record
+or through ``/api/attendance/batch`` at each batch size. Each mode runs in a
+fresh subprocess with its own SQLite database.
+
+    python benchmarks/offline_replay.py
+    python benchmarks/offline_replay.py --phones 100 --queued 20 --batch-sizes 10,50
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+def queues(phones, queued, duplicate_rate, session_id, seed):
+    """Per-phone lists of queued records, as the service worker would send them"""
+    rng = random.Random(seed)
+    out = []
+    person = 0
+    for _ in range(phones):
+        records = []
+        for _ in range(queued):
+            n = rng.randrange(person) if person and rng.random() < duplicate_rate else person
+            person += 1
+            records.append({
+                'client_id': len(records) + 1, 'meeting_session_id': session_id,
+                'age_seconds': rng.uniform(0, 60),
+                'firstname': 'First', 'lastname': 'Last', 'surname': str(n),
+                'email': f'person{n}@example.com', 'phone': f'080{n:08d}',
+                'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Church', 'category': 'Member',
+            })
+        out.append(records)
+    return out
+
+
+def worker(args):
+    from app import app
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    client.post('/save-location', data={'name': 'Replay', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'})
+    session_id = client.get('/api/sessions').get_json()['sessions'][0]['id']
+    phones = queues(args.phones, args.queued, args.duplicate_rate, session_id, args.seed)
+
+    def replay_forms(records):
+        phone = app.test_client()
+        for record in records:
+            phone.post('/submit-attendance', data=record)
+        return len(records)
+
+    def replay_batches(records):
+        phone = app.test_client()
+        requests = 0
+        for start in range(0, len(records), args.batch_size):
+            phone.post('/api/attendance/batch', json={'records': records[start:start + args.batch_size]})
+            requests += 1
+        return requests
+
+    replay = replay_forms if args.batch_size == 0 else replay_batches
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        requests = sum(pool.map(replay, phones))
+    elapsed = time.perf_counter() - start
+    total = client.get('/api/sessions').get_json()['sessions'][0]['attendee_total']
+
+    print(json.dumps({
+        'mode': 'form' if args.batch_size == 0 else f'batch-{args.batch_size}',
+        'records': args.phones * args.queued,
+        'saved': total,
+        'requests': requests,
+        'seconds': round(elapsed, 2),
+        'records_per_second': round(args.phones * args.queued / elapsed),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--phones', type=int, default=200)
+    parser.add_argument('--queued', type=int, default=10, help='sign-ins queued per phone')
+    parser.add_argument('--batch-sizes', default='0,10,50', help='0 replays through the form')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    for batch_size in args.batch_sizes.split(','):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'replay.db')}")
+            out = subprocess.run(
+                [sys.executable, __file__, '--worker', '--batch-size', batch_size,
+                 '--phones', str(args.phones), '--queued', str(args.queued),
+                 '--duplicate-rate', str(args.duplicate_rate), '--threads', str(args.threads),
+                 '--seed', str(args.seed)],
+                cwd=APP_DIR, env=env, capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1], flush=True)
+
+
+if __name__ == '__main__':
+    main()
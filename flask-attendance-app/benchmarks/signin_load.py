@@ -0,0 +1,212 @@
+"""Load test: a burst of slow phones submitting attendance at once.
+
+Starts gunicorn with gunicorn.conf.py against a throwaway SQLite database for
+each worker class, opens a meeting through the admin pages, then has
+``--clients`` phones submit the attendance form, arriving evenly over
+``--arrival`` seconds. Each one trickles its request out over ``--slow``
+seconds, like a phone on crowded venue Wi-Fi, and a sync worker that has
+accepted it is stuck until the last byte arrives. Reports how long the burst took, request latency,
+and the mean number of requests in progress at once.
+
+    python benchmarks/signin_load.py
+    python benchmarks/signin_load.py --worker-class sync,gthread,gevent --clients 200 --arrival 5 --slow 1
+"""
+import argparse
+import http.cookiejar
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('gunicorn did not start')
+
+
+def open_meeting(base_url):
+    """Log in as admin and save a location, which starts a meeting; returns the Cookie header"""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(base_url + '/admin-login', urllib.parse.urlencode(
+        {'username': 'admin', 'password': 'attendance123'}).encode())
+    opener.open(base_url + '/save-location', urllib.parse.urlencode(
+        {'name': 'Load Test', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'}).encode())
+    return '; '.join(f'{c.name}={c.value}' for c in jar)
+
+
+def dashboard(port, cookie, stop, retry, counts):
+    """Follow /live-stream like the admin page's EventSource until ``stop`` is set"""
+    request = (
+        f'GET /live-stream?rows=0 HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+        f'Cookie: {cookie}\r\nConnection: close\r\n\r\n'
+    ).encode()
+    while not stop.is_set():
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=120) as sock:
+                sock.sendall(request)
+                sock.settimeout(0.5)
+                while not stop.is_set():
+                    try:
+                        if not sock.recv(4096):
+                            break
+                    except socket.timeout:
+                        continue
+            counts.append(1)
+        except OSError:
+            pass
+        stop.wait(retry)
+
+
+def slow_submit(port, n, delay, slow, start, results):
+    body = urllib.parse.urlencode({
+        'firstname': 'Load', 'lastname': 'Test', 'surname': str(n),
+        'email': f'load{n}@example.com', 'phone': f'070{n:08d}',
+        'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Church', 'category': 'Member',
+    }).encode()
+    request = (
+        f'POST /submit-attendance HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+        f'Content-Type: application/x-www-form-urlencoded\r\n'
+        f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+    ).encode() + body
+    start.wait()
+    time.sleep(delay)
+    began = time.monotonic()
+    status = None
+    sent = None
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=120) as sock:
+            # Trickle the request out in pieces over `slow` seconds
+            pieces = 10
+            step = -(-len(request) // pieces)
+            for i in range(0, len(request), step):
+                sock.sendall(request[i:i + step])
+                time.sleep(slow / pieces)
+            sent = time.monotonic()
+            response = b''
+            while b'\r\n' not in response:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            status = int(response.split(b' ', 2)[1]) if response else None
+    except OSError:
+        pass
+    results.append((status, time.monotonic() - began, time.monotonic() - sent if sent else None))
+
+
+def run(worker_class, clients, arrival, slow, workers, dashboards, live_stream_seconds):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'load.db')}",
+                   GUNICORN_WORKER_CLASS=worker_class,
+                   GUNICORN_WORKERS=str(workers))
+        if live_stream_seconds is not None:
+            env['LIVE_STREAM_SECONDS'] = str(live_stream_seconds)
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', 'app:app'],
+            cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_port(port)
+            cookie = open_meeting(f'http://127.0.0.1:{port}')
+
+            stop = threading.Event()
+            reconnects = []
+            watchers = [threading.Thread(target=dashboard, args=(port, cookie, stop, 3, reconnects))
+                        for _ in range(dashboards)]
+            for t in watchers:
+                t.start()
+            time.sleep(0.5 if dashboards else 0)
+
+            start = threading.Event()
+            results = []
+            threads = [threading.Thread(target=slow_submit, args=(port, n, arrival * n / clients, slow, start, results))
+                       for n in range(clients)]
+            for t in threads:
+                t.start()
+            began = time.monotonic()
+            start.set()
+            for t in threads:
+                t.join()
+            elapsed = time.monotonic() - began
+            stop.set()
+            for t in watchers:
+                t.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(latency for status, latency, wait in results if status == 302)
+    waits = sorted(wait for status, latency, wait in results if status == 302)
+    return {
+        'worker_class': worker_class,
+        'workers': workers,
+        'clients': clients,
+        'dashboards': dashboards,
+        'live_stream_seconds': live_stream_seconds,
+        'dashboard_connections': len(reconnects),
+        'arrival_seconds': arrival,
+        'slow_seconds': slow,
+        'signed_in': len(latencies),
+        'failed': clients - len(latencies),
+        'burst_seconds': round(elapsed, 2),
+        'p50_seconds': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_seconds': round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else None,
+        # Time from the last byte sent to the response: what the user waits on
+        'wait_p50_seconds': round(statistics.median(waits), 3) if waits else None,
+        'wait_p95_seconds': round(waits[int(len(waits) * 0.95) - 1], 3) if waits else None,
+        # Requests in progress at once, averaged over the burst
+        'mean_concurrency': round(sum(latencies) / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--worker-class', default='sync,gthread,gevent',
+                        help='comma separated gunicorn worker classes to compare')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--arrival', type=float, default=5.0, help='seconds over which the clients arrive')
+    parser.add_argument('--slow', type=float, default=1.0, help='seconds each client takes to send its request')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--dashboards', type=int, default=0,
+                        help='live dashboards following /live-stream during the burst')
+    parser.add_argument('--live-stream-seconds', type=float, default=None,
+                        help='override LIVE_STREAM_SECONDS (default: what gunicorn.conf.py picks)')
+    args = parser.parse_args()
+
+    for worker_class in args.worker_class.split(','):
+        if worker_class == 'gevent':
+            # Only checks it is there: gunicorn's gevent worker does its own patching
+            if importlib.util.find_spec('gevent') is None:
+                print(json.dumps({'worker_class': 'gevent', 'skipped': 'gevent is not installed'}), flush=True)
+                continue
+        print(json.dumps(run(worker_class, args.clients, args.arrival, args.slow, args.workers,
+                                    args.dashboards, args.live_stream_seconds)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""Benchmark sign-ins against concurrent dashboard reads for each SQLite profile.
+
+For each ``SQLITE_PROFILE`` it seeds a throwaway database with ``--sessions``
+meetings of ``--attendees`` each (the last one running), then starts
+separate processes, like gunicorn workers sharing one file:
+
+- ``--readers`` processes loop over the dashboard's attendee API and a CSV
+  export of the whole archive, the longest read the app does (built straight
+  from the database each time, bypassing the export cache);
+- ``--writers`` processes each submit ``--signins`` sign-ins through the
+  attendance form as fast as they are accepted, all starting together.
+
+It reports sign-in latency, how many sign-ins took over a second, and how
+many failed with ``database is locked``, plus the readers' throughput.
+
+    python benchmarks/sqlite_contention.py
+    python benchmarks/sqlite_contention.py --profiles default,tuned --readers 8 --writers 4 --signins 100
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+STALL_SECONDS = 1.0
+
+
+def percentile(ordered, p):
+    # Nearest rank
+    return ordered[max(int(round(p / 100 * len(ordered))) - 1, 0)] if ordered else None
+
+
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['admin_logged_in'] = True
+    return client
+
+
+def seed(sessions, attendees):
+    import suite
+    from app import app
+    with app.app_context():
+        suite.seed(sessions, attendees, random.Random(1))
+
+
+def export_archive_csv(app):
+    import exports
+    with app.app_context():
+        for _ in exports.iter_csv(exports.iter_rows(exports.export_statement())):
+            pass
+    return True
+
+
+def read(stop_path):
+    from app import app
+    from meeting_cache import active_meeting_cache
+    client = admin_client(app)
+    with app.app_context():
+        session_id = active_meeting_cache.session().id
+    times, errors = [], 0
+    while not os.path.exists(stop_path):
+        for path in (f'/api/sessions/{session_id}/attendees?limit=500', None):
+            began = time.perf_counter()
+            try:
+                if path is None:
+                    ok = export_archive_csv(app)
+                else:
+                    response = client.get(path)
+                    response.get_data()
+                    ok = response.status_code == 200
+            except Exception:
+                ok = False
+            times.append(time.perf_counter() - began)
+            errors += not ok
+    return {'reads': len(times), 'read_seconds': sum(times), 'read_errors': errors}
+
+
+def write(index, signins, start_at):
+    from sqlalchemy.exc import OperationalError
+    from app import app
+    # Let errors reach us instead of becoming 500 pages
+    app.config['PROPAGATE_EXCEPTIONS'] = True
+    client = app.test_client()
+    time.sleep(max(start_at - time.time(), 0))
+    times, locked, failed = [], 0, 0
+    for n in range(signins):
+        began = time.perf_counter()
+        try:
+            response = client.post('/submit-attendance', data={
+                'firstname': 'Burst', 'lastname': 'Test', 'surname': f'{index}-{n}',
+                'phone': f'070{index:02d}{n:06d}', 'zone': 'MCA', 'group_name': 'WUSE',
+                'church': 'Church', 'category': 'Member',
+            })
+            failed += '/success' not in (response.location or '')
+        except OperationalError as e:
+            if 'locked' in str(e):
+                locked += 1
+            else:
+                failed += 1
+        times.append(time.perf_counter() - began)
+    return {'times': times, 'locked': locked, 'failed': failed}
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'contention.db')}",
+                   SQLITE_PROFILE=profile, INGEST_MODE='direct', METRICS_ENABLED='0')
+        worker = [sys.executable, __file__, '--worker']
+        subprocess.run(worker + ['seed', '--sessions', str(args.sessions), '--attendees', str(args.attendees)],
+                       check=True, capture_output=True, env=env, cwd=tmp)
+        env['AUTO_MIGRATE'] = '0'
+
+        stop_path = os.path.join(tmp, 'stop')
+        readers = [subprocess.Popen(worker + ['read', '--stop', stop_path], env=env, cwd=tmp,
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                   for _ in range(args.readers)]
+        # Give the readers time to import the app and get going first
+        start_at = time.time() + 3
+        writers = [subprocess.Popen(worker + ['write', '--index', str(i), '--signins', str(args.signins),
+                                              '--start-at', str(start_at)],
+                                    env=env, cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                   for i in range(args.writers)]
+        written = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in writers]
+        burst_seconds = time.time() - start_at
+        open(stop_path, 'w').close()
+        read_results = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in readers]
+
+    times = sorted(t for w in written for t in w['times'])
+    reads = sum(r['reads'] for r in read_results)
+    return {
+        'profile': profile,
+        'readers': args.readers,
+        'writers': args.writers,
+        'signins': len(times),
+        'locked_errors': sum(w['locked'] for w in written),
+        'other_errors': sum(w['failed'] for w in written),
+        'stalled_over_1s': sum(t > STALL_SECONDS for t in times),
+        'signin_p50_ms': round(percentile(times, 50) * 1000, 1),
+        'signin_p95_ms': round(percentile(times, 95) * 1000, 1),
+        'signin_max_ms': round(times[-1] * 1000, 1),
+        'signins_per_second': round(len(times) / burst_seconds, 1),
+        'reads': reads,
+        'read_errors': sum(r['read_errors'] for r in read_results),
+        'mean_read_ms': round(1000 * sum(r['read_seconds'] for r in read_results) / reads, 1) if reads else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', default='default,tuned')
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--attendees', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--signins', type=int, default=50, help='sign-ins per writer')
+    parser.add_argument('--worker', choices=['seed', 'read', 'write'], help=argparse.SUPPRESS)
+    parser.add_argument('--stop', help=argparse.SUPPRESS)
+    parser.add_argument('--index', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker == 'seed':
+        seed(args.sessions, args.attendees)
+        return
+    if args.worker == 'read':
+        print(json.dumps(read(args.stop)))
+        return
+    if args.worker == 'write':
+        print(json.dumps(write(args.index, args.signins, args.start_at)))
+        return
+
+    for profile in args.profiles.split(','):
+        print(json.dumps(run_profile(profile, args)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
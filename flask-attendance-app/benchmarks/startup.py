@@ -0,0 +1,221 @@
+"""Benchmark worker startup: import time, memory per worker and respawn time.
+
+``import`` imports the app in a fresh interpreter, as a gunicorn worker does
+without preloading, and reports how long that took and the RSS afterwards.
+It then signs in through the attendance form and lists any heavy library
+(pandas, numpy, openpyxl, qrcode, Pillow, geopy) that sign-in loaded, which
+should be none. Last, it times the first Excel export and analytics page,
+the routes that now pay for those imports.
+
+``gunicorn`` starts gunicorn with gunicorn.conf.py, with and without
+``GUNICORN_PRELOAD``, and reports the master's and each worker's RSS and
+private (unshared) memory. It then kills the only worker of a one-worker
+server ``--respawns`` times and reports how long it took until the
+replacement answered a request.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --modes gunicorn --workers 8
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+HEAVY_MODULES = ['pandas', 'numpy', 'openpyxl', 'qrcode', 'PIL', 'geopy']
+
+
+def memory_mb(pid='self'):
+    """(RSS, private memory) of a process in MiB, from /proc"""
+    values = {}
+    for name in ('status', 'smaps_rollup'):
+        try:
+            with open(f'/proc/{pid}/{name}') as f:
+                for line in f:
+                    key, _, rest = line.partition(':')
+                    if rest.strip().endswith('kB'):
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            pass
+    private = values.get('Private_Clean', 0) + values.get('Private_Dirty', 0)
+    return round(values.get('VmRSS', 0) / 1024, 1), round(private / 1024, 1)
+
+
+def heavy_loaded():
+    return {name for name in HEAVY_MODULES if name in sys.modules}
+
+
+def run_import():
+    start = time.perf_counter()
+    import app as attendance_app
+    import_ms = (time.perf_counter() - start) * 1000
+    rss_after_import, _ = memory_mb()
+    loaded_at_import = heavy_loaded()
+
+    app = attendance_app.app
+    admin = app.test_client()
+    with admin.session_transaction() as s:
+        s['admin_logged_in'] = True
+    admin.post('/save-location', data={'name': 'Hall', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'})
+
+    before_signin = heavy_loaded()
+    phone = app.test_client()
+    phone.get('/attendance')
+    response = phone.post('/submit-attendance', data={
+        'firstname': 'First', 'lastname': 'Last', 'surname': 'Sur', 'phone': '08031234567',
+        'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Church', 'category': 'Member',
+    })
+    phone.get(response.location)
+    loaded_by_signin = heavy_loaded() - before_signin
+    rss_after_signin, _ = memory_mb()
+
+    admin.post('/end-meeting')
+    start = time.perf_counter()
+    admin.get('/download-archived-data/excel')
+    first_excel_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    admin.get('/analytics')
+    first_analytics_ms = (time.perf_counter() - start) * 1000
+    return {
+        'mode': 'import',
+        'import_ms': round(import_ms, 1),
+        'rss_after_import_mb': rss_after_import,
+        'heavy_loaded_at_import': sorted(loaded_at_import),
+        'heavy_loaded_by_signin': sorted(loaded_by_signin),
+        'rss_after_signin_mb': rss_after_signin,
+        'first_excel_export_ms': round(first_excel_ms, 1),
+        'first_analytics_ms': round(first_analytics_ms, 1),
+        'rss_after_all_mb': memory_mb()[0],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def answers(port):
+    try:
+        urllib.request.urlopen(f'http://127.0.0.1:{port}/about', timeout=1).read()
+        return True
+    except (OSError, urllib.error.URLError):
+        return False
+
+
+def wait_until(check, timeout=60, interval=0.005):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return
+        time.sleep(interval)
+    raise RuntimeError('gunicorn did not come up')
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def start_gunicorn(tmp, workers, preload):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+               GUNICORN_WORKERS=str(workers), GUNICORN_PRELOAD='1' if preload else '0')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return server, port
+
+
+def stop(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def run_gunicorn(workers, preload, respawns):
+    result = {'mode': 'gunicorn', 'preload': preload, 'workers': workers}
+    with tempfile.TemporaryDirectory() as tmp:
+        began = time.monotonic()
+        server, port = start_gunicorn(tmp, workers, preload)
+        try:
+            wait_until(lambda: answers(port) and len(children(server.pid)) == workers)
+            result['boot_seconds'] = round(time.monotonic() - began, 2)
+            # Let the workers finish importing, then spread some requests over them
+            time.sleep(1)
+            for _ in range(workers * 5):
+                answers(port)
+            pids = children(server.pid)
+            memory = [memory_mb(pid) for pid in pids]
+            result['master_rss_mb'] = memory_mb(server.pid)[0]
+            result['worker_rss_mb'] = round(statistics.mean(rss for rss, _ in memory), 1)
+            result['worker_private_mb'] = round(statistics.mean(private for _, private in memory), 1)
+            result['total_rss_mb'] = round(result['master_rss_mb'] + sum(rss for rss, _ in memory), 1)
+        finally:
+            stop(server)
+
+        server, port = start_gunicorn(tmp, 1, preload)
+        try:
+            wait_until(lambda: answers(port))
+            times = []
+            for _ in range(respawns):
+                (worker,) = children(server.pid)
+                start = time.monotonic()
+                os.kill(worker, signal.SIGKILL)
+                # The only worker is gone, so the next answer comes from its replacement
+                wait_until(lambda: worker not in children(server.pid) and answers(port))
+                times.append((time.monotonic() - start) * 1000)
+            result['respawn_ms'] = round(statistics.median(times), 1)
+        finally:
+            stop(server)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='import,gunicorn')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--respawns', type=int, default=5)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_import()))
+        return
+
+    modes = args.modes.split(',')
+    if 'import' in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.db')}")
+            # Create the schema first, so the measured import only imports
+            subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'migrate-db'],
+                           check=True, capture_output=True, cwd=APP_DIR, env=env)
+            env['AUTO_MIGRATE'] = '0'
+            # Build the first export in the request, so its time includes the imports
+            env['EXPORT_MODE'] = 'inline'
+            out = subprocess.run([sys.executable, __file__, '--worker'], check=True, capture_output=True,
+                                 text=True, env=env, cwd=tmp)
+        print(out.stdout.strip().splitlines()[-1], flush=True)
+    if 'gunicorn' in modes:
+        for preload in (False, True):
+            print(json.dumps(run_gunicorn(args.workers, preload, args.respawns)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+"""End-to-end benchmark suite: seeded data, realistic scenarios, one report.
+
+Seeds a throwaway SQLite database with ``--sessions`` meetings of
+``--attendees`` attendees each (the last one still running), with zones,
+groups and categories skewed like a real congregation, then drives each
+scenario against each target:
+
+- ``client``: the Flask test client, in process
+- ``gunicorn``: a real gunicorn started with gunicorn.conf.py, over HTTP
+
+Scenarios:
+
+- ``dashboard_poll``: admins polling the dashboard and the live attendee API
+- ``archived_records``: walking every page of /archived-records
+- ``api_pages``: paging through the largest archived session's attendees
+- ``export_csv`` / ``export_excel``: downloading every archived record
+- ``submit_burst``: a burst of new sign-ins (runs last as it adds rows)
+
+Each result reports throughput, p50/p95/p99 latency and the peak RSS of the
+serving processes while the scenario ran, one JSON object per line.
+``--output`` also writes them to a file with the git commit and settings,
+and ``--compare`` checks a run against such a file and exits non-zero on
+regressions beyond ``--tolerance``.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --targets gunicorn --sessions 50 --attendees 5000 --output after.json --compare before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from signin_load import free_port, wait_for_port  # noqa: E402
+
+SCENARIOS = ['dashboard_poll', 'archived_records', 'api_pages', 'export_csv', 'export_excel', 'submit_burst']
+
+# Option values from the attendance form, weighted roughly like a real meeting
+ZONES = {'MCA': 5, 'ZONE 1': 3, 'ZONE 2': 2}
+GROUPS = ['VIRTUOUS', 'AUXANO', 'MIMSHACK', 'PLEROMA', 'AIRPORT ROAD', 'GARKI',
+          'SILVERBIRD', 'WUSE', 'ASOKORO', 'GWARINPA', 'KARU']
+CATEGORIES = {'Member': 80, 'Leader': 12, 'Volunteer': 8}
+CHURCHES = ['Central Church', 'Grace Chapel', 'Bethel', 'New Life', 'Zion']
+
+# Metrics where a larger value is a regression, and where a smaller one is
+WORSE_IF_HIGHER = ['p95_ms', 'p99_ms', 'peak_rss_mb']
+WORSE_IF_LOWER = ['requests_per_second']
+
+
+# --- Synthetic data ---
+
+def person(rng, n):
+    return {
+        'firstname': 'First', 'lastname': 'Last', 'surname': f'Person{n}',
+        'email': f'person{n}@example.com' if rng.random() < 0.6 else None,
+        'phone': f'080{n:08d}',
+        'zone': rng.choices(list(ZONES), weights=list(ZONES.values()))[0],
+        # Zipf-like: the first groups are much larger than the last
+        'group_name': rng.choices(GROUPS, weights=[1 / (k + 1) for k in range(len(GROUPS))])[0],
+        'church': rng.choice(CHURCHES),
+        'category': rng.choices(list(CATEGORIES), weights=list(CATEGORIES.values()))[0],
+    }
+
+
+def seed(sessions, attendees, rng):
+    """Fill the app's database: sessions - 1 ended meetings and one active one"""
+    import counters
+    import people
+    from database import db
+    from models import ArchivedAttendance, Attendance, MeetingLocation, MeetingSession
+
+    location = MeetingLocation(name='Hall', latitude=9.0, longitude=7.4, radius_meters=30, is_active=True)
+    db.session.add(location)
+    db.session.flush()
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    n = 0
+    for i in range(sessions):
+        active = i == sessions - 1
+        start = now - timedelta(days=7 * (sessions - 1 - i), minutes=30 if active else 0)
+        meeting = MeetingSession(meeting_name=f'Meeting {i + 1}', location_id=location.id, start_time=start,
+                                 is_active=active, end_time=None if active else start + timedelta(hours=2),
+                                 attendee_count=0 if active else attendees)
+        db.session.add(meeting)
+        db.session.flush()
+        model = Attendance if active else ArchivedAttendance
+        for offset in range(0, attendees, 5000):
+            rows = []
+            for _ in range(offset, min(offset + 5000, attendees)):
+                row = person(rng, n)
+                # Most people arrive in the first quarter hour
+                row['timestamp'] = start + timedelta(seconds=min(rng.expovariate(1 / 600), 7000))
+                row['meeting_session_id'] = meeting.id
+                rows.append(row)
+                n += 1
+            db.session.execute(model.__table__.insert(), people.attach(rows))
+    counters.rebuild()
+    db.session.commit()
+    return n
+
+
+# --- Drivers: the same requests through the test client or over HTTP ---
+
+class ClientDriver:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def client(self, admin):
+        key = 'admin' if admin else 'public'
+        client = getattr(self.local, key, None)
+        if client is None:
+            client = self.app.test_client()
+            if admin:
+                with client.session_transaction() as session:
+                    session['admin_logged_in'] = True
+            setattr(self.local, key, client)
+        return client
+
+    def request(self, method, path, data=None, admin=True):
+        response = self.client(admin).open(path, method=method, data=data)
+        body = response.get_data()
+        return response.status_code, body
+
+    def pids(self):
+        return [os.getpid()]
+
+
+class HttpDriver:
+    def __init__(self, port, cookie, server_pid):
+        self.port = port
+        self.cookie = cookie
+        self.server_pid = server_pid
+        self.local = threading.local()
+
+    def request(self, method, path, data=None, admin=True):
+        headers = {'Cookie': self.cookie} if admin else {}
+        body = None
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in range(2):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=300)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # Keep-alive connection closed by the worker: reconnect once
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+
+    def pids(self):
+        return [self.server_pid] + children(self.server_pid)
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The parent pid follows the parenthesised command name
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        found.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return found
+
+
+def rss_mb(pids):
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total / 1024
+
+
+class RssSampler:
+    """Peak combined RSS of the serving processes, sampled in the background"""
+
+    def __init__(self, driver, interval=0.05):
+        self.driver = driver
+        self.interval = interval
+        self.peak = 0.0
+        self.stop = threading.Event()
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        while True:
+            self.peak = max(self.peak, rss_mb(self.driver.pids()))
+            if self.stop.wait(self.interval):
+                break
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+# --- Scenarios: each returns a list of (method, path, form data, admin, expected statuses) ---
+
+def dashboard_poll(driver, args, state):
+    requests = []
+    for _ in range(args.polls):
+        requests += [
+            ('GET', '/admin', None, True, (200,)),
+            ('GET', '/api/sessions?status=active', None, True, (200,)),
+            ('GET', f"/api/sessions/{state['active_id']}/attendees?limit=100", None, True, (200,)),
+        ]
+    return requests
+
+
+def archived_records(driver, args, state):
+    # Follow the "next page" links once to learn every page, then fetch them all
+    paths = ['/archived-records']
+    while True:
+        status, body = driver.request('GET', paths[-1])
+        match = re.search(rb'href="[^"]*archived-records\?after=([^"&]+)"', body)
+        if not match:
+            break
+        paths.append('/archived-records?after=' + match.group(1).decode())
+    return [('GET', path, None, True, (200,)) for path in paths for _ in range(args.repeats)]
+
+
+def api_pages(driver, args, state):
+    paths = []
+    path = f"/api/sessions/{state['archived_id']}/attendees?limit=500"
+    while path:
+        paths.append(path)
+        status, body = driver.request('GET', path)
+        cursor = json.loads(body)['next_cursor']
+        path = f"/api/sessions/{state['archived_id']}/attendees?limit=500&after={cursor}" if cursor else None
+    return [('GET', path, None, True, (200,)) for path in paths for _ in range(args.repeats)]
+
+
+# Until an export has been built once, its download redirects to the
+# progress page of the background job building it (302)
+
+def export_csv(driver, args, state):
+    return [('GET', '/download-archived-data/csv', None, True, (200, 302))] * args.repeats
+
+
+def export_excel(driver, args, state):
+    return [('GET', '/download-archived-data/excel', None, True, (200, 302))] * args.repeats
+
+
+def submit_burst(driver, args, state):
+    rng = random.Random(args.seed + 1)
+    first = state['people']
+    # Sign-ins end in a redirect to the success page (302); 5% repeat an earlier
+    # person and are sent back to the form, also a 302
+    return [('POST', '/submit-attendance',
+             person(rng, first + n if n == 0 or rng.random() > 0.05 else first + rng.randrange(n)),
+             False, (302,))
+            for n in range(args.burst)]
+
+
+def percentile(ordered, p):
+    # Nearest rank
+    return ordered[max(int(round(p / 100 * len(ordered))) - 1, 0)] if ordered else None
+
+
+def run_scenario(name, driver, args, state):
+    requests = globals()[name](driver, args, state)
+    concurrency = args.concurrency if name in ('submit_burst', 'dashboard_poll') else args.export_concurrency
+
+    def send(request):
+        method, path, data, admin, expected = request
+        began = time.perf_counter()
+        try:
+            status, body = driver.request(method, path, data, admin)
+        except (http.client.HTTPException, OSError):
+            status, body = None, b''
+        return time.perf_counter() - began, status in expected, len(body)
+
+    with RssSampler(driver) as sampler:
+        began = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(send, requests))
+        elapsed = time.perf_counter() - began
+
+    latencies = sorted(latency * 1000 for latency, ok, size in results)
+    return {
+        'scenario': name,
+        'requests': len(results),
+        'errors': sum(1 for latency, ok, size in results if not ok),
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(results) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+        'mb_per_response': round(sum(size for latency, ok, size in results) / len(results) / 2 ** 20, 3)
+        if results else None,
+        'peak_rss_mb': round(sampler.peak, 1),
+    }
+
+
+# --- Targets ---
+
+def worker(args):
+    from app import app
+    from database import db
+    from models import MeetingSession
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        people = seed(args.sessions, args.attendees, rng)
+        sessions = MeetingSession.query.order_by(MeetingSession.id).all()
+        state = {
+            'people': people,
+            'active_id': sessions[-1].id,
+            # Every archived session is the same size; any will do
+            'archived_id': sessions[0].id if len(sessions) > 1 else sessions[-1].id,
+        }
+        db.session.remove()
+
+    server = None
+    if args.target == 'client':
+        driver = ClientDriver(app)
+    else:
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', 'app:app'],
+            cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        wait_for_port(port)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('POST', '/admin-login', body=urllib.parse.urlencode(
+            {'username': 'admin', 'password': 'attendance123'}),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        response = conn.getresponse()
+        response.read()
+        cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+        driver = HttpDriver(port, cookie, server.pid)
+
+    try:
+        # The burst adds rows, so it goes after the read-only scenarios
+        for name in sorted(args.scenarios.split(','), key=lambda s: s == 'submit_burst'):
+            result = run_scenario(name, driver, args, state)
+            result.update(target=args.target, sessions=args.sessions, attendees=args.attendees)
+            print(json.dumps(result), flush=True)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against a baseline run; returns the regressions"""
+    before = {(r['target'], r['scenario']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = before.get((result['target'], result['scenario']))
+        if old is None:
+            continue
+        if result['errors'] > old['errors']:
+            line = {'target': result['target'], 'scenario': result['scenario'], 'metric': 'errors',
+                    'before': old['errors'], 'after': result['errors'], 'regression': True}
+            print(json.dumps(line), flush=True)
+            regressions.append(line)
+        for metric in WORSE_IF_HIGHER + WORSE_IF_LOWER:
+            if not old.get(metric) or result.get(metric) is None:
+                continue
+            change = result[metric] / old[metric] - 1
+            worse = change > tolerance if metric in WORSE_IF_HIGHER else change < -tolerance
+            line = {'target': result['target'], 'scenario': result['scenario'], 'metric': metric,
+                    'before': old[metric], 'after': result[metric], 'change': round(change, 3),
+                    'regression': worse}
+            print(json.dumps(line), flush=True)
+            if worse:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--targets', default='client,gunicorn')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--attendees', type=int, default=2000, help='attendees per session')
+    parser.add_argument('--burst', type=int, default=300, help='sign-ins in submit_burst')
+    parser.add_argument('--polls', type=int, default=100, help='dashboard refreshes in dashboard_poll')
+    parser.add_argument('--repeats', type=int, default=3, help='times each page or export is fetched')
+    parser.add_argument('--concurrency', type=int, default=32, help='clients in submit_burst and dashboard_poll')
+    parser.add_argument('--export-concurrency', type=int, default=2, help='clients in the page and export scenarios')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the results and run details to this JSON file')
+    parser.add_argument('--compare', help='a previous --output file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative change counted as a regression')
+    parser.add_argument('--target', help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    unknown = set(args.scenarios.split(',')) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    passthrough = ['--scenarios', args.scenarios, '--sessions', str(args.sessions),
+                   '--attendees', str(args.attendees), '--burst', str(args.burst), '--polls', str(args.polls),
+                   '--repeats', str(args.repeats), '--concurrency', str(args.concurrency),
+                   '--export-concurrency', str(args.export_concurrency), '--seed', str(args.seed)]
+    results = []
+    for target in args.targets.split(','):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'suite.db')}")
+            process = subprocess.Popen([sys.executable, __file__, '--worker', '--target', target] + passthrough,
+                                       cwd=APP_DIR, env=env, stdout=subprocess.PIPE, text=True)
+            for line in process.stdout:
+                if line.startswith('{'):
+                    print(line.strip(), flush=True)
+                    results.append(json.loads(line))
+            if process.wait():
+                raise SystemExit(f'{target} run failed')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'settings': {key: value for key, value in vars(args).items()
+                             if key not in ('output', 'compare', 'target', 'worker')},
+                'results': results,
+            }, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.tolerance):
+                raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark the XLSX export engine: rows/sec and peak memory.
+
+Each size runs in a fresh subprocess so peak RSS is measured per run.
+Synthetic attendance rows are fed straight into the workbook writer, so the
+numbers isolate workbook generation from database reads.
+
+    python benchmarks/xlsx_export.py
+    python benchmarks/xlsx_export.py --sizes 10000,100000 --engine pandas
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+ZONES = ['MCA', 'ZONE 1', 'ZONE 2']
+GROUPS = ['VIRTUOUS', 'AUXANO', 'MIMSHACK', 'PLEROMA', 'GARKI', 'WUSE']
+CATEGORIES = ['Member', 'Member', 'Member', 'Leader', 'Volunteer']
+
+
+def synthetic_rows(n):
+    for i in range(n):
+        yield [
+            'Sunday Service', '2026-10-18', '09:00:00', '12:00:00',
+            f'First{i} Last{i} Sur{i}', f'person{i}@example.com', f'080{i:08d}',
+            ZONES[i % len(ZONES)], GROUPS[i % len(GROUPS)], f'Church {i % 40}',
+            CATEGORIES[i % len(CATEGORIES)], '2026-10-18 09:15:00', 'Not Available',
+        ]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_one(rows, engine):
+    import exports
+
+    baseline = peak_rss_mb()
+    with tempfile.TemporaryFile() as fileobj:
+        start = time.perf_counter()
+        if engine == 'streaming':
+            exports.write_workbook(fileobj, [], [('Sunday Service 2026-10-18', synthetic_rows(rows))])
+        else:
+            import pandas as pd
+            df = pd.DataFrame(list(synthetic_rows(rows)), columns=exports.EXPORT_COLUMNS)
+            df.to_excel(fileobj, index=False, engine='openpyxl')
+        elapsed = time.perf_counter() - start
+        size = fileobj.tell()
+
+    return {
+        'engine': engine,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_rss_growth_mb': round(peak_rss_mb() - baseline, 1),
+        'file_mb': round(size / 1024 / 1024, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--engine', choices=['streaming', 'pandas'], default='streaming')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(run_one(args.single, args.engine)))
+        return
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        out = subprocess.run(
+            [sys.executable, __file__, '--engine', args.engine, '--single', str(size)],
+            check=True, capture_output=True, text=True,
+        )
+        print(out.stdout.strip(), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""Bulk import of attendance collected offline (paper sheets, laptops).
+
+Rows are read one at a time from a CSV, XLSX or JSON upload, validated,
+checked against the normalized phone numbers and emails already in the file
+and in the database, and inserted ``IMPORT_BATCH_SIZE`` rows per
+``executemany`` transaction with the session counters updated alongside. The
+report lists every rejected row with its reasons.
+
+Rows go to the live ``attendance`` table while the chosen meeting is active
+and to ``archived_attendance`` once it has ended.
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+import analytics
+import counters
+import parquet_archive
+import people
+from database import begin_transaction, db
+from duplicates import normalize_email, normalize_phone
+from models import ArchivedAttendance, Attendance, MeetingSession, Person
+
+FIELDS = [
+    'firstname', 'lastname', 'surname', 'email', 'phone', 'zone',
+    'group_name', 'church', 'category', 'timestamp', 'latitude', 'longitude',
+]
+
+REQUIRED_FIELDS = ['firstname', 'lastname', 'surname', 'phone', 'zone', 'group_name', 'church', 'category']
+
+# Column headings accepted for each field, compared lower-cased without
+# spaces or punctuation (the export's headings work too)
+HEADER_ALIASES = {
+    'firstname': 'firstname',
+    'lastname': 'lastname',
+    'surname': 'surname',
+    'email': 'email',
+    'emailaddress': 'email',
+    'phone': 'phone',
+    'phonenumber': 'phone',
+    'zone': 'zone',
+    'group': 'group_name',
+    'groupname': 'group_name',
+    'church': 'church',
+    'category': 'category',
+    'timestamp': 'timestamp',
+    'time': 'timestamp',
+    'registrationtime': 'timestamp',
+    'latitude': 'latitude',
+    'longitude': 'longitude',
+}
+
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y']
+
+# Rejected rows listed in a report; the counts always cover every row
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ('csv', 'xlsx', 'json')
+
+_HEADER_JUNK = re.compile(r'[^a-z]')
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+class ImportFileError(ValueError):
+    """The upload as a whole cannot be read"""
+
+
+def detect_format(filename, content_type=None):
+    name = (filename or '').lower()
+    for fmt in FORMATS:
+        if name.endswith('.' + fmt):
+            return fmt
+    if content_type and 'json' in content_type:
+        return 'json'
+    raise ImportFileError('Upload a .csv, .xlsx or .json file.')
+
+
+def _field_map(header):
+    fields = [HEADER_ALIASES.get(_HEADER_JUNK.sub('', str(h or '').lower())) for h in header]
+    missing = [f for f in REQUIRED_FIELDS if f not in fields]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+    return fields
+
+
+def _rows_from_table(rows, first_line):
+    """Turn a header row plus value rows into (line number, {field: value})"""
+    try:
+        header = next(rows)
+    except StopIteration:
+        return
+    fields = _field_map(header)
+    for line, values in enumerate(rows, start=first_line + 1):
+        if all(v is None or str(v).strip() == '' for v in values):
+            continue
+        yield line, {f: v for f, v in zip(fields, values) if f}
+
+
+def read_rows(fileobj, fmt):
+    """Yield (row number, raw {field: value}) from an uploaded file, one row at a time"""
+    if fmt == 'csv':
+        text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        yield from _rows_from_table(csv.reader(text), 1)
+    elif fmt == 'xlsx':
+        from openpyxl import load_workbook
+        try:
+            wb = load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFileError('Could not read the Excel file.') from e
+        try:
+            yield from _rows_from_table(wb.worksheets[0].iter_rows(values_only=True), 1)
+        finally:
+            wb.close()
+    elif fmt == 'json':
+        try:
+            data = json.load(fileobj)
+        except ValueError as e:
+            raise ImportFileError('The JSON is not valid.') from e
+        yield from read_records(data)
+    else:
+        raise ImportFileError(f'Unsupported format: {fmt}')
+
+
+def read_records(data):
+    """Yield (row number, raw {field: value}) from a JSON array of objects"""
+    if not isinstance(data, list):
+        raise ImportFileError('Expected a JSON array of attendee objects.')
+    for n, record in enumerate(data, start=1):
+        if not isinstance(record, dict):
+            yield n, None
+            continue
+        raw = {}
+        for key, value in record.items():
+            field = HEADER_ALIASES.get(_HEADER_JUNK.sub('', str(key).lower()))
+            if field:
+                raw[field] = value
+        yield n, raw
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets turn phone numbers into floats
+        value = int(value)
+    return str(value).strip()
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    text = _text(value)
+    try:
+        parsed = datetime.fromisoformat(text)
+        # Stored naive in UTC, like CURRENT_TIMESTAMP
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    except ValueError:
+        pass
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(text)
+
+
+def validate(raw, default_timestamp):
+    """Return (column values, list of problems) for one raw row"""
+    if raw is None:
+        return None, ['not an object']
+    errors = []
+    values = {}
+    for field in FIELDS:
+        if field in ('timestamp', 'latitude', 'longitude'):
+            continue
+        text = _text(raw.get(field))
+        model = Person if field in people.IDENTITY_FIELDS else Attendance
+        limit = model.__table__.c[field].type.length
+        if field in REQUIRED_FIELDS and not text:
+            errors.append(f'{field} is required')
+        elif limit and len(text) > limit:
+            errors.append(f'{field} is longer than {limit} characters')
+        values[field] = text
+
+    values['email'] = values['email'] or None
+    if values['email'] and not _EMAIL.match(values['email']):
+        errors.append('email is not a valid address')
+    if values['phone'] and not 7 <= len(normalize_phone(values['phone']) or '') <= 15:
+        errors.append('phone must have 7 to 15 digits')
+
+    if _text(raw.get('timestamp')):
+        try:
+            values['timestamp'] = _timestamp(raw['timestamp'])
+        except ValueError:
+            errors.append('timestamp is not a date/time')
+    else:
+        values['timestamp'] = default_timestamp
+
+    for field, bound in (('latitude', 90), ('longitude', 180)):
+        text = _text(raw.get(field))
+        values[field] = None
+        if text:
+            try:
+                values[field] = float(text)
+                if not -bound <= values[field] <= bound:
+                    raise ValueError(text)
+            except ValueError:
+                errors.append(f'{field} must be a number between -{bound} and {bound}')
+    return values, errors
+
+
+def _existing_keys(model, meeting_session):
+    """Normalized phones and emails the insert must not repeat"""
+    # Only this meeting's sign-ins: someone at another meeting still open
+    # (or left in the live table) can be signed in to this one too
+    stmt = select(Person.phone, Person.email).select_from(model).join(
+        Person, Person.id == model.person_id).where(model.meeting_session_id == meeting_session.id)
+    if parquet_archive.offloaded(meeting_session):
+        # Its file holds the rows, and those in SQLite since
+        rows = parquet_archive.rows(parquet_archive.session_frame(meeting_session, ['phone', 'email']))
+    else:
+        rows = db.session.execute(stmt.execution_options(yield_per=5000))
+    phones, emails = set(), set()
+    for phone, email in rows:
+        phones.add(normalize_phone(phone))
+        emails.add(normalize_email(email))
+    phones.discard(None)
+    emails.discard(None)
+    return phones, emails
+
+
+class _Report:
+    def __init__(self):
+        self.total = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def reject(self, line, problems, duplicate=False):
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': line, 'errors': problems, 'duplicate': duplicate})
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'errors_truncated': self.duplicates + self.invalid > len(self.errors),
+        }
+
+
+def _insert_batch(model, batch, report):
+    """executemany one batch; on a constraint race fall back to row-at-a-time savepoints"""
+    try:
+        rows = people.attach([values for _, values in batch])
+        db.session.execute(insert(model), rows)
+        saved = rows
+    except IntegrityError:
+        db.session.rollback()
+        # One transaction for the savepoints and the counters, as for the executemany
+        begin_transaction()
+        saved = []
+        for line, values in batch:
+            try:
+                with db.session.begin_nested():
+                    row, = people.attach([values])
+                    db.session.execute(insert(model), [row])
+                saved.append(row)
+            except IntegrityError:
+                # The one-sign-in-per-person constraint: a phone number
+                report.reject(line, ['phone already registered'], duplicate=True)
+    counters.rows_added(saved)
+    db.session.commit()
+    report.imported += len(saved)
+
+
+def import_rows(meeting_session, rows, batch_size, existing_keys=None):
+    """Validate, dedupe and insert (row number, raw row) pairs; returns the report dict.
+
+    ``existing_keys`` is a (phones, emails) pair of normalized values already
+    taken, for callers that have checked the database themselves; by default
+    they are read from the target table.
+    """
+    model = Attendance if meeting_session.is_active else ArchivedAttendance
+    phones, emails = existing_keys or _existing_keys(model, meeting_session)
+    report = _Report()
+    batch = []
+    for line, raw in rows:
+        report.total += 1
+        values, problems = validate(raw, meeting_session.start_time)
+        if problems:
+            report.reject(line, problems)
+            continue
+
+        phone, email = normalize_phone(values['phone']), normalize_email(values['email'])
+        if phone in phones or (email and email in emails):
+            report.reject(line, ['phone or email already registered'], duplicate=True)
+            continue
+        phones.add(phone)
+        if email:
+            emails.add(email)
+
+        values['meeting_session_id'] = meeting_session.id
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            _insert_batch(model, batch, report)
+            batch = []
+    if batch:
+        _insert_batch(model, batch, report)
+
+    if not meeting_session.is_active and report.imported:
+        MeetingSession.query.filter_by(id=meeting_session.id).update(
+            {'attendee_count': MeetingSession.attendee_count + report.imported})
+        analytics.rollup_session(meeting_session)
+        db.session.commit()
+    return report.as_dict()
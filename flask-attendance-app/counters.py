@@ -0,0 +1,190 @@
+"""Per-session attendance rollups kept in the attendance_counter table.
+
+Every insert, archive or delete of attendance rows adjusts the matching
+counters inside the same transaction, so the admin dashboard and success
+page read a handful of counter rows instead of scanning ``attendance``.
+``rebuild()`` and ``verify()`` recompute the counters from the raw rows.
+"""
+from collections import Counter
+from types import SimpleNamespace
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+
+import parquet_archive
+from database import db
+from models import ArchivedAttendance, Attendance, AttendanceCounter, MeetingSession
+
+TOTAL = 'total'
+
+# Counter dimension -> Attendance attribute it tallies
+DIMENSIONS = {
+    'zone': 'zone',
+    'group': 'group_name',
+    'category': 'category',
+}
+
+
+def _tally(records):
+    """Count (session, dimension, value) keys for a batch of attendance rows"""
+    tally = Counter()
+    for record in records:
+        session_id = record.meeting_session_id
+        if session_id is None:
+            continue
+        tally[(session_id, TOTAL, '')] += 1
+        for dimension, attr in DIMENSIONS.items():
+            value = getattr(record, attr)
+            if value:
+                tally[(session_id, dimension, value)] += 1
+    return tally
+
+
+def _apply(tally, sign=1):
+    if not tally:
+        return
+    stmt = insert(AttendanceCounter)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['meeting_session_id', 'dimension', 'value'],
+        set_={'count': AttendanceCounter.count + stmt.excluded.count},
+    )
+    db.session.execute(stmt, [
+        {'meeting_session_id': session_id, 'dimension': dimension, 'value': value, 'count': sign * n}
+        for (session_id, dimension, value), n in tally.items()
+    ])
+
+
+def record_added(records):
+    """Add newly inserted attendance rows to their session counters"""
+    _apply(_tally(records))
+
+
+def rows_added(rows):
+    """Same as record_added, for rows inserted as column dicts (executemany)"""
+    _apply(_tally(SimpleNamespace(**row) for row in rows))
+
+
+def record_removed(records):
+    """Subtract attendance rows that are being deleted or moved out of a session"""
+    _apply(_tally(records), sign=-1)
+
+
+def clear(session_id=None):
+    """Drop the counters of one session, or of every session"""
+    query = AttendanceCounter.query
+    if session_id is not None:
+        query = query.filter_by(meeting_session_id=session_id)
+    query.delete(synchronize_session=False)
+
+
+def _empty_counts():
+    counts = {TOTAL: 0}
+    counts.update({dimension: {} for dimension in DIMENSIONS})
+    return counts
+
+
+def sessions_counts(session_ids):
+    """Return {session_id: counts} for several sessions in one query"""
+    result = {session_id: _empty_counts() for session_id in session_ids}
+    if not result:
+        return result
+
+    rows = db.session.query(
+        AttendanceCounter.meeting_session_id, AttendanceCounter.dimension,
+        AttendanceCounter.value, AttendanceCounter.count
+    ).filter(
+        AttendanceCounter.meeting_session_id.in_(list(result)),
+        AttendanceCounter.count > 0
+    ).order_by(AttendanceCounter.dimension, AttendanceCounter.value)
+
+    for session_id, dimension, value, count in rows:
+        counts = result[session_id]
+        if dimension == TOTAL:
+            counts[TOTAL] = count
+        elif dimension in counts:
+            counts[dimension][value] = count
+    return result
+
+
+def session_counts(session_id):
+    """Return the total and per-dimension counts for one session"""
+    if session_id is None:
+        return _empty_counts()
+    return sessions_counts([session_id])[session_id]
+
+
+def session_total(session_id):
+    """Return the number of attendees recorded for one session"""
+    if session_id is None:
+        return 0
+    count = db.session.query(AttendanceCounter.count).filter_by(
+        meeting_session_id=session_id, dimension=TOTAL, value=''
+    ).scalar()
+    return count or 0
+
+
+def compute(session_id=None):
+    """Recompute counters from the raw live and archived attendance rows"""
+    tally = Counter()
+    for model in (Attendance, ArchivedAttendance):
+
+        def scoped(query):
+            query = query.filter(model.meeting_session_id.isnot(None))
+            if session_id is not None:
+                query = query.filter(model.meeting_session_id == session_id)
+            return query
+
+        totals = scoped(db.session.query(
+            model.meeting_session_id, func.count(model.id)
+        )).group_by(model.meeting_session_id)
+        for sid, n in totals:
+            tally[(sid, TOTAL, '')] += n
+
+        for dimension, attr in DIMENSIONS.items():
+            column = getattr(model, attr)
+            rows = scoped(db.session.query(
+                model.meeting_session_id, column, func.count(model.id)
+            )).filter(column.isnot(None), column != '').group_by(model.meeting_session_id, column)
+            for sid, value, n in rows:
+                tally[(sid, dimension, value)] += n
+
+    # Rows moved to the Parquet archive are counted from their files
+    offloaded = MeetingSession.query.filter(MeetingSession.archive_file.isnot(None))
+    if session_id is not None:
+        offloaded = offloaded.filter(MeetingSession.id == session_id)
+    for meeting_session in offloaded:
+        frame = parquet_archive.read_file(meeting_session, list(DIMENSIONS.values()))
+        tally[(meeting_session.id, TOTAL, '')] += len(frame)
+        for dimension, attr in DIMENSIONS.items():
+            values = frame[attr]
+            for value, n in values[values.notna() & (values != '')].value_counts().items():
+                tally[(meeting_session.id, dimension, value)] += int(n)
+    return tally
+
+
+def stored(session_id=None):
+    """Return the counters currently stored, keyed like compute()"""
+    query = AttendanceCounter.query.filter(AttendanceCounter.count != 0)
+    if session_id is not None:
+        query = query.filter_by(meeting_session_id=session_id)
+    return Counter({
+        (row.meeting_session_id, row.dimension, row.value): row.count
+        for row in query
+    })
+
+
+def verify(session_id=None):
+    """Return {key: (stored, expected)} for every counter that is out of step"""
+    expected = compute(session_id)
+    actual = stored(session_id)
+    return {
+        key: (actual.get(key, 0), expected.get(key, 0))
+        for key in set(expected) | set(actual)
+        if actual.get(key, 0) != expected.get(key, 0)
+    }
+
+
+def rebuild(session_id=None):
+    """Replace the stored counters with values recomputed from raw rows"""
+    clear(session_id)
+    _apply(compute(session_id))
@@ -1,3 +1,66 @@
+"""The shared SQLAlchemy handle, and the settings every SQLite connection gets.
+
+With ``SQLITE_PROFILE=tuned`` (the default) each new connection switches the
+database to WAL, so dashboard reads and exports no longer block sign-in
+commits. It also sets ``synchronous=NORMAL`` (no fsync per commit in WAL
+mode), a busy timeout so writers queue for the lock instead of failing with
+``database is locked``, a larger page cache, memory-mapped reads and
+in-memory temp tables. Connections are pooled per worker (see
+``SQLALCHEMY_ENGINE_OPTIONS`` in app.py), so each pays for this once.
+``SQLITE_PROFILE=default`` leaves SQLite's own settings alone, for
+comparison.
+
+pysqlite only sends ``BEGIN`` ahead of an INSERT, UPDATE or DELETE, so a
+SAVEPOINT issued first becomes the outermost transaction and its release
+commits on the spot. Code that groups savepoints into one commit calls
+``begin_transaction()`` first.
+"""
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+db = SQLAlchemy()
+
+
+def begin_transaction(session=None):
+    """Open the session's SQLite transaction now, taking the write lock, unless one is open"""
+    connection = (session or db.session).connection()
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.connection.dbapi_connection.in_transaction:
+        # IMMEDIATE: wait for the write lock here, under the busy timeout,
+        # rather than fail to upgrade a read lock part way through
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def sqlite_pragmas(config):
+    """(pragma, value) pairs for the configured profile, in the order they are set"""
+    if config['SQLITE_PROFILE'] != 'tuned':
+        return []
+    return [
+        # First, so the switch to WAL below waits out other connections
+        ('busy_timeout', int(config['SQLITE_BUSY_TIMEOUT_MS'])),
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        # Negative sizes are in KiB rather than pages
+        ('cache_size', -int(config['SQLITE_CACHE_SIZE_KB'])),
+        ('mmap_size', int(config['SQLITE_MMAP_SIZE_MB']) * 1024 * 1024),
+        ('temp_store', config['SQLITE_TEMP_STORE']),
+    ]
+
+
+def configure_sqlite(app):
+    """Run the profile's pragmas on every connection the app's engine opens"""
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+    pragmas = sqlite_pragmas(app.config)
+    if not pragmas:
+        return
+    with app.app_context():
+        engine = db.engine
 
-db = SQLAlchemy()
\ No newline at end of file
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
@@ -0,0 +1,126 @@
+"""Per-worker index of who has already signed in to the active meeting.
+
+People often scan the QR code twice. Rather than letting every repeat open a
+write transaction, fail on the one-sign-in-per-person constraint and roll
+back, ``submit_attendance`` asks this index first. It holds the normalized
+phone numbers and emails of the active session's sign-ins. When a submission
+is not in it, the index first catches up on rows other workers have written
+since it last looked (a read of ``id > last seen``), so a repeat is rejected
+before any write lock is taken wherever it first signed in. The database
+constraint stays as the final guard for simultaneous submissions, but it
+covers phone numbers only: a repeated email is turned away by this index
+alone, so with ``DUPLICATE_INDEX=0``, or two simultaneous submissions, two
+phones may sign in under one email.
+"""
+import re
+import threading
+
+from sqlalchemy import select
+
+from database import db
+from models import Attendance, Person
+
+# Numbers written in international form (+234 803 ...) are stored in local
+# form (0803...), so both spellings of one number match
+COUNTRY_CODE = '234'
+LOCAL_DIGITS = 10
+
+_NON_DIGITS = re.compile(r'\D')
+
+
+def normalize_phone(phone):
+    digits = _NON_DIGITS.sub('', phone or '')
+    if digits.startswith(COUNTRY_CODE) and len(digits) == len(COUNTRY_CODE) + LOCAL_DIGITS:
+        digits = '0' + digits[len(COUNTRY_CODE):]
+    return digits or None
+
+
+def normalize_email(email):
+    return (email or '').strip().lower() or None
+
+
+class DuplicateIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session_key = None
+        self._last_id = 0
+        self._phones = set()
+        self._emails = set()
+
+    @staticmethod
+    def _key(meeting_session):
+        # SQLite reuses the ids of deleted sessions, so the start time is
+        # part of what identifies one
+        return (meeting_session.id, meeting_session.start_time)
+
+    def _reset(self, key):
+        self._session_key = key
+        self._last_id = 0
+        self._phones = set()
+        self._emails = set()
+
+    def _add(self, phone, email):
+        phone, email = normalize_phone(phone), normalize_email(email)
+        if phone:
+            self._phones.add(phone)
+        if email:
+            self._emails.add(email)
+
+    def _match(self, phone, email):
+        if phone and phone in self._phones:
+            return 'phone'
+        if email and email in self._emails:
+            return 'email'
+        return None
+
+    def _catch_up(self, meeting_session):
+        key = self._key(meeting_session)
+        with self._lock:
+            last_id = self._last_id if self._session_key == key else 0
+        # Own short-lived connection: no transaction is left open on the
+        # request's session before the write
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(Attendance.id, Person.phone, Person.email).join(
+                    Person, Person.id == Attendance.person_id
+                ).where(
+                    Attendance.meeting_session_id == meeting_session.id,
+                    Attendance.id > last_id
+                ).order_by(Attendance.id)
+            ).all()
+        with self._lock:
+            if self._session_key != key:
+                self._reset(key)
+            for row in rows:
+                self._add(row.phone, row.email)
+            if rows:
+                self._last_id = max(self._last_id, rows[-1].id)
+
+    def warm(self, meeting_session):
+        """Load a session's existing sign-ins, e.g. when it starts"""
+        with self._lock:
+            self._reset(self._key(meeting_session))
+        self._catch_up(meeting_session)
+
+    def check(self, meeting_session, phone, email):
+        """Return 'phone' or 'email' if that already signed in to the session, else None"""
+        key = self._key(meeting_session)
+        phone, email = normalize_phone(phone), normalize_email(email)
+        with self._lock:
+            if self._session_key != key:
+                self._reset(key)
+            found = self._match(phone, email)
+        if found:
+            return found
+        self._catch_up(meeting_session)
+        with self._lock:
+            return self._match(phone, email)
+
+    def add(self, meeting_session, phone, email):
+        """Record a sign-in this worker has just saved"""
+        with self._lock:
+            if self._session_key == self._key(meeting_session):
+                self._add(phone, email)
+
+
+duplicate_index = DuplicateIndex()
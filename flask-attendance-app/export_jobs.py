@@ -0,0 +1,366 @@
+"""Export files built by background jobs and cached on disk by their content.
+
+An export covers a set of ended meetings, and an ended meeting's attendance
+does not change, so each file is stored under a key derived from its format,
+its label and the sessions it covers: their ids, end times and attendee
+counts (rows imported into, or a meeting deleted from, the archive give a new
+key). A single-meeting export and a whole-archive one that happens to cover
+just that meeting are kept apart, since their names differ. The first request
+for a key starts a job in a small per-worker process pool and the browser
+polls its progress; later requests for the same sessions are served straight
+from disk. Each job's state is a JSON file next to its export, so any worker
+can answer a poll or serve the download.
+
+Files are rebuilt once older than ``EXPORT_CACHE_MAX_AGE_HOURS``, since the
+names and emails in them come from the person registry as it was when they
+were built. When the directory grows past ``EXPORT_CACHE_MAX_MB`` the least
+recently downloaded files are deleted first.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+import counters
+import exports
+from database import db
+from models import MeetingSession
+
+# Export formats -> (file extension, mimetype)
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'excel': ('xlsx', exports.XLSX_MIMETYPE),
+}
+
+# Bump when what goes into an export file changes, so files written by older
+# code are not served
+LAYOUT_VERSION = 1
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_KEY = re.compile(r'[0-9a-f]{64}')
+
+
+def job_key(fmt, sessions, session_id=None, label='attendance_archive'):
+    """The cache key of an export of ``sessions``, in export order, as ``fmt``"""
+    parts = [[s.id, s.end_time.isoformat() if s.end_time else None, s.attendee_count] for s in sessions]
+    data = json.dumps({'layout': LAYOUT_VERSION, 'format': fmt, 'session_id': session_id, 'label': label,
+                       'sessions': parts})
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def valid_key(key):
+    return bool(_KEY.fullmatch(key or ''))
+
+
+def _state_path(directory, key):
+    return os.path.join(directory, f'{key}.json')
+
+
+def file_path(directory, key, fmt):
+    return os.path.join(directory, f'{key}.{FORMATS[fmt][0]}')
+
+
+def read_state(directory, key):
+    """A job's state, or None if there is no such job"""
+    try:
+        with open(_state_path(directory, key)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_state(directory, key, state):
+    state['updated'] = time.time()
+    path = _state_path(directory, key)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _create_state(directory, key, state):
+    """Write a new job's state unless another worker has just done so; returns whether it was ours"""
+    state['updated'] = time.time()
+    path = _state_path(directory, key)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    try:
+        # Unlike os.replace, a link never overwrites an existing job
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp_path)
+
+
+def _remove(directory, key, fmt=None):
+    paths = [_state_path(directory, key)]
+    if fmt in FORMATS:
+        paths.append(file_path(directory, key, fmt))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _sessions(session_ids):
+    """The sessions with these ids, in the given order"""
+    by_id = {s.id: s for s in MeetingSession.query.filter(MeetingSession.id.in_(session_ids))}
+    return [by_id[session_id] for session_id in session_ids if session_id in by_id]
+
+
+def _counted(rows, progress, every):
+    n = 0
+    for n, row in enumerate(rows, 1):
+        if n % every == 0:
+            progress(n)
+        yield row
+    progress(n)
+
+
+def build(directory, key):
+    """Write the export file a job describes, recording its progress; returns the final state"""
+    state = read_state(directory, key)
+    if state is None:
+        # Discarded while it waited in the queue
+        return None
+    state.update(status=RUNNING, pid=os.getpid(), started=time.time())
+    _write_state(directory, key, state)
+
+    def progress(rows):
+        state['rows'] = rows
+        _write_state(directory, key, state)
+
+    path = file_path(directory, key, state['format'])
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        stmt = exports.export_statement(state['session_id'])
+        if state['session_id'] is None:
+            # Only the meetings the key was made from, even if another has ended since
+            stmt = stmt.where(MeetingSession.id.in_(state['session_ids']))
+        sessions = _sessions(state['session_ids'])
+        if state['format'] == 'csv':
+            with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+                rows = _counted(exports.iter_rows(stmt, sessions), progress, exports.FETCH_CHUNK)
+                for chunk in exports.iter_csv(rows):
+                    f.write(chunk)
+        else:
+            with open(tmp_path, 'wb') as f:
+                state['rows'] = exports.write_xlsx(stmt, sessions, f, progress=progress)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        db.session.rollback()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        state.update(status=FAILED, error=str(e) or type(e).__name__)
+        _write_state(directory, key, state)
+        return state
+
+    state.update(status=DONE, finished=time.time(), size=os.path.getsize(path))
+    _write_state(directory, key, state)
+    evict(directory)
+    return state
+
+
+def _build_in_child(directory, key):
+    """Pool entry point: build one export inside the app's context"""
+    # Spawned pool processes import the app once, on their first job
+    from app import app
+    with app.app_context():
+        build(directory, key)
+
+
+def _expired(state, config, now):
+    """Whether a job's state should no longer be trusted"""
+    if state['status'] == DONE:
+        return now - state.get('finished', 0) > config['EXPORT_CACHE_MAX_AGE_HOURS'] * 3600
+    if state['status'] == FAILED:
+        return True
+    # Queued or running, but nothing heard from it for too long: its process died
+    return now - state['updated'] > config['EXPORT_STALE_SECONDS']
+
+
+def evict(directory):
+    """Delete expired exports, then the least recently downloaded ones over the size limit"""
+    config = current_app.config
+    now = time.time()
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith('.tmp'):
+            # Left behind by a build that was killed
+            try:
+                if now - os.path.getmtime(path) > config['EXPORT_STALE_SECONDS']:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        if not name.endswith('.json'):
+            continue
+        key = name[:-len('.json')]
+        state = read_state(directory, key)
+        if state is None:
+            continue
+        if state['status'] != DONE:
+            # Failed jobs stay until their retry, so a poll can still report the error
+            if state['status'] != FAILED and _expired(state, config, now):
+                _remove(directory, key, state.get('format'))
+            continue
+        try:
+            stat = os.stat(file_path(directory, key, state['format']))
+        except FileNotFoundError:
+            _remove(directory, key)
+            continue
+        if _expired(state, config, now):
+            _remove(directory, key, state['format'])
+            continue
+        entries.append((stat.st_mtime, stat.st_size, key, state['format']))
+
+    total = sum(size for _, size, _, _ in entries)
+    limit = config['EXPORT_CACHE_MAX_MB'] * 1024 * 1024
+    for _, size, key, fmt in sorted(entries):
+        if total <= limit:
+            break
+        _remove(directory, key, fmt)
+        total -= size
+
+
+class ExportJobs:
+    """Starts export jobs in a per-worker process pool and finds finished exports"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.directory = None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.directory = app.config['EXPORT_DIR'] or os.path.join(app.instance_path, 'exports')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _executor(self):
+        with self._lock:
+            # Started on first use, and again after a fork, so the gunicorn
+            # master never owns one. Spawned processes start clean instead of
+            # inheriting the worker's threads and database connections.
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.app.config['EXPORT_WORKERS'],
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._pool
+
+    def state(self, key):
+        """A job's state, or None if there is no such job or its export has been evicted"""
+        if not valid_key(key):
+            return None
+        state = read_state(self.directory, key)
+        if state and state['status'] == DONE and not os.path.exists(file_path(self.directory, key, state['format'])):
+            return None
+        return state
+
+    def submit(self, fmt, sessions, session_id=None, label='attendance_archive'):
+        """The state of the export of ``sessions``, starting a job unless it is done or under way.
+
+        ``session_id`` is the one session a single-meeting export covers
+        (None for the whole archive) and ``label`` starts its file name.
+        """
+        key = job_key(fmt, sessions, session_id, label)
+        existing = self.state(key)
+        if existing is not None and not _expired(existing, self.app.config, time.time()):
+            return existing
+
+        all_counts = counters.sessions_counts([s.id for s in sessions])
+        state = {
+            'id': key,
+            'format': fmt,
+            'session_id': session_id,
+            'session_ids': [s.id for s in sessions],
+            'label': label,
+            'status': QUEUED,
+            'rows': 0,
+            'total_rows': sum(counts[counters.TOTAL] for counts in all_counts.values()),
+            'error': None,
+            'created': time.time(),
+        }
+        if existing is None:
+            if not _create_state(self.directory, key, state):
+                # Another worker started the same export a moment ago
+                return self.state(key)
+        else:
+            _write_state(self.directory, key, state)
+
+        if self.app.config['EXPORT_MODE'] == 'inline':
+            return build(self.directory, key)
+        try:
+            future = self._executor().submit(_build_in_child, self.directory, key)
+        except BrokenProcessPool:
+            self._pool = None
+            future = self._executor().submit(_build_in_child, self.directory, key)
+        future.add_done_callback(lambda f: self._finished(key, f))
+        return state
+
+    def _finished(self, key, future):
+        error = future.exception()
+        if error is None:
+            return
+        # The pool process died or could not start: record it so a poll sees it
+        if isinstance(error, BrokenProcessPool):
+            self._pool = None
+        state = read_state(self.directory, key)
+        if state is not None and state['status'] in (QUEUED, RUNNING):
+            state.update(status=FAILED, error=str(error) or type(error).__name__)
+            _write_state(self.directory, key, state)
+
+    def describe(self, state):
+        """The parts of a job's state shown to the admin"""
+        if state['status'] == DONE:
+            percent = 100
+        elif state['total_rows']:
+            # Held below 100 while the file is still being finished off
+            percent = min(99, 100 * state['rows'] // state['total_rows'])
+        else:
+            percent = 0
+        return {
+            'id': state['id'],
+            'format': state['format'],
+            'status': state['status'],
+            'rows': state['rows'],
+            'total_rows': state['total_rows'],
+            'percent': percent,
+            'error': state['error'],
+        }
+
+    def open(self, state):
+        """(path, mimetype) of a finished export, marking it as just downloaded"""
+        path = file_path(self.directory, state['id'], state['format'])
+        # The modification time orders eviction: least recently downloaded first
+        os.utime(path)
+        return path, FORMATS[state['format']][1]
+
+    def discard(self, session_id=None):
+        """Delete the exports (and jobs) covering a session, or all of them"""
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            state = read_state(self.directory, key)
+            if state is not None and (session_id is None or session_id in state['session_ids']):
+                _remove(self.directory, key, state['format'])
+
+
+export_jobs = ExportJobs()
@@ -0,0 +1,243 @@
+"""Attendance export rows and streaming CSV/XLSX output.
+
+Exports read archived attendance joined to its meeting session in a single
+query and walk the result in chunks (``yield_per``), so memory use stays flat
+however many meetings have been archived. Meetings moved to the Parquet tier
+are read from their files instead, one meeting at a time, in the same place
+in the order. ``iter_csv`` turns those rows into CSV text one chunk at a
+time, which export_jobs.py writes to the export file and an inline CSV
+download streams to the client. ``write_xlsx`` feeds the same rows to a
+write-only openpyxl workbook, one worksheet per meeting plus a summary sheet,
+so no cell objects are kept in memory.
+"""
+import csv
+import io
+import re
+from itertools import groupby
+from operator import attrgetter
+
+from sqlalchemy import select
+
+import counters
+import parquet_archive
+from database import db
+from models import ArchivedAttendance, MeetingSession, Person
+
+EXPORT_COLUMNS = [
+    'Meeting Name',
+    'Meeting Date',
+    'Meeting Start Time',
+    'Meeting End Time',
+    'Attendee Name',
+    'Email',
+    'Phone',
+    'Zone',
+    'Group',
+    'Church',
+    'Category',
+    'Registration Time',
+    'Location',
+]
+
+# Rows fetched from the database per round-trip
+FETCH_CHUNK = 1000
+
+# Rows buffered before a chunk of CSV text is handed to the client
+CSV_FLUSH_ROWS = 500
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Export query columns read from the Parquet archive (the rest come from the session)
+PARQUET_COLUMNS = [
+    'firstname', 'lastname', 'surname', 'email', 'phone', 'zone', 'group_name',
+    'church', 'category', 'timestamp', 'latitude', 'longitude',
+]
+
+SUMMARY_COLUMNS = ['Meeting Name', 'Meeting Date', 'Breakdown', 'Value', 'Count']
+
+SUMMARY_LABELS = {
+    counters.TOTAL: 'Total Attendees',
+    'zone': 'Zone',
+    'group': 'Group',
+    'category': 'Category',
+}
+
+_INVALID_SHEET_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+
+def export_statement(session_id=None):
+    """Select the archived export columns for one session, or for every ended session"""
+    stmt = select(
+        MeetingSession.id.label('session_id'),
+        MeetingSession.meeting_name,
+        MeetingSession.start_time,
+        MeetingSession.end_time,
+        Person.firstname,
+        Person.lastname,
+        Person.surname,
+        Person.email,
+        Person.phone,
+        ArchivedAttendance.zone,
+        ArchivedAttendance.group_name,
+        ArchivedAttendance.church,
+        ArchivedAttendance.category,
+        ArchivedAttendance.timestamp,
+        ArchivedAttendance.latitude,
+        ArchivedAttendance.longitude,
+    ).join(MeetingSession, ArchivedAttendance.meeting_session_id == MeetingSession.id).join(
+        Person, ArchivedAttendance.person_id == Person.id)
+
+    if session_id is None:
+        stmt = stmt.where(MeetingSession.is_active == False).order_by(
+            MeetingSession.end_time.desc(), MeetingSession.id.desc(), ArchivedAttendance.id
+        )
+    else:
+        stmt = stmt.where(MeetingSession.id == session_id).order_by(ArchivedAttendance.id)
+    return stmt
+
+
+def has_rows(stmt, sessions=()):
+    """Check cheaply whether an export of ``sessions`` by this statement would return anything"""
+    if any(parquet_archive.offloaded(session) for session in sessions):
+        return True
+    return db.session.execute(select(stmt.exists())).scalar()
+
+
+def format_row(row):
+    """Turn one export query row into the values of EXPORT_COLUMNS"""
+    return [
+        row.meeting_name,
+        row.start_time.strftime('%Y-%m-%d') if row.start_time else 'N/A',
+        row.start_time.strftime('%H:%M:%S') if row.start_time else 'N/A',
+        row.end_time.strftime('%H:%M:%S') if row.end_time else 'N/A',
+        f"{row.firstname} {row.lastname} {row.surname}".strip(),
+        row.email,
+        row.phone,
+        row.zone or 'Not Specified',
+        row.group_name or 'Not Specified',
+        row.church or 'Not Specified',
+        row.category or 'Not Specified',
+        row.timestamp.strftime('%Y-%m-%d %H:%M:%S') if row.timestamp else 'N/A',
+        f"{row.latitude}, {row.longitude}" if row.latitude and row.longitude else 'Not Available',
+    ]
+
+
+def _offloaded_rows(session):
+    frame = parquet_archive.session_frame(session, PARQUET_COLUMNS).assign(
+        session_id=session.id, meeting_name=session.meeting_name,
+        start_time=session.start_time, end_time=session.end_time)
+    return parquet_archive.rows(frame)
+
+
+def archive_rows(stmt, sessions=()):
+    """Yield an export statement's rows, reading meetings in the Parquet archive from their files.
+
+    ``sessions`` are the meetings the statement covers, in its order.
+    """
+    offloaded = {session.id for session in sessions if parquet_archive.offloaded(session)}
+    result = db.session.execute(stmt.execution_options(yield_per=FETCH_CHUNK))
+    try:
+        if not offloaded:
+            yield from result
+            return
+        groups = groupby(result, key=attrgetter('session_id'))
+        group = next(groups, None)
+        for session in sessions:
+            in_sqlite = group is not None and group[0] == session.id
+            if session.id in offloaded:
+                # Rows added since the file was written are read along with it
+                yield from _offloaded_rows(session)
+            elif in_sqlite:
+                yield from group[1]
+            if in_sqlite:
+                group = next(groups, None)
+    finally:
+        result.close()
+
+
+def iter_rows(stmt, sessions=()):
+    """Yield formatted export rows, fetching FETCH_CHUNK rows at a time"""
+    for row in archive_rows(stmt, sessions):
+        yield format_row(row)
+
+
+def iter_csv(rows):
+    """Yield CSV text for the header and rows, a chunk at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_FLUSH_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def sheet_title(session, used):
+    """Build a unique Excel-safe (<= 31 chars) worksheet title for a session"""
+    name = _INVALID_SHEET_CHARS.sub(' ', session.meeting_name or 'Meeting').strip() or 'Meeting'
+    date = session.start_time.strftime('%Y-%m-%d') if session.start_time else ''
+    base = f"{name[:31 - len(date) - 1]} {date}".strip()
+    title, n = base, 2
+    while title.lower() in used:
+        suffix = f' ({n})'
+        title = base[:31 - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+def summary_rows(sessions):
+    """Yield summary sheet rows from the sessions' rollup counters"""
+    all_counts = counters.sessions_counts([s.id for s in sessions])
+    for session in sessions:
+        counts = all_counts[session.id]
+        date = session.start_time.strftime('%Y-%m-%d') if session.start_time else 'N/A'
+        yield [session.meeting_name, date, SUMMARY_LABELS[counters.TOTAL], '', counts[counters.TOTAL]]
+        for dimension in counters.DIMENSIONS:
+            for value, count in counts[dimension].items():
+                yield [session.meeting_name, date, SUMMARY_LABELS[dimension], value, count]
+
+
+def write_workbook(fileobj, summary, sheets, progress=None):
+    """Write a write-only workbook: a summary sheet, then (title, rows) sheets.
+
+    ``progress``, if given, is called with the number of rows written so far
+    after every FETCH_CHUNK rows.
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Summary')
+    ws.append(SUMMARY_COLUMNS)
+    for row in summary:
+        ws.append(row)
+
+    rows_written = 0
+    for title, rows in sheets:
+        ws = wb.create_sheet(title)
+        ws.append(EXPORT_COLUMNS)
+        for row in rows:
+            ws.append(row)
+            rows_written += 1
+            if progress is not None and rows_written % FETCH_CHUNK == 0:
+                progress(rows_written)
+
+    wb.save(fileobj)
+    return rows_written
+
+
+def write_xlsx(stmt, sessions, fileobj, progress=None):
+    """Write export rows to an XLSX file, one worksheet per meeting session"""
+    used_titles = {'summary'}
+    titles = {session.id: sheet_title(session, used_titles) for session in sessions}
+
+    def sheets():
+        for session_id, rows in groupby(archive_rows(stmt, sessions), key=attrgetter('session_id')):
+            yield titles[session_id], (format_row(row) for row in rows)
+
+    return write_workbook(fileobj, summary_rows(sessions), sheets(), progress)
@@ -0,0 +1,167 @@
+"""Checks whether sign-in coordinates fall inside a meeting's radius.
+
+A ``Geofence`` precomputes the WGS-84 radii of curvature at its centre, so a
+check is a bounding-box comparison followed, for points inside the box, by a
+local equirectangular distance: a few multiplications and one cosine instead
+of an iterative geodesic solve. Within a few kilometres of the centre that
+approximation is good to a few centimetres, and any point that lands within
+``boundary_margin`` of the radius is re-checked with geopy's exact geodesic,
+so accept/reject decisions match geopy.
+
+``check_many`` does the same over NumPy arrays, for re-auditing a whole
+session's recorded coordinates in one pass (see ``audit_session``). geopy and
+NumPy are imported when first needed, so most sign-ins load neither.
+"""
+import math
+from functools import lru_cache
+
+from sqlalchemy import select
+
+import parquet_archive
+from database import db
+from models import ArchivedAttendance, Attendance, MeetingSession
+
+# WGS-84 semi-major axis (m) and first eccentricity squared
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+
+
+def boundary_margin(distance):
+    """How far the fast distance may be from the radius before geopy decides"""
+    # Well above the approximation's error, which grows with distance squared
+    return 0.01 + distance * 1e-4
+
+
+def _radii_per_degree(latitude):
+    """Meridional and prime-vertical radii of curvature at ``latitude``, in metres per degree"""
+    w = 1 - WGS84_E2 * math.sin(math.radians(latitude)) ** 2
+    meridional = WGS84_A * (1 - WGS84_E2) / w ** 1.5
+    normal = WGS84_A / math.sqrt(w)
+    return math.radians(meridional), math.radians(normal)
+
+
+def parse_coordinates(latitude, longitude):
+    """Validate submitted latitude/longitude strings; raises ValueError"""
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError) as e:
+        raise ValueError('Missing or invalid coordinates') from e
+    if not (math.isfinite(lat) and math.isfinite(lon)) or abs(lat) > 90 or abs(lon) > 180:
+        raise ValueError('Coordinates out of range')
+    return lat, lon
+
+
+def geodesic_meters(lat1, lon1, lat2, lon2):
+    """Exact ellipsoidal distance in metres"""
+    from geopy.distance import geodesic
+    return geodesic((lat1, lon1), (lat2, lon2)).meters
+
+
+class Geofence:
+    def __init__(self, latitude, longitude, radius_meters):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius_meters
+        # Metres per degree of latitude, and per degree of longitude before
+        # scaling by the cosine of the latitude it is measured at
+        self.lat_scale, self.normal_scale = _radii_per_degree(latitude)
+
+        # Bounding box a little larger than the radius plus the boundary
+        # band, measured where a degree of longitude is narrowest
+        reach = (radius_meters + boundary_margin(radius_meters)) * 1.01
+        self.lat_reach = reach / self.lat_scale
+        edge = min(abs(latitude) + self.lat_reach, 90.0)
+        edge_lon_scale = self.normal_scale * math.cos(math.radians(edge))
+        self.lon_reach = reach / edge_lon_scale if edge_lon_scale > reach / 180 else 180.0
+
+    @classmethod
+    def for_location(cls, location):
+        return _fence(location.latitude, location.longitude, location.radius_meters)
+
+    def _offsets(self, latitude, longitude):
+        dlat = latitude - self.latitude
+        # Shortest way round, so fences near the antimeridian work
+        dlon = (longitude - self.longitude + 180.0) % 360.0 - 180.0
+        return dlat, dlon
+
+    def fast_distance(self, latitude, longitude):
+        dlat, dlon = self._offsets(latitude, longitude)
+        # Longitude measured at the mid latitude keeps the error second order
+        lon_scale = self.normal_scale * math.cos(math.radians(self.latitude + dlat / 2))
+        return math.hypot(dlat * self.lat_scale, dlon * lon_scale)
+
+    def distance(self, latitude, longitude):
+        """Distance in metres from the centre, exact near the boundary"""
+        d = self.fast_distance(latitude, longitude)
+        if abs(d - self.radius) <= boundary_margin(d):
+            d = geodesic_meters(self.latitude, self.longitude, latitude, longitude)
+        return d
+
+    def contains(self, latitude, longitude):
+        """True if the point is within the radius"""
+        dlat, dlon = self._offsets(latitude, longitude)
+        if abs(dlat) > self.lat_reach or abs(dlon) > self.lon_reach:
+            return False
+        return self.distance(latitude, longitude) <= self.radius
+
+    def check_many(self, latitudes, longitudes):
+        """Vectorised ``contains``/``distance``: returns (inside, distances) arrays.
+
+        Points with a missing (NaN) coordinate are reported outside with a
+        NaN distance.
+        """
+        import numpy as np
+        lat = np.asarray(latitudes, dtype=float)
+        lon = np.asarray(longitudes, dtype=float)
+        dlat = lat - self.latitude
+        dlon = (lon - self.longitude + 180.0) % 360.0 - 180.0
+        lon_scale = self.normal_scale * np.cos(np.radians(self.latitude + dlat / 2))
+        distances = np.hypot(dlat * self.lat_scale, dlon * lon_scale)
+
+        # Only the handful of points right at the edge need the exact solve
+        near = np.flatnonzero(np.abs(distances - self.radius) <= boundary_margin(distances))
+        for i in near:
+            distances[i] = geodesic_meters(self.latitude, self.longitude, lat[i], lon[i])
+
+        with np.errstate(invalid='ignore'):
+            inside = distances <= self.radius
+        return inside, distances
+
+
+@lru_cache(maxsize=16)
+def _fence(latitude, longitude, radius_meters):
+    return Geofence(latitude, longitude, radius_meters)
+
+
+def audit_session(session_id):
+    """Re-check every recorded sign-in location of a session against its meeting location"""
+    import numpy as np
+    meeting_session = db.session.get(MeetingSession, session_id)
+    if meeting_session is None or meeting_session.location is None:
+        return None
+    model = Attendance if meeting_session.is_active else ArchivedAttendance
+    if parquet_archive.offloaded(meeting_session):
+        rows = list(parquet_archive.rows(
+            parquet_archive.session_frame(meeting_session, ['id', 'latitude', 'longitude'])))
+    else:
+        rows = db.session.execute(
+            select(model.id, model.latitude, model.longitude).where(model.meeting_session_id == session_id)
+        ).all()
+
+    ids = np.array([row.id for row in rows], dtype=np.int64)
+    coords = np.array([(row.latitude, row.longitude) for row in rows], dtype=float).reshape(-1, 2)
+    located = ~np.isnan(coords).any(axis=1)
+
+    fence = Geofence.for_location(meeting_session.location)
+    inside, distances = fence.check_many(coords[located, 0], coords[located, 1])
+    outside_ids = ids[located][~inside]
+    return {
+        'session_id': session_id,
+        'radius_meters': fence.radius,
+        'checked': int(located.sum()),
+        'without_location': int((~located).sum()),
+        'inside': int(inside.sum()),
+        'outside': int(outside_ids.size),
+        'outside_ids': outside_ids.tolist(),
+        'max_distance': float(distances.max()) if distances.size else None,
+    }
@@ -1,6 +1,86 @@
+import importlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
 bind = "0.0.0.0:10000"
-workers = 4
-worker_class = "sync"
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+
+# Worker model (GUNICORN_WORKER_CLASS):
+#   sync    - one request per worker at a time; a slow phone holds a whole worker
+#   gthread - GUNICORN_THREADS requests per worker on a thread pool
+#   gevent  - up to GUNICORN_WORKER_CONNECTIONS cooperative requests per worker
+#             (needs `pip install gevent`)
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 16 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+
 timeout = 30
 keepalive = 2
-max_requests = 1000
\ No newline at end of file
+max_requests = 1000
+
+# GUNICORN_PRELOAD=1 imports the app once in the master and forks the workers
+# from it: a worker recycled by max_requests is back in milliseconds instead
+# of re-importing everything, and the workers share the master's memory
+# copy-on-write. Code changes then need a full restart, not just a HUP.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0').lower() in ('1', 'true', 'yes')
+
+# Libraries the app only imports when a route first needs them (analytics,
+# Excel import/export, QR codes, geofence checks). A preloading master imports
+# them up front so every worker shares one copy instead of loading its own.
+PRELOAD_MODULES = ['numpy', 'pandas', 'openpyxl', 'qrcode', 'qrcode.image.svg', 'PIL.Image', 'geopy.distance']
+
+if worker_class == 'sync' and os.environ.get('INGEST_MODE') == 'batched':
+    # One request in flight per worker means one row per batch: the group
+    # commit would only add the flusher hop and its wait
+    print("INGEST_MODE=batched needs gthread or gevent workers; committing sign-ins directly",
+          file=sys.stderr)
+    os.environ['INGEST_MODE'] = 'direct'
+
+if worker_class != 'sync':
+    # Requests now queue for a pooled database connection rather than for a
+    # worker. Give every thread its own connection (plus a few for the
+    # background flusher/live feed); gevent requests hold one only briefly.
+    os.environ.setdefault('DB_POOL_SIZE', str(threads if worker_class == 'gthread' else 10))
+    os.environ.setdefault('DB_MAX_OVERFLOW', '5')
+    # Open live dashboard streams no longer tie up a whole worker
+    os.environ.setdefault('LIVE_STREAM_SECONDS', '25')
+
+# Workers share their request metrics through files in one directory, created
+# fresh for each gunicorn run unless METRICS_DIR is set (see metrics.py)
+if not os.environ.get('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='attendance-metrics-')
+    os.environ['METRICS_DIR_TEMPORARY'] = '1'
+
+# Schema migrations run once, in on_starting below, before any worker is
+# forked; workers then boot without touching the database. Set
+# MIGRATE_ON_START=0 where `flask --app app migrate-db` runs as a deploy step.
+os.environ.setdefault('AUTO_MIGRATE', '0')
+
+
+def on_starting(server):
+    if os.environ.get('MIGRATE_ON_START', '1').lower() in ('1', 'true', 'yes'):
+        # In a child process, so the master does not import the app
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'migrate-db'], check=True)
+
+
+def when_ready(server):
+    if preload_app:
+        for module in PRELOAD_MODULES:
+            importlib.import_module(module)
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # Never share a database connection the master may have opened
+        from app import app
+        from database import db
+        with app.app_context():
+            db.engine.dispose(close=False)
+
+
+def on_exit(server):
+    if os.environ.get('METRICS_DIR_TEMPORARY'):
+        shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
@@ -0,0 +1,120 @@
+"""Write-behind ingestion queue that group-commits attendance rows.
+
+Submitting requests hand their validated ``Attendance`` row, and the details
+of the person signing in, to the queue and wait for it to be committed. A
+single flusher thread per worker drains the queue and writes up to
+``INGEST_BATCH_SIZE`` rows in one transaction, so a burst of sign-ins costs
+one fsync and one SQLite write lock per batch instead of one per person. The
+session counters for the whole batch are updated in the same transaction.
+Each row and the upsert of its person are flushed inside their own SAVEPOINT
+so a repeat sign-in only rejects that row, and the ``IntegrityError`` is
+handed back to the request that submitted it.
+"""
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+import counters
+import people
+from database import begin_transaction, db
+
+
+class IngestBusy(Exception):
+    """Raised when the queue stays full for longer than the submit timeout.
+
+    Nothing has been queued when it is raised, so the sign-in can safely be
+    submitted again.
+    """
+
+
+class _Ticket:
+    __slots__ = ('record', 'person', 'done', 'error')
+
+    def __init__(self, record, person):
+        self.record = record
+        self.person = person
+        self.done = threading.Event()
+        self.error = None
+
+
+class IngestQueue:
+    """Bounded queue of pending attendance rows with a group-commit flusher"""
+
+    def __init__(self, app):
+        self.app = app
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Started lazily (and restarted after a fork) so the gunicorn master
+        # never owns the flusher thread.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue(maxsize=self.app.config['INGEST_QUEUE_SIZE'])
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='attendance-ingest', daemon=True)
+            self._thread.start()
+
+    def submit(self, record, person):
+        """Queue a row and block until its batch commits; re-raises its IntegrityError"""
+        self._ensure_started()
+        ticket = _Ticket(record, person)
+        try:
+            self._queue.put(ticket, timeout=self.app.config['INGEST_SUBMIT_TIMEOUT'])
+        except queue.Full:
+            raise IngestBusy('Attendance queue is full')
+        # Once queued the row will be written, so wait for its batch however
+        # long it takes: reporting a failure now would have the attendee
+        # retry into their own sign-in and be told they are a duplicate
+        ticket.done.wait()
+        if ticket.error is not None:
+            raise ticket.error
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            max_batch = self.app.config['INGEST_BATCH_SIZE']
+            deadline = time.monotonic() + self.app.config['INGEST_FLUSH_INTERVAL']
+            while len(batch) < max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch):
+        try:
+            with self.app.app_context():
+                try:
+                    # Without this the first SAVEPOINT would commit its row on its own
+                    begin_transaction()
+                    saved = []
+                    for ticket in batch:
+                        try:
+                            with db.session.begin_nested():
+                                ticket.record.person_id = people.upsert(ticket.person)
+                                db.session.add(ticket.record)
+                            saved.append(ticket.record)
+                        except IntegrityError as e:
+                            ticket.error = e
+                    counters.record_added(saved)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    for ticket in batch:
+                        if ticket.error is None:
+                            ticket.error = e
+        finally:
+            for ticket in batch:
+                ticket.done.set()
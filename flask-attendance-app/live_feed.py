@@ -0,0 +1,205 @@
+"""Server-Sent Events feed of new sign-ins for the live dashboards.
+
+One publisher thread per worker polls the (small) live attendance table for
+rows newer than the last one it has seen, refreshes the session's rollup
+counters when something arrived, and keeps the recent rows in memory. Every
+watching screen is served from that buffer, so database load grows with the
+number of new sign-ins rather than with viewers x refreshes.
+
+Streams are held open for ``LIVE_STREAM_SECONDS``. With the default of 0
+each request returns whatever is new and closes, and the browser's
+EventSource reconnects after ``LIVE_RETRY_MS`` (a long-poll), which keeps
+sync gunicorn workers free for sign-ins. With threaded or async workers a
+longer hold turns it into a true push stream.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import counters
+from attendee_api import FIELDS, attendee_select, serialize
+from database import db
+from meeting_cache import active_meeting_cache
+from models import Attendance
+
+# Feeds nobody has asked about for this long stop being polled
+IDLE_SECONDS = 60
+
+# Seconds between keepalive comments on a held-open stream
+KEEPALIVE_SECONDS = 10
+
+
+class _SessionFeed:
+    def __init__(self, session_id, cursor, max_rows):
+        self.session_id = session_id
+        self.cursor = cursor    # highest attendance id published
+        self.floor = cursor     # buffered rows cover every id above this
+        self.rows = deque()
+        self.max_rows = max_rows
+        self.counts = None
+        self.ended = False
+        self.last_interest = time.monotonic()
+
+    def publish(self, rows, counts):
+        for row in rows:
+            self.rows.append(row)
+            self.cursor = row['id']
+        while len(self.rows) > self.max_rows:
+            self.floor = self.rows.popleft()['id']
+        self.counts = counts
+
+    def rows_after(self, cursor):
+        """Rows newer than ``cursor``, or None if they are no longer buffered"""
+        if cursor < self.floor:
+            return None
+        return [row for row in self.rows if row['id'] > cursor]
+
+
+class LiveFeed:
+    def __init__(self, app=None):
+        self.app = None
+        self._feeds = {}
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+    def _ensure_started(self):
+        # Started lazily (and restarted after a fork) so the gunicorn master
+        # never owns the publisher thread.
+        with self._changed:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._feeds = {}
+            self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Wake the publisher early, e.g. right after this worker saved a sign-in"""
+        self._wake.set()
+
+    def _feed(self, session_id, cursor):
+        with self._changed:
+            feed = self._feeds.get(session_id)
+            if feed is None:
+                feed = _SessionFeed(session_id, cursor, self.app.config['LIVE_BUFFER_ROWS'])
+                self._feeds[session_id] = feed
+                self._wake.set()
+            feed.last_interest = time.monotonic()
+            return feed
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.app.config['LIVE_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self._poll()
+            except Exception:
+                self.app.logger.exception('Live feed poll failed')
+
+    def _poll(self):
+        now = time.monotonic()
+        with self._changed:
+            for session_id, feed in list(self._feeds.items()):
+                if now - feed.last_interest > IDLE_SECONDS:
+                    del self._feeds[session_id]
+            feeds = list(self._feeds.values())
+        if not feeds:
+            # Nobody watching: no active-meeting lookup, which is a query
+            # every time while no meeting is on
+            return
+
+        active_session = active_meeting_cache.session()
+        for feed in feeds:
+            if feed.ended:
+                continue
+            if active_session is None or active_session.id != feed.session_id:
+                feed.ended = True
+                continue
+
+            query = attendee_select(Attendance).where(
+                Attendance.meeting_session_id == feed.session_id,
+                Attendance.id > feed.cursor
+            ).order_by(Attendance.id).limit(feed.max_rows)
+            rows = [serialize(a, FIELDS) for a in db.session.execute(query)]
+            if rows or feed.counts is None:
+                counts = counters.session_counts(feed.session_id)
+                with self._changed:
+                    feed.publish(rows, counts)
+
+        with self._changed:
+            self._changed.notify_all()
+
+    def _latest_id(self, session_id):
+        with self.app.app_context():
+            return db.session.query(db.func.max(Attendance.id)).filter(
+                Attendance.meeting_session_id == session_id
+            ).scalar() or 0
+
+    def stream(self, session_id, cursor=None, include_rows=True):
+        """Yield SSE messages for ``session_id`` newer than ``cursor``"""
+        self._ensure_started()
+        config = self.app.config
+        if cursor is None:
+            with self._changed:
+                existing = self._feeds.get(session_id)
+                cursor = existing.cursor if existing is not None else None
+            if cursor is None:
+                cursor = self._latest_id(session_id)
+        feed = self._feed(session_id, cursor)
+
+        yield f"retry: {config['LIVE_RETRY_MS']}\n\n"
+        deadline = time.monotonic() + config['LIVE_STREAM_SECONDS']
+        last_sent = time.monotonic()
+        counts_sent = None
+        while True:
+            with self._changed:
+                if feed.counts is None and not feed.ended:
+                    self._changed.wait(config['LIVE_POLL_INTERVAL'] * 2)
+                feed.last_interest = time.monotonic()
+                rows = feed.rows_after(cursor)
+                counts = feed.counts
+                ended = feed.ended
+                latest = feed.cursor
+
+            if ended:
+                yield 'event: ended\ndata: {}\n\n'
+                return
+            if rows is None:
+                # This client fell further behind than the buffer reaches
+                if include_rows:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                rows, cursor = [], latest
+            if rows or (counts is not None and counts is not counts_sent):
+                if rows:
+                    cursor = rows[-1]['id']
+                elif not include_rows:
+                    cursor = max(cursor, latest)
+                payload = {'counts': counts}
+                if include_rows:
+                    payload['attendees'] = rows
+                yield f"id: {cursor}\ndata: {json.dumps(payload)}\n\n"
+                counts_sent = counts
+                last_sent = time.monotonic()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            with self._changed:
+                self._changed.wait(min(remaining, KEEPALIVE_SECONDS))
+
+
+live_feed = LiveFeed()
@@ -0,0 +1,73 @@
+"""Process-local cache of the active meeting session and location.
+
+The sign-in pages look up the active ``MeetingSession`` and
+``MeetingLocation`` several times per request. Each worker keeps a detached
+copy of both, tagged with the version stamp of a small file in the instance
+folder. Anything that starts, ends or relocates a meeting calls
+``invalidate()`` after committing, which replaces the stamp file, so every
+gunicorn worker notices on its next lookup with a single ``os.stat``.
+A missing active meeting is never cached; it is always re-checked.
+"""
+import os
+import time
+
+from sqlalchemy.orm import Session
+
+from database import db
+from models import MeetingLocation, MeetingSession
+
+
+class ActiveMeetingCache:
+    def __init__(self, app=None):
+        self._stamp_path = None
+        self._entries = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        os.makedirs(app.instance_path, exist_ok=True)
+        self._stamp_path = os.path.join(app.instance_path, 'active_meeting.stamp')
+
+    def _stamp(self):
+        try:
+            st = os.stat(self._stamp_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def invalidate(self):
+        """Drop cached lookups in every worker; call after committing a change"""
+        self._entries.clear()
+        tmp_path = f'{self._stamp_path}.{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            f.write(str(time.time_ns()))
+        os.replace(tmp_path, self._stamp_path)
+
+    def _lookup(self, model):
+        # Read the stamp before querying so a change committed in between
+        # leaves us holding an already-outdated stamp, never a stale row.
+        stamp = self._stamp()
+        cached = self._entries.get(model)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        # Load through a private session so the cached copy is detached with
+        # its attributes loaded and never shares state with the request.
+        with Session(db.engine, expire_on_commit=False) as session:
+            obj = session.query(model).filter_by(is_active=True).first()
+        if obj is None:
+            self._entries.pop(model, None)
+        else:
+            self._entries[model] = (stamp, obj)
+        return obj
+
+    def session(self):
+        """Return the active MeetingSession (read-only, detached) or None"""
+        return self._lookup(MeetingSession)
+
+    def location(self):
+        """Return the active MeetingLocation (read-only, detached) or None"""
+        return self._lookup(MeetingLocation)
+
+
+active_meeting_cache = ActiveMeetingCache()
@@ -0,0 +1,336 @@
+"""Per-route request timing and SQL counts, served as Prometheus text at /metrics.
+
+Each request's latency, SQL statement count, time spent in SQL and rows
+fetched are added to histograms and counters labelled by route (the URL rule,
+so ``/api/sessions/<int:session_id>/attendees`` is one series). Statements are
+timed with SQLAlchemy's cursor events. Rows are counted by a ``sqlite3``
+cursor subclass (``CountingConnection``), so they are only counted for SQLite.
+Queries run by the background threads (batched ingest, the live feed) are
+reported under the route ``(background)``.
+
+gunicorn workers are separate processes, so each one writes a snapshot of
+its totals to ``METRICS_DIR/<pid>.json`` every ``METRICS_FLUSH_SECONDS`` and on
+exit. ``/metrics`` adds up every worker's file, and snapshots of workers that
+have exited (``max_requests`` recycling) are folded into ``retired.json`` so
+the counters never go backwards. Without ``METRICS_DIR`` each process reports
+only its own totals.
+
+With ``SLOW_REQUEST_MS`` set, requests slower than that are logged with their
+slowest statements.
+"""
+import atexit
+import fcntl
+import glob
+import heapq
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+
+from database import db
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, label names, histogram buckets, help)
+FAMILIES = {
+    'attendance_http_requests_total': (
+        'counter', ('route', 'method', 'status'), None, 'Requests handled.'),
+    'attendance_http_request_duration_seconds': (
+        'histogram', ('route',), DURATION_BUCKETS, 'Time from routing to the end of the response.'),
+    'attendance_db_queries_per_request': (
+        'histogram', ('route',), QUERY_BUCKETS, 'SQL statements run by one request.'),
+    'attendance_db_queries_total': (
+        'counter', ('route',), None, 'SQL statements run.'),
+    'attendance_db_query_seconds_total': (
+        'counter', ('route',), None, 'Time spent executing SQL statements.'),
+    'attendance_db_rows_fetched_total': (
+        'counter', ('route',), None, 'Rows fetched from the database (SQLite only).'),
+}
+
+BACKGROUND = '(background)'
+UNMATCHED = '(unmatched)'
+
+# Statements quoted per slow request, and the characters kept of each
+SLOW_STATEMENTS = 5
+SLOW_STATEMENT_CHARS = 500
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class _RequestStats:
+    __slots__ = ('started', 'route', 'method', 'status', 'queries', 'seconds', 'rows', 'slowest')
+
+    def __init__(self, route, method, keep_statements):
+        self.started = time.perf_counter()
+        self.route = route
+        self.method = method
+        self.status = None
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        # Min-heap of (seconds, statement), only when the slow log is on
+        self.slowest = [] if keep_statements else None
+
+
+def _observe(buckets, value):
+    """A histogram sample as the per-bucket counts (last one is +Inf) plus the sum"""
+    counts = [0] * (len(buckets) + 2)
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            counts[i] = 1
+            break
+    else:
+        counts[len(buckets)] = 1
+    counts[-1] = value
+    return counts
+
+
+def _add(values, key, amount):
+    current = values.get(key)
+    if current is None:
+        values[key] = list(amount) if isinstance(amount, list) else amount
+    elif isinstance(current, list):
+        for i, v in enumerate(amount):
+            current[i] += v
+    else:
+        values[key] = current + amount
+
+
+def merge(snapshots):
+    """Add up snapshots ({family: [[labels, value], ...]}) into {family: {labels: value}}"""
+    totals = {name: {} for name in FAMILIES}
+    for snapshot in snapshots:
+        for name, series in snapshot.items():
+            if name in totals:
+                for labels, value in series:
+                    _add(totals[name], tuple(labels), value)
+    return totals
+
+
+def _label_text(names, values):
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return ','.join(pairs)
+
+
+def render(totals):
+    """Prometheus text exposition format"""
+    lines = []
+    for name, (kind, label_names, buckets, help_text) in FAMILIES.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(totals[name].items()):
+            label_text = _label_text(label_names, labels)
+            if kind == 'counter':
+                lines.append(f'{name}{{{label_text}}} {value:g}')
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative:g}')
+            lines.append(f'{name}_sum{{{label_text}}} {value[-1]:g}')
+            lines.append(f'{name}_count{{{label_text}}} {cumulative:g}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.app = None
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in FAMILIES}
+        self._local = threading.local()
+        self._flushed_at = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        if not app.config['METRICS_ENABLED']:
+            return
+        app.before_request(self._start)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish)
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', self._before_cursor)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor)
+        if app.config['METRICS_DIR']:
+            os.makedirs(app.config['METRICS_DIR'], exist_ok=True)
+            atexit.register(self.flush)
+
+    # --- Collection ---
+
+    def _start(self):
+        route = request.url_rule.rule if request.url_rule else UNMATCHED
+        self._local.stats = _RequestStats(route, request.method, self.app.config['SLOW_REQUEST_MS'] > 0)
+
+    def _record_status(self, response):
+        stats = getattr(self._local, 'stats', None)
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _before_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            with self._lock:
+                _add(self._values['attendance_db_queries_total'], (BACKGROUND,), 1)
+                _add(self._values['attendance_db_query_seconds_total'], (BACKGROUND,), elapsed)
+            return
+        stats.queries += 1
+        stats.seconds += elapsed
+        if stats.slowest is not None:
+            entry = (elapsed, statement)
+            if len(stats.slowest) < SLOW_STATEMENTS:
+                heapq.heappush(stats.slowest, entry)
+            elif elapsed > stats.slowest[0][0]:
+                heapq.heapreplace(stats.slowest, entry)
+
+    def rows_fetched(self, count):
+        stats = getattr(self._local, 'stats', None)
+        if stats is not None:
+            stats.rows += count
+        elif count:
+            with self._lock:
+                _add(self._values['attendance_db_rows_fetched_total'], (BACKGROUND,), count)
+
+    def _finish(self, exc=None):
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            return
+        self._local.stats = None
+        duration = time.perf_counter() - stats.started
+        status = stats.status if stats.status is not None else 500
+        route = (stats.route,)
+        values = self._values
+        with self._lock:
+            _add(values['attendance_http_requests_total'], (stats.route, stats.method, str(status)), 1)
+            _add(values['attendance_http_request_duration_seconds'], route, _observe(DURATION_BUCKETS, duration))
+            _add(values['attendance_db_queries_per_request'], route, _observe(QUERY_BUCKETS, stats.queries))
+            _add(values['attendance_db_queries_total'], route, stats.queries)
+            _add(values['attendance_db_query_seconds_total'], route, stats.seconds)
+            _add(values['attendance_db_rows_fetched_total'], route, stats.rows)
+
+        slow_ms = self.app.config['SLOW_REQUEST_MS']
+        if slow_ms and duration * 1000 >= slow_ms:
+            self._log_slow(stats, status, duration)
+
+        if self.app.config['METRICS_DIR'] and time.monotonic() - self._flushed_at >= self.app.config['METRICS_FLUSH_SECONDS']:
+            self.flush()
+
+    def _log_slow(self, stats, status, duration):
+        statements = '\n'.join(
+            f'  {seconds * 1000:8.1f} ms  {_WHITESPACE.sub(" ", statement)[:SLOW_STATEMENT_CHARS]}'
+            for seconds, statement in sorted(stats.slowest, reverse=True))
+        self.app.logger.warning(
+            'Slow request: %s %s -> %s in %.0f ms; %d queries took %.0f ms, %d rows fetched%s',
+            stats.method, request.full_path.rstrip('?'), status, duration * 1000,
+            stats.queries, stats.seconds * 1000, stats.rows, '\n' + statements if statements else '')
+
+    # --- Aggregation across workers ---
+
+    def snapshot(self):
+        with self._lock:
+            return _as_snapshot(self._values)
+
+    def _write(self, path, snapshot):
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def flush(self):
+        """Write this process's totals where the other workers can read them"""
+        directory = self.app.config['METRICS_DIR']
+        if directory:
+            self._flushed_at = time.monotonic()
+            try:
+                self._write(os.path.join(directory, f'{os.getpid()}.json'), self.snapshot())
+            except FileNotFoundError:
+                # gunicorn removes its temporary METRICS_DIR as it shuts down
+                pass
+
+    def collect(self):
+        """Totals across every worker (just this process without METRICS_DIR)"""
+        directory = self.app.config['METRICS_DIR']
+        if not directory:
+            return merge([self.snapshot()])
+        self.flush()
+        with open(os.path.join(directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = {}
+            for path in glob.glob(os.path.join(directory, '*.json')):
+                try:
+                    with open(path) as f:
+                        snapshots[path] = json.load(f)
+                except (OSError, ValueError):
+                    continue
+            retired_path = os.path.join(directory, 'retired.json')
+            exited = [path for path in snapshots
+                      if os.path.basename(path)[:-5].isdigit() and not _alive(int(os.path.basename(path)[:-5]))]
+            if exited:
+                # Fold exited workers' totals into one file so the directory stays small
+                folded = [snapshots[path] for path in exited + [retired_path] if path in snapshots]
+                self._write(retired_path, _as_snapshot(merge(folded)))
+                for path in exited:
+                    os.remove(path)
+        return merge(snapshots.values())
+
+    def render(self):
+        return render(self.collect())
+
+
+def _as_snapshot(values):
+    return {name: [[list(labels), value] for labels, value in series.items()] for name, series in values.items()}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            request_metrics.rows_fetched(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        request_metrics.rows_fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        request_metrics.rows_fetched(len(rows))
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors report the rows they fetch"""
+
+    def cursor(self, factory=_CountingCursor):
+        return super().cursor(factory)
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,116 @@
+"""Versioned schema migrations, applied once per deploy rather than per worker.
+
+``MIGRATIONS`` is an ordered list of steps, and ``schema_version`` records
+each one applied to the database. ``upgrade()`` runs the steps a database has
+not had yet: under gunicorn the master runs it before forking (see
+``gunicorn.conf.py``), elsewhere ``flask --app app migrate-db`` does, so
+worker boot never touches the attendance tables. A new database gets every
+table from the models and is stamped with the latest version without
+running the steps.
+
+Steps must be safe to run again: SQLite commits most DDL straight away, so a
+step interrupted half way is retried from the start on the next run. Add new
+steps at the end and never renumber old ones.
+"""
+from sqlalchemy import inspect, text
+
+import analytics
+import archive
+import counters
+import people
+from database import db
+from models import AttendanceCounter, MeetingSession, SchemaVersion, SessionRollup
+
+
+def _baseline():
+    db.create_all()
+    # Databases from before the zone, group, church and category fields
+    columns = {c['name'] for c in inspect(db.engine).get_columns('attendance')}
+    if 'zone' not in columns:
+        for column, default in (('zone VARCHAR(50)', 'MCA'), ('group_name VARCHAR(100)', 'VIRTUOUS'),
+                                ('church VARCHAR(200)', 'Unknown'), ('category VARCHAR(50)', 'Member')):
+            db.session.execute(text(f"ALTER TABLE attendance ADD COLUMN {column} DEFAULT '{default}'"))
+        db.session.commit()
+    # The later steps load meeting sessions through the model, which has it
+    _archive_file_column()
+
+
+def _person_registry():
+    people.migrate_legacy_tables()
+
+
+def _archive_table():
+    if archive.migrate_archived_rows():
+        db.session.commit()
+
+
+def _indexes():
+    # create_all() leaves existing tables alone, so add the indexes declared
+    # on the models since the database was created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+
+def _rollups():
+    if not db.session.query(AttendanceCounter.meeting_session_id).first():
+        counters.rebuild()
+    if not db.session.query(SessionRollup.meeting_session_id).first() and \
+            MeetingSession.query.filter_by(is_active=False).first():
+        analytics.rebuild()
+    db.session.commit()
+
+
+def _archive_file_column():
+    columns = {c['name'] for c in inspect(db.engine).get_columns('meeting_session')}
+    if 'archive_file' not in columns:
+        db.session.execute(text('ALTER TABLE meeting_session ADD COLUMN archive_file VARCHAR(255)'))
+        db.session.commit()
+
+
+# (version, description, step), oldest first
+MIGRATIONS = [
+    (1, 'Create tables and add the zone, group, church and category columns', _baseline),
+    (2, 'Move attendee details into the person registry', _person_registry),
+    (3, 'Move rows archived in place into the archive table', _archive_table),
+    (4, 'Add indexes on active meetings, archived rows and session columns', _indexes),
+    (5, 'Build attendance counters and analytics rollups', _rollups),
+    (6, 'Record the Parquet file of each offloaded meeting', _archive_file_column),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+
+def current_version():
+    """The schema version recorded in the database: None if it has no tables, 0 if it predates versioning"""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(SchemaVersion.__tablename__):
+        return 0 if inspector.has_table(MeetingSession.__tablename__) else None
+    return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+
+
+def _stamp(version, description):
+    db.session.add(SchemaVersion(version=version, description=description))
+    db.session.commit()
+
+
+def upgrade(log=print):
+    """Apply pending migrations; returns the versions applied"""
+    version = current_version()
+    if version is None:
+        db.create_all()
+        _stamp(LATEST, 'Create tables for a new database')
+        log(f'Created a new database at schema version {LATEST}.')
+        return [LATEST]
+
+    if version < LATEST:
+        SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    applied = []
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        log(f'Migrating to schema version {number}: {description}...')
+        step()
+        _stamp(number, description)
+        applied.append(number)
+    return applied
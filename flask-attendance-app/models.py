@@ -1,6 +1,12 @@
 from database import db
 
 class MeetingSession(db.Model):
+    __table_args__ = (
+        # The active meeting, archive pages (newest id first) and the latest ended meeting
+        db.Index('ix_meeting_session_active_id', 'is_active', 'id'),
+        db.Index('ix_meeting_session_active_end', 'is_active', 'end_time'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     meeting_name = db.Column(db.String(200), nullable=False)
     location_id = db.Column(db.Integer, db.ForeignKey('meeting_location.id'), nullable=True)
@@ -8,22 +14,49 @@ class MeetingSession(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, default=True)
     attendee_count = db.Column(db.Integer, default=0)
+    # Parquet file holding attendance moved out of SQLite (parquet_archive.py)
+    archive_file = db.Column(db.String(255), nullable=True)
     
     # Relationship
     location = db.relationship('MeetingLocation', backref='sessions')
 
-class Attendance(db.Model):
+class Person(db.Model):
+    # One row per attendee, filed under their normalized phone number;
+    # attendance rows point here instead of repeating names and contacts
     id = db.Column(db.Integer, primary_key=True)
+    phone = db.Column(db.String(20), nullable=False, unique=True)
     firstname = db.Column(db.String(100), nullable=False)
     lastname = db.Column(db.String(100), nullable=False)
     surname = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(200), unique=True)
-    phone = db.Column(db.String(20), nullable=False, unique=True)
+    email = db.Column(db.String(200), nullable=True)
+    
+    # What they entered when first filed (later sign-ins fill in blanks only),
+    # to pre-fill a returning attendee's sign-in
+    zone = db.Column(db.String(50), nullable=True)
+    group_name = db.Column(db.String(100), nullable=True)
+    church = db.Column(db.String(200), nullable=True)
+    category = db.Column(db.String(50), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class Attendance(db.Model):
+    __table_args__ = (
+        # Keyset pages of a session's attendees ordered by (timestamp, id)
+        db.Index('ix_attendance_session_time', 'meeting_session_id', 'timestamp', 'id'),
+        # A person signs in to a meeting once
+        db.UniqueConstraint('meeting_session_id', 'person_id', name='uq_attendance_session_person'),
+        # Ending a meeting looks for unarchived rows of other sessions
+        db.Index('ix_attendance_archived_session', 'is_archived', 'meeting_session_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
     
-    # New organizational fields
+    # Organizational fields, as given at this sign-in
     zone = db.Column(db.String(50), nullable=False)  # MCA, ZONE 1, ZONE 2
     group_name = db.Column(db.String(100), nullable=False)  # VIRTUOUS, AUXANO, etc.
     church = db.Column(db.String(200), nullable=False)
@@ -33,8 +66,34 @@ class Attendance(db.Model):
     meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), nullable=True)
     is_archived = db.Column(db.Boolean, default=False)
     
-    # Relationship
+    # Relationships
     meeting_session = db.relationship('MeetingSession', backref='attendees')
+    person = db.relationship('Person')
+
+class ArchivedAttendance(db.Model):
+    # Cold store for attendance of ended meetings, moved out of the live
+    # attendance table by end_current_meeting_session().
+    __tablename__ = 'archived_attendance'
+    __table_args__ = (
+        db.Index('ix_archived_attendance_session', 'meeting_session_id', 'id'),
+        db.Index('ix_archived_attendance_session_time', 'meeting_session_id', 'timestamp', 'id'),
+        db.Index('ix_archived_attendance_person', 'person_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    zone = db.Column(db.String(50), nullable=False)
+    group_name = db.Column(db.String(100), nullable=False)
+    church = db.Column(db.String(200), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), nullable=True)
+    
+    # Relationships
+    meeting_session = db.relationship('MeetingSession', backref='archived_attendees')
+    person = db.relationship('Person')
 
 class MeetingLocation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -44,4 +103,61 @@ class MeetingLocation(db.Model):
     longitude = db.Column(db.Float, nullable=False)
     radius_meters = db.Column(db.Integer, default=30)
     is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class AttendanceCounter(db.Model):
+    # Running per-session totals kept in step with the attendance table
+    meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)  # total, zone, group, category
+    value = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class SessionRollup(db.Model):
+    # Analytics summary of an ended meeting, written by analytics.rollup_session()
+    __tablename__ = 'session_rollup'
+
+    meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), primary_key=True)
+    meeting_date = db.Column(db.Date, nullable=False, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+    total = db.Column(db.Integer, nullable=False, default=0)  # attendance rows
+    first_timers = db.Column(db.Integer, nullable=False, default=0)  # phones never seen at an earlier meeting
+    returning_attendees = db.Column(db.Integer, nullable=False, default=0)
+
+class DimensionRollup(db.Model):
+    # Attendance of an ended meeting per zone, group, category and church
+    __tablename__ = 'dimension_rollup'
+    __table_args__ = (
+        db.Index('ix_dimension_rollup_dimension', 'dimension', 'meeting_session_id'),
+    )
+
+    meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), primary_key=True)
+    dimension = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(200), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class CohortRollup(db.Model):
+    # Attendees of a meeting counted by the meeting they first came to
+    __tablename__ = 'cohort_rollup'
+    __table_args__ = (
+        db.Index('ix_cohort_rollup_cohort', 'cohort_session_id', 'meeting_session_id'),
+    )
+
+    meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), primary_key=True)
+    cohort_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class AttendeeFirstVisit(db.Model):
+    # The earliest ended meeting each normalized phone number attended
+    __tablename__ = 'attendee_first_visit'
+
+    phone = db.Column(db.String(20), primary_key=True)
+    meeting_session_id = db.Column(db.Integer, db.ForeignKey('meeting_session.id'), nullable=False, index=True)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+class SchemaVersion(db.Model):
+    # One row per migration applied to this database (migrations.py)
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=db.func.current_timestamp())
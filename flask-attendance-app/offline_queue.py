@@ -0,0 +1,126 @@
+"""Replays sign-ins that phones queued while the venue network was down.
+
+The service worker keeps a submission it could not deliver (no connection,
+a gateway error, or the server shedding load) in IndexedDB and later posts
+the queue here in batches. Each record carries the meeting session its form
+was opened for and how many seconds ago it was filled in, measured on the
+phone's own clock, so the recorded time does not depend on that clock being
+right.
+
+Records go through ``bulk_import`` like an uploaded sheet, after the same
+registry fill-in the form gets, so a returning attendee's short sign-in
+(phone and last name) replays as it would have saved online. For the active
+meeting, repeats are first checked against the in-memory duplicate index
+instead of reading every registered phone number for each small batch.
+"""
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+import bulk_import
+import geofence
+import people
+from database import db
+from duplicates import duplicate_index
+from models import MeetingSession
+
+# Allowance for the time a batch spends on the wire, which the phone's age
+# figure does not include
+CLOCK_SLACK = timedelta(minutes=5)
+
+
+def _session_problem(meeting_session, timestamp):
+    if meeting_session is None:
+        return 'meeting not found'
+    if timestamp < meeting_session.start_time - CLOCK_SLACK:
+        # Filled in before this session began: a form for an older meeting
+        return 'form is from an earlier meeting'
+    if not meeting_session.is_active:
+        grace = timedelta(hours=current_app.config['OFFLINE_SYNC_GRACE_HOURS'])
+        # end_time is written in local time (see end_meeting)
+        if meeting_session.end_time is None or datetime.now() > meeting_session.end_time + grace:
+            return 'meeting has ended'
+    return None
+
+
+def _location_problem(fence, raw):
+    try:
+        lat, lon = geofence.parse_coordinates(raw.get('latitude'), raw.get('longitude'))
+    except ValueError:
+        return 'location is required for this meeting'
+    if not fence.contains(lat, lon):
+        return f'signed in {fence.distance(lat, lon):.0f}m from the meeting location'
+    return None
+
+
+def _fill_in(raw):
+    """Complete a short sign-in from the registry, as ``submit_attendance`` does"""
+    phone = str(raw.get('phone') or '').strip()
+    details = {field: str(raw.get(field) or '').strip() for field in people.PREFILL_FIELDS}
+    if phone and not all(details.values()):
+        raw.update(people.fill_in(phone, details))
+    return raw
+
+
+def _result(record, status, errors=()):
+    return {'client_id': record.get('client_id'), 'status': status, 'errors': list(errors)}
+
+
+def replay(records, batch_size):
+    """Save a batch of queued records; returns one result per record, in order.
+
+    A result's status is ``saved``, ``duplicate`` or ``rejected`` (with the
+    reasons); every record gets one, so the phone can drop the whole batch.
+    """
+    # Naive UTC to the second, like CURRENT_TIMESTAMP
+    now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    results = [None] * len(records)
+    by_session = {}
+    for n, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[n] = _result({}, 'rejected', ['not an object'])
+            continue
+        try:
+            session_id = int(record.get('meeting_session_id'))
+            age = max(float(record.get('age_seconds') or 0), 0.0)
+        except (TypeError, ValueError):
+            results[n] = _result(record, 'rejected', ['meeting not found'])
+            continue
+        by_session.setdefault(session_id, []).append((n, now - timedelta(seconds=round(age))))
+
+    for session_id, queued in by_session.items():
+        meeting_session = db.session.get(MeetingSession, session_id)
+        fence = None
+        if current_app.config['GEOFENCE_ENFORCE'] and meeting_session is not None and meeting_session.location:
+            fence = geofence.Geofence.for_location(meeting_session.location)
+        use_index = meeting_session is not None and meeting_session.is_active \
+            and current_app.config['DUPLICATE_INDEX']
+
+        rows = []
+        for n, timestamp in queued:
+            record = records[n]
+            problem = _session_problem(meeting_session, timestamp)
+            if problem is None and fence is not None:
+                problem = _location_problem(fence, record)
+            if problem:
+                results[n] = _result(record, 'rejected', [problem])
+            elif use_index and duplicate_index.check(meeting_session, record.get('phone'), record.get('email')):
+                results[n] = _result(record, 'duplicate', ['phone or email already registered'])
+            else:
+                # read_records maps the form's field names onto columns
+                _, raw = next(bulk_import.read_records([record]))
+                raw['timestamp'] = timestamp
+                rows.append((n, _fill_in(raw)))
+        if not rows:
+            continue
+
+        report = bulk_import.import_rows(meeting_session, rows, batch_size,
+                                         existing_keys=(set(), set()) if use_index else None)
+        rejected = {error['row']: error for error in report['errors']}
+        for n, _ in rows:
+            error = rejected.get(n)
+            if error is None:
+                results[n] = _result(records[n], 'saved')
+            else:
+                results[n] = _result(records[n], 'duplicate' if error['duplicate'] else 'rejected', error['errors'])
+    return results
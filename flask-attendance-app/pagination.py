@@ -0,0 +1,38 @@
+"""Opaque cursors for keyset (seek) pagination.
+
+A cursor carries the sort-key values of the last row on a page. The next
+page is fetched with ``WHERE key < cursor`` (or ``>``) over an index, so
+every page costs the same however deep into the list it is.
+"""
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values):
+    """Pack the sort-key values of the last row on a page into a URL-safe token"""
+    packed = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(packed, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """Unpack a cursor, converting each value with the matching callable.
+
+    Raises ValueError for anything that is not a cursor we produced.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError('Invalid cursor')
+    try:
+        return [convert(v) for convert, v in zip(types, values)]
+    except (ValueError, TypeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value)
@@ -0,0 +1,199 @@
+"""Parquet tier for the attendance of meetings ended long ago.
+
+Once a meeting has been over for ``ARCHIVE_RETENTION_DAYS`` (and past the
+offline sync grace period, so no queued sign-in can still arrive), its rows
+are moved out of ``archived_attendance`` into one compressed Parquet file
+per meeting in ``ARCHIVE_DIR``, and the session records the file's name. The
+SQLite database then only holds recent attendance, while the per-session
+counters and analytics rollups stay in SQLite as before.
+
+Readers ask for the columns they need and get a DataFrame: the file's rows,
+read with only those columns, plus any rows imported into the meeting since
+(they wait in SQLite until the next offload merges them in). Names and
+contacts are joined from the person registry, as for rows in SQLite.
+
+A new file is written for every offload and swapped in by the same commit
+that deletes the rows it holds, so a crash part way leaves either the old
+file and the rows, or the new file alone, never both. Needs pyarrow
+(pinned in requirements.txt); without it the app logs an error at startup
+and meetings stay in SQLite. pandas is imported on first use.
+"""
+import importlib.util
+import os
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, exists, select
+
+from database import db
+from models import ArchivedAttendance, MeetingSession, Person
+
+# Columns kept in each meeting's file, in file order
+FILE_COLUMNS = [
+    'id', 'person_id', 'timestamp', 'latitude', 'longitude',
+    'zone', 'group_name', 'church', 'category',
+]
+
+# Columns readers can ask for that come from the person registry
+PERSON_COLUMNS = ['firstname', 'lastname', 'surname', 'email', 'phone']
+
+# People looked up per IN (...) query
+LOOKUP_CHUNK = 500
+
+
+def available():
+    """Whether a Parquet engine is installed, without paying for importing it"""
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def directory():
+    return current_app.config['ARCHIVE_DIR'] or os.path.join(current_app.instance_path, 'archive')
+
+
+def offloaded(meeting_session):
+    """Whether some of a meeting's attendance is in the Parquet tier"""
+    return bool(meeting_session.archive_file)
+
+
+def _path(name):
+    return os.path.join(directory(), name)
+
+
+def read_file(meeting_session, columns):
+    """The ``columns`` of a meeting's Parquet file as a DataFrame (no rows if it has none)"""
+    import pandas as pd
+    if not offloaded(meeting_session):
+        return pd.DataFrame(columns=columns)
+    return pd.read_parquet(_path(meeting_session.archive_file), columns=columns)
+
+
+def _sqlite_rows(session_id, columns):
+    import pandas as pd
+    stmt = select(*[getattr(ArchivedAttendance, c) for c in columns]).where(
+        ArchivedAttendance.meeting_session_id == session_id).order_by(ArchivedAttendance.id)
+    return pd.DataFrame(db.session.connection().execute(stmt).all(), columns=columns)
+
+
+def people_frame(person_ids, columns):
+    """Person registry ``columns`` for these ids, indexed by person id"""
+    import pandas as pd
+    person_ids = [int(i) for i in person_ids]
+    rows = []
+    for i in range(0, len(person_ids), LOOKUP_CHUNK):
+        rows.extend(db.session.connection().execute(
+            select(Person.id, *[getattr(Person, c) for c in columns])
+            .where(Person.id.in_(person_ids[i:i + LOOKUP_CHUNK]))).all())
+    return pd.DataFrame(rows, columns=['person_id'] + columns).set_index('person_id')
+
+
+def session_frame(meeting_session, columns):
+    """A meeting's archived attendance as a DataFrame of ``columns``, from its file and from SQLite.
+
+    ``columns`` may include FILE_COLUMNS and PERSON_COLUMNS. Rows come in
+    file order, then rows added since in id order.
+    """
+    import pandas as pd
+    own = [c for c in FILE_COLUMNS if c in columns]
+    person = [c for c in PERSON_COLUMNS if c in columns]
+    read = own + (['person_id'] if person and 'person_id' not in own else [])
+    frames = [read_file(meeting_session, read), _sqlite_rows(meeting_session.id, read)]
+    frame = pd.concat([f for f in frames if len(f)], ignore_index=True) if any(len(f) for f in frames) \
+        else frames[0]
+    if person:
+        people = people_frame(frame['person_id'].unique(), person)
+        frame = frame.join(people, on='person_id')
+    return frame[columns]
+
+
+def rows(frame):
+    """A frame's rows as named tuples of plain Python values, None where missing"""
+    return frame.astype(object).where(frame.notna(), None).itertuples(index=False, name='Row')
+
+
+def count():
+    """Attendance rows held in Parquet files"""
+    import pyarrow.parquet as pq
+    return sum(pq.read_metadata(_path(name)).num_rows for (name,) in db.session.execute(
+        select(MeetingSession.archive_file).where(MeetingSession.archive_file.isnot(None))))
+
+
+def _write(frame, name):
+    os.makedirs(directory(), exist_ok=True)
+    path = _path(name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    frame.to_parquet(tmp_path, engine='pyarrow', index=False,
+                     compression=current_app.config['ARCHIVE_COMPRESSION'])
+    os.replace(tmp_path, path)
+
+
+def _remove(name):
+    try:
+        os.remove(_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def offload(meeting_session):
+    """Move a meeting's rows from SQLite into a new Parquet file, and commit; returns the rows moved"""
+    import pandas as pd
+    new = _sqlite_rows(meeting_session.id, FILE_COLUMNS)
+    if new.empty:
+        return 0
+    old_name = meeting_session.archive_file
+    frame = pd.concat([read_file(meeting_session, FILE_COLUMNS), new], ignore_index=True) if old_name else new
+    frame = frame.astype({'id': 'int64', 'person_id': 'int64', 'latitude': 'float64', 'longitude': 'float64'})
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+
+    name = f"session-{meeting_session.id}-{datetime.now():%Y%m%d%H%M%S%f}.parquet"
+    _write(frame, name)
+    try:
+        db.session.execute(delete(ArchivedAttendance).where(
+            ArchivedAttendance.meeting_session_id == meeting_session.id,
+            ArchivedAttendance.id <= int(new['id'].max())))
+        meeting_session.archive_file = name
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _remove(name)
+        raise
+    if old_name:
+        _remove(old_name)
+    return len(new)
+
+
+def due(now=None):
+    """Ended meetings whose rows in SQLite are old enough to move into Parquet"""
+    config = current_app.config
+    keep = max(timedelta(days=config['ARCHIVE_RETENTION_DAYS']),
+               timedelta(hours=config['OFFLINE_SYNC_GRACE_HOURS']))
+    cutoff = (now or datetime.now()) - keep
+    return MeetingSession.query.filter(
+        MeetingSession.is_active == False,
+        MeetingSession.end_time < cutoff,
+        exists().where(ArchivedAttendance.meeting_session_id == MeetingSession.id),
+    ).order_by(MeetingSession.end_time, MeetingSession.id).all()
+
+
+def offload_due(log=None):
+    """Move every meeting past the retention period into Parquet, one commit each; returns (meetings, rows)"""
+    if not available():
+        raise RuntimeError('The Parquet archive needs pyarrow (pip install pyarrow).')
+    meetings = moved = 0
+    for meeting_session in due():
+        n = offload(meeting_session)
+        meetings += 1
+        moved += n
+        if log:
+            log(f'{meeting_session.meeting_name} (session {meeting_session.id}): {n} rows moved to Parquet.')
+    return meetings, moved
+
+
+def discard(name=None):
+    """Delete the Parquet file of a deleted meeting (its archive_file), or every file"""
+    if name is not None:
+        _remove(name)
+        return
+    if os.path.isdir(directory()):
+        for name in os.listdir(directory()):
+            if name.endswith('.parquet'):
+                _remove(name)
@@ -0,0 +1,193 @@
+"""Registry of attendees, one ``person`` row per normalized phone number.
+
+Attendance rows, live and archived, point at a person instead of repeating
+their names, email and phone, so each sign-in is a compact event: person,
+meeting, time, position, plus the zone, group, church and category given for
+that meeting. The first sign-in under a phone number files the person's
+details; later ones only fill in what is still blank. Anyone can type any
+number, and exports show every past meeting's names from here, so a typo'd or
+borrowed number must not rename the person it belongs to. The attendance form
+looks a phone number up to greet a returning attendee, who can then sign in
+with their phone number and last name alone.
+"""
+from sqlalchemy import func, inspect, text
+from sqlalchemy.dialects.sqlite import insert
+
+from database import db
+from duplicates import normalize_phone
+from models import ArchivedAttendance, Attendance, Person
+
+# Attendance fields kept on the person rather than on each attendance row
+IDENTITY_FIELDS = ['firstname', 'lastname', 'surname', 'email', 'phone']
+
+# Person columns a sign-in fills in
+DETAIL_FIELDS = ['firstname', 'lastname', 'surname', 'email', 'zone', 'group_name', 'church', 'category']
+
+# Details a returning attendee may leave out of a sign-in
+PREFILL_FIELDS = ['firstname', 'lastname', 'surname', 'zone', 'group_name', 'church', 'category']
+
+# People upserted per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK = 500
+
+
+def phone_key(phone):
+    """The phone number a person is filed under"""
+    return normalize_phone(phone) or (phone or '').strip()
+
+
+def _upsert_statement(rows):
+    stmt = insert(Person).values(rows)
+    excluded = stmt.excluded
+    # Details on file win; a sign-in only supplies the ones that are blank
+    updates = {field: func.coalesce(func.nullif(getattr(Person, field), ''), getattr(excluded, field))
+               for field in DETAIL_FIELDS}
+    updates['updated_at'] = func.current_timestamp()
+    return stmt.on_conflict_do_update(index_elements=['phone'], set_=updates)
+
+
+def _person_values(values):
+    row = {field: values.get(field) for field in DETAIL_FIELDS}
+    row['email'] = row['email'] or None
+    row['phone'] = phone_key(values.get('phone'))
+    return row
+
+
+def upsert(values):
+    """Create or update the person a sign-in belongs to; returns their id"""
+    return db.session.execute(
+        _upsert_statement([_person_values(values)]).returning(Person.id)
+    ).scalar_one()
+
+
+def upsert_many(rows):
+    """Upsert the people of many attendance rows; returns {phone key: person id}"""
+    people = {}
+    for values in rows:
+        person = _person_values(values)
+        people[person['phone']] = person
+    people = list(people.values())
+    ids = {}
+    for i in range(0, len(people), UPSERT_CHUNK):
+        result = db.session.execute(
+            _upsert_statement(people[i:i + UPSERT_CHUNK]).returning(Person.id, Person.phone))
+        ids.update({phone: person_id for person_id, phone in result})
+    return ids
+
+
+def attach(rows):
+    """Swap attendance rows' names, email and phone for a person_id, upserting the people"""
+    ids = upsert_many(rows)
+    return [
+        dict({k: v for k, v in values.items() if k not in IDENTITY_FIELDS},
+             person_id=ids[phone_key(values.get('phone'))])
+        for values in rows
+    ]
+
+
+def lookup(phone):
+    """The person filed under a phone number, or None"""
+    key = normalize_phone(phone)
+    if not key:
+        return None
+    return Person.query.filter_by(phone=key).first()
+
+
+def prefill(person):
+    """The details a returning attendee's sign-in is completed with"""
+    return {field: getattr(person, field) or '' for field in PREFILL_FIELDS}
+
+
+def greeting(person):
+    """What a phone lookup shows: enough for the attendee to recognise, not to sign in as them"""
+    return {'firstname': person.firstname, 'lastname_initial': (person.lastname or '')[:1].upper()}
+
+
+def _same_name(a, b):
+    return ' '.join((a or '').split()).casefold() == ' '.join((b or '').split()).casefold()
+
+
+def fill_in(phone, details):
+    """Complete the blank ``details`` of a sign-in from the person filed under ``phone``.
+
+    Only if the last name given matches theirs: anyone can type a phone
+    number, and the lookup shows only the first name. Otherwise the details
+    come back as they were.
+    """
+    person = lookup(phone)
+    if person is None or not details.get('lastname') or not _same_name(details['lastname'], person.lastname):
+        return details
+    known = prefill(person)
+    return {field: value or known.get(field, '') for field, value in details.items()}
+
+
+# --- Converting databases created before the registry ---
+
+# Columns of the compact tables copied across from the old ones
+_EVENT_COLUMNS = ['id', 'timestamp', 'latitude', 'longitude', 'zone', 'group_name', 'church',
+                  'category', 'meeting_session_id']
+
+
+def _legacy_tables():
+    inspector = inspect(db.engine)
+    tables = []
+    for model in (ArchivedAttendance, Attendance):
+        name = model.__tablename__
+        columns = {c['name'] for c in inspector.get_columns(name)} if inspector.has_table(name) else set()
+        if 'phone' in columns and 'person_id' not in columns:
+            tables.append(model)
+    return tables
+
+
+def migrate_legacy_tables():
+    """Move names, emails and phones out of old attendance tables into the registry.
+
+    Each table is rebuilt in the compact layout, keeping its row ids. Where
+    one person has several rows, their earliest details are kept and later
+    rows only fill in blanks, the same rule ``upsert`` applies to sign-ins.
+    Returns the number of tables converted.
+    """
+    tables = _legacy_tables()
+    if not tables:
+        return 0
+
+    # Archive first and each table oldest first, so the earliest details are filed
+    first = {}
+    raw_phones = set()
+    for model in tables:
+        result = db.session.execute(text(
+            f'SELECT {", ".join(IDENTITY_FIELDS + ["zone", "group_name", "church", "category"])} '
+            f'FROM {model.__tablename__} ORDER BY timestamp, id').execution_options(yield_per=5000))
+        for row in result:
+            values = dict(row._mapping)
+            key = phone_key(values['phone'])
+            filed = first.setdefault(key, values)
+            for field, value in values.items():
+                if not filed[field]:
+                    filed[field] = value
+            raw_phones.add(values['phone'])
+    ids = upsert_many(first.values())
+
+    db.session.execute(text('CREATE TEMP TABLE legacy_phone (phone TEXT PRIMARY KEY, person_id INTEGER NOT NULL)'))
+    db.session.execute(text('INSERT INTO legacy_phone VALUES (:phone, :person_id)'), [
+        {'phone': phone, 'person_id': ids[phone_key(phone)]} for phone in raw_phones
+    ])
+
+    for model in tables:
+        table = model.__table__
+        name = table.name
+        columns = _EVENT_COLUMNS + (['is_archived'] if 'is_archived' in table.c else [])
+        for index in table.indexes:
+            db.session.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+        db.session.execute(text(f'ALTER TABLE {name} RENAME TO {name}_legacy'))
+        table.create(db.session.connection())
+        # OR IGNORE: two spellings of one number in the live table become
+        # the same person, who can only be signed in to a meeting once
+        db.session.execute(text(
+            f'INSERT OR IGNORE INTO {name} ({", ".join(columns)}, person_id) '
+            f'SELECT {", ".join("l." + c for c in columns)}, p.person_id '
+            f'FROM {name}_legacy l JOIN legacy_phone p ON p.phone = l.phone'))
+        db.session.execute(text(f'DROP TABLE {name}_legacy'))
+
+    db.session.execute(text('DROP TABLE legacy_phone'))
+    db.session.commit()
+    return len(tables)
@@ -0,0 +1,104 @@
+"""Pre-rendered, cached QR code images for the attendance form URL.
+
+A QR image only depends on the URL it encodes, its size and its format, so
+each combination is rendered once, kept in a small in-memory LRU and written
+to ``instance/qr_cache`` for the other workers and for restarts. The cache
+key doubles as a strong ETag, so repeat loads from the admin page and
+projector screens come back as 304s.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# Named sizes -> pixels (PNG) or millimetres (SVG) per QR module
+SIZES = {
+    'screen': 10,
+    'print': 20,
+    'poster': 40,
+}
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# Rendered images kept in memory per worker
+MEMORY_ENTRIES = 32
+
+
+def render(url, size, fmt):
+    """Render the QR code for ``url`` as PNG or SVG bytes"""
+    # qrcode (and Pillow for PNG) only load once a code actually has to be drawn
+    import qrcode
+    import qrcode.image.svg
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=SIZES[size],
+        border=4,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    if fmt == 'svg':
+        # Vector output straight from the module matrix, no raster step
+        return qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).to_string()
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    img_io = io.BytesIO()
+    img.save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+class QRCodeCache:
+    def __init__(self, app=None):
+        self._cache_dir = None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._cache_dir = os.path.join(app.instance_path, 'qr_cache')
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(url, size, fmt):
+        return hashlib.sha256(f'{url}|{size}|{fmt}'.encode()).hexdigest()
+
+    def get(self, url, size='screen', fmt='png'):
+        """Return (image bytes, etag), rendering only on a cache miss"""
+        key = self.key(url, size, fmt)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data, key
+
+        path = os.path.join(self._cache_dir, f'{key}.{fmt}')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = render(url, size, fmt)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self._memory[key] = data
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+        return data, key
+
+    def prerender(self, url):
+        """Render every size and format for ``url`` ahead of the first request"""
+        for size in SIZES:
+            for fmt in FORMATS:
+                self.get(url, size, fmt)
+
+
+qr_cache = QRCodeCache()
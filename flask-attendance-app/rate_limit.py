@@ -0,0 +1,30 @@
+"""Per-client request limits for the public endpoints, counted in each worker.
+
+Requests are counted per client key in fixed windows; when a new window
+starts every count is dropped, so memory stays bounded by the clients seen
+in one window. Each gunicorn worker counts on its own, so a client can make
+up to workers x limit requests per window in all.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+    def __init__(self, window_seconds=60):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._window = None
+        self._counts = {}
+
+    def allow(self, key, limit):
+        """Count a request from ``key``; False once it has made ``limit`` this window"""
+        window = int(time.monotonic() // self.window_seconds)
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._counts = {}
+            count = self._counts.get(key, 0)
+            if count >= limit:
+                return False
+            self._counts[key] = count + 1
+            return True
@@ -1,19 +1,214 @@
+// Attendance Tracker service worker.
+//
+// Pages are fetched from the network first and fall back to the cache, so the
+// attendance form still opens when the venue Wi-Fi is down. A sign-in that
+// cannot be delivered (no connection, a gateway error, or the server too busy)
+// is kept in IndexedDB and posted to /api/attendance/batch in batches once the
+// connection is back.
+
+const CACHE = 'attendance-cache-v2';
+const PAGES = ['/', '/attendance', '/queued', '/about'];
+const ASSETS = [
+  '/static/manifest.json',
+  '/static/icons/icon-192.png',
+  '/static/icons/icon-512.png',
+];
+
+const QUEUE_DB = 'attendance-queue';
+const QUEUE_STORE = 'submissions';
+const SYNC_TAG = 'attendance-queue';
+const BATCH_SIZE = 50;               // records per /api/attendance/batch request
+const SUBMIT_TIMEOUT_MS = 15000;     // give up on a stalled submission and queue it
+
 self.addEventListener('install', function(e) {
   e.waitUntil(
-    caches.open('attendance-cache').then(function(cache) {
-      return cache.addAll([
-        '/',
-        '/static/manifest.json',
-        // Add other static assets if needed
-      ]);
+    caches.open(CACHE).then(function(cache) {
+      // One at a time, so a page that is unavailable right now (no meeting
+      // running) does not stop the rest from being cached
+      return Promise.all(PAGES.concat(ASSETS).map(function(url) {
+        return fetch(url, { headers: { 'X-Service-Worker': '1' }, redirect: 'manual' })
+          .then(function(response) {
+            if (response.ok) return cache.put(url, response);
+          })
+          .catch(function() {});
+      }));
+    }).then(function() {
+      return self.skipWaiting();
     })
   );
 });
 
-self.addEventListener('fetch', function(e) {
-  e.respondWith(
-    caches.match(e.request).then(function(response) {
-      return response || fetch(e.request);
+self.addEventListener('activate', function(e) {
+  e.waitUntil(
+    caches.keys().then(function(keys) {
+      return Promise.all(keys.filter(function(key) { return key !== CACHE; }).map(function(key) {
+        return caches.delete(key);
+      }));
+    }).then(function() {
+      return self.clients.claim();
+    }).then(function() {
+      return flushQueue().catch(function() {});
     })
   );
 });
+
+self.addEventListener('fetch', function(e) {
+  const url = new URL(e.request.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (e.request.method === 'POST' && url.pathname === '/submit-attendance') {
+    e.respondWith(submitOrQueue(e));
+  } else if (e.request.method === 'GET' && e.request.mode === 'navigate') {
+    e.respondWith(networkFirst(e.request, url));
+  } else if (e.request.method === 'GET' && url.pathname.startsWith('/static/')) {
+    e.respondWith(
+      caches.match(e.request).then(function(response) {
+        return response || fetch(e.request);
+      })
+    );
+  }
+  // Everything else (admin pages, the API, the live stream) goes straight to the network
+});
+
+self.addEventListener('sync', function(e) {
+  if (e.tag === SYNC_TAG) e.waitUntil(flushQueue());
+});
+
+self.addEventListener('message', function(e) {
+  if (e.data === 'flush-queue') {
+    e.waitUntil(flushQueue().catch(function() {}).then(broadcastStatus));
+  } else if (e.data === 'queue-status') {
+    e.waitUntil(broadcastStatus());
+  }
+});
+
+function networkFirst(request, url) {
+  return fetch(request).then(function(response) {
+    if (response.ok && !response.redirected && PAGES.indexOf(url.pathname) !== -1) {
+      const copy = response.clone();
+      caches.open(CACHE).then(function(cache) { cache.put(url.pathname, copy); });
+    }
+    return response;
+  }).catch(function() {
+    return caches.match(url.pathname).then(function(response) {
+      return response || caches.match('/');
+    });
+  });
+}
+
+function fetchWithTimeout(url, options, ms) {
+  const controller = new AbortController();
+  const timer = setTimeout(function() { controller.abort(); }, ms);
+  options.signal = controller.signal;
+  return fetch(url, options).finally(function() { clearTimeout(timer); });
+}
+
+async function submitOrQueue(e) {
+  const form = await e.request.clone().formData();
+  try {
+    const response = await fetchWithTimeout('/submit-attendance', {
+      method: 'POST',
+      body: new URLSearchParams(form),
+      credentials: 'same-origin',
+      redirect: 'manual',
+      headers: { 'X-Service-Worker': '1' },
+    }, SUBMIT_TIMEOUT_MS);
+    if (response.status < 500) {
+      // The network is up: a good moment to send anything queued earlier
+      e.waitUntil(flushQueue().catch(function() {}));
+      return response;
+    }
+  } catch (err) {
+    // Offline, or the request stalled
+  }
+  await enqueue(form);
+  if (self.registration.sync) {
+    self.registration.sync.register(SYNC_TAG).catch(function() {});
+  }
+  return Response.redirect('/queued', 303);
+}
+
+// --- IndexedDB queue ---
+
+function openQueue() {
+  return new Promise(function(resolve, reject) {
+    const request = indexedDB.open(QUEUE_DB, 1);
+    request.onupgradeneeded = function() {
+      request.result.createObjectStore(QUEUE_STORE, { keyPath: 'client_id', autoIncrement: true });
+    };
+    request.onsuccess = function() { resolve(request.result); };
+    request.onerror = function() { reject(request.error); };
+  });
+}
+
+function withStore(mode, fn) {
+  return openQueue().then(function(db) {
+    return new Promise(function(resolve, reject) {
+      const tx = db.transaction(QUEUE_STORE, mode);
+      const request = fn(tx.objectStore(QUEUE_STORE));
+      tx.oncomplete = function() { db.close(); resolve(request ? request.result : undefined); };
+      tx.onerror = function() { db.close(); reject(tx.error); };
+    });
+  });
+}
+
+function enqueue(form) {
+  const record = {};
+  form.forEach(function(value, key) { record[key] = value; });
+  record.queued_at = Date.now();
+  return withStore('readwrite', function(store) { return store.add(record); });
+}
+
+function readQueue(limit) {
+  return withStore('readonly', function(store) { return store.getAll(undefined, limit); });
+}
+
+function removeFromQueue(ids) {
+  return withStore('readwrite', function(store) {
+    ids.forEach(function(id) { store.delete(id); });
+  });
+}
+
+function queueLength() {
+  return withStore('readonly', function(store) { return store.count(); });
+}
+
+// --- Replay ---
+
+let flushing = null;
+let lastResults = [];
+
+function flushQueue() {
+  // One replay at a time, however many triggers fire together
+  if (!flushing) {
+    flushing = sendQueued().finally(function() { flushing = null; });
+  }
+  return flushing;
+}
+
+async function sendQueued() {
+  for (;;) {
+    const batch = await readQueue(BATCH_SIZE);
+    if (!batch.length) return;
+    const now = Date.now();
+    const records = batch.map(function(record) {
+      // Age by this phone's clock, so a wrong clock does not skew the time recorded
+      return Object.assign({}, record, { age_seconds: (now - record.queued_at) / 1000 });
+    });
+    const response = await fetch('/api/attendance/batch', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ records: records }),
+    });
+    if (!response.ok) throw new Error('Batch not accepted: ' + response.status);
+    const results = (await response.json()).results;
+    await removeFromQueue(results.map(function(result) { return result.client_id; }));
+    lastResults = lastResults.concat(results);
+  }
+}
+
+async function broadcastStatus() {
+  const status = { type: 'queue-status', pending: await queueLength(), results: lastResults };
+  const clients = await self.clients.matchAll({ type: 'window' });
+  clients.forEach(function(client) { client.postMessage(status); });
+}
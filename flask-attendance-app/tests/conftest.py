@@ -0,0 +1,88 @@
+"""Shared fixtures: the app on a throwaway SQLite database.
+
+The app reads its settings from the environment when it is imported, so they
+are set here first. Every test starts from an empty database at the latest
+schema version.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+_TMP = tempfile.mkdtemp(prefix='attendance-tests-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_TMP, 'test.db')}",
+    EXPORT_DIR=os.path.join(_TMP, 'exports'),
+    ARCHIVE_DIR=os.path.join(_TMP, 'archive'),
+    AUTO_MIGRATE='0',
+    EXPORT_MODE='inline',
+    INGEST_MODE='direct',
+    METRICS_ENABLED='0',
+)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+def drop_all_tables():
+    """Drop every table, including ones the models no longer declare"""
+    from sqlalchemy import inspect, text
+    from database import db
+    db.session.remove()
+    with db.engine.begin() as connection:
+        for name in inspect(connection).get_table_names():
+            connection.execute(text(f'DROP TABLE "{name}"'))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    import app as app_module
+    import migrations
+    from duplicates import DuplicateIndex
+    from meeting_cache import active_meeting_cache
+
+    flask_app = app_module.app
+    with flask_app.app_context():
+        drop_all_tables()
+        migrations.upgrade(log=lambda message: None)
+    active_meeting_cache.invalidate()
+    # Session ids and start times repeat across tests, so start each with its own index
+    monkeypatch.setattr(app_module, 'duplicate_index', DuplicateIndex())
+    monkeypatch.setitem(flask_app.config, 'INGEST_MODE', 'direct')
+    yield flask_app
+    with flask_app.app_context():
+        app_module.db.session.remove()
+    active_meeting_cache.invalidate()
+
+
+@pytest.fixture
+def admin(app):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['admin_logged_in'] = True
+    return client
+
+
+@pytest.fixture
+def meeting(app, admin):
+    """An active meeting at a 30 m location; returns its session id"""
+    from meeting_cache import active_meeting_cache
+    admin.post('/save-location', data={'name': 'Hall', 'latitude': '9.0', 'longitude': '7.4', 'radius': '30'})
+    with app.app_context():
+        return active_meeting_cache.session().id
+
+
+def sign_in(client, phone, email='', **fields):
+    """Submit the attendance form; returns the response"""
+    data = {
+        'firstname': 'Ada', 'lastname': 'Obi', 'surname': 'Eze', 'phone': phone, 'email': email,
+        'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Grace', 'category': 'Member',
+    }
+    data.update(fields)
+    return client.post('/submit-attendance', data=data)
@@ -0,0 +1,49 @@
+"""Bulk imports skip people already signed in to the target meeting only."""
+import pytest
+
+import bulk_import
+import counters
+import people
+from database import db
+from models import Attendance, MeetingSession
+
+
+def live_row(session_id, phone):
+    return {'firstname': 'Ada', 'lastname': 'Obi', 'surname': 'Eze', 'phone': phone, 'email': None,
+            'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Grace', 'category': 'Member',
+            'meeting_session_id': session_id}
+
+
+def test_import_ignores_other_sessions_live_rows(app, meeting):
+    with app.app_context():
+        # A row left in the live table by another meeting
+        other = MeetingSession(meeting_name='Other', is_active=False)
+        db.session.add(other)
+        db.session.flush()
+        db.session.execute(Attendance.__table__.insert(), people.attach([
+            live_row(other.id, '08031111111'), live_row(meeting, '08032222222')]))
+        db.session.commit()
+
+        rows = [dict(live_row(meeting, phone), timestamp='') for phone in ('08031111111', '08032222222')]
+        report = bulk_import.import_rows(db.session.get(MeetingSession, meeting), list(enumerate(rows, 2)), 100)
+        assert report['imported'] == 1
+        assert report['duplicates'] == 1
+        assert Attendance.query.filter_by(meeting_session_id=meeting).count() == 2
+
+
+def test_row_at_a_time_fallback_commits_with_the_counters(app, meeting, monkeypatch):
+    with app.app_context():
+        db.session.execute(Attendance.__table__.insert(), people.attach([live_row(meeting, '08032222222')]))
+        db.session.commit()
+
+        def broken(rows):
+            raise RuntimeError('counter update failed')
+        monkeypatch.setattr(counters, 'rows_added', broken)
+        # Keys not read from the table, so the repeat reaches the insert and
+        # the batch falls back to one savepoint per row
+        rows = [dict(live_row(meeting, phone), timestamp='') for phone in ('08031111111', '08032222222')]
+        with pytest.raises(RuntimeError):
+            bulk_import.import_rows(db.session.get(MeetingSession, meeting), list(enumerate(rows, 2)), 100,
+                                    existing_keys=(set(), set()))
+        db.session.rollback()
+        assert Attendance.query.filter_by(meeting_session_id=meeting).count() == 1
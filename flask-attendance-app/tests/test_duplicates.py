@@ -0,0 +1,52 @@
+"""Repeat sign-ins are turned away by the duplicate index before any write."""
+from conftest import sign_in
+
+import people
+from database import db
+from models import Attendance
+
+
+def signed_in(app):
+    with app.app_context():
+        return Attendance.query.count()
+
+
+def test_repeat_phone_in_another_spelling(app, meeting):
+    client = app.test_client()
+    assert '/success' in sign_in(client, '08031234567').location
+    response = sign_in(client, '+234 803 123 4567', firstname='Someone', lastname='Else')
+    assert response.location.endswith('/attendance')
+    assert signed_in(app) == 1
+
+
+def test_repeat_email_in_another_case(app, meeting):
+    client = app.test_client()
+    assert '/success' in sign_in(client, '08031234567', email='ada@example.com').location
+    response = sign_in(client, '08039999999', email=' ADA@Example.com ')
+    assert response.location.endswith('/attendance')
+    assert signed_in(app) == 1
+
+
+def test_index_catches_up_on_other_workers(app, meeting):
+    # A row written by another worker, which this worker's index has not seen
+    with app.app_context():
+        row = {'firstname': 'Ada', 'lastname': 'Obi', 'surname': 'Eze', 'phone': '08031234567', 'email': None,
+               'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Grace', 'category': 'Member',
+               'meeting_session_id': meeting}
+        db.session.execute(Attendance.__table__.insert(), people.attach([row]))
+        db.session.commit()
+    client = app.test_client()
+    assert sign_in(client, '08031234567').location.endswith('/attendance')
+    assert '/success' in sign_in(client, '08037654321').location
+    assert signed_in(app) == 2
+
+
+def test_constraint_still_guards_without_index(app, meeting):
+    app.config['DUPLICATE_INDEX'] = False
+    try:
+        client = app.test_client()
+        assert '/success' in sign_in(client, '08031234567').location
+        assert sign_in(client, '08031234567').location.endswith('/attendance')
+    finally:
+        app.config['DUPLICATE_INDEX'] = True
+    assert signed_in(app) == 1
@@ -0,0 +1,36 @@
+"""Archive exports: cached files per export, and the inline CSV stream."""
+import os
+
+from conftest import sign_in
+
+
+def ended_meeting(app, admin):
+    client = app.test_client()
+    sign_in(client, '08031234567')
+    admin.post('/end-meeting')
+
+
+def test_single_and_archive_exports_are_cached_apart(app, admin, meeting):
+    ended_meeting(app, admin)
+    single = admin.post('/api/exports', json={'format': 'excel', 'session_id': meeting}).get_json()
+    archive = admin.post('/api/exports', json={'format': 'excel'}).get_json()
+    assert single['status'] == archive['status'] == 'done'
+    assert single['id'] != archive['id']
+
+    response = admin.get(archive['download_url'])
+    assert 'attendance_archive_' in response.headers['Content-Disposition']
+    again = admin.post('/api/exports', json={'format': 'excel', 'session_id': meeting}).get_json()
+    assert again['id'] == single['id']
+
+
+def test_inline_csv_is_streamed_without_a_file(app, admin, meeting):
+    from export_jobs import export_jobs
+    ended_meeting(app, admin)
+    export_jobs.discard()
+    response = admin.get(f'/download-single-session/{meeting}/csv')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'filename=Hall' in response.headers['Content-Disposition']
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 2 and '08031234567' in lines[1]
+    assert not [name for name in os.listdir(export_jobs.directory) if name.endswith('.csv')]
@@ -0,0 +1,84 @@
+"""Batched ingestion keeps one person per phone and one sign-in per meeting."""
+import threading
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import counters
+from app import ingest_queue
+from database import db
+from models import Attendance, Person
+
+
+def person(phone, firstname='Ada'):
+    return {'firstname': firstname, 'lastname': 'Obi', 'surname': 'Eze', 'phone': phone, 'email': None,
+            'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Grace', 'category': 'Member'}
+
+
+def record(session_id):
+    return Attendance(zone='MCA', group_name='WUSE', church='Grace', category='Member',
+                      meeting_session_id=session_id)
+
+
+@pytest.fixture
+def batched(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'INGEST_MODE', 'batched')
+    # Long enough for simultaneous submissions to land in one batch
+    monkeypatch.setitem(app.config, 'INGEST_FLUSH_INTERVAL', 0.2)
+    return app
+
+
+def submit_together(people_details, session_id):
+    """Submit sign-ins from parallel threads; returns each one's error or None"""
+    errors = [None] * len(people_details)
+    start = threading.Barrier(len(people_details))
+
+    def run(i, details):
+        start.wait()
+        try:
+            ingest_queue.submit(record(session_id), details)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, d)) for i, d in enumerate(people_details)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_same_phone_in_one_batch(batched, meeting):
+    errors = submit_together([person('08031234567'), person('+2348031234567', 'Bola'), person('08037654321')],
+                             meeting)
+    assert sum(isinstance(e, IntegrityError) for e in errors) == 1
+    assert sum(e is None for e in errors) == 2
+    with batched.app_context():
+        assert Person.query.count() == 2
+        assert Attendance.query.count() == 2
+        assert counters.session_total(meeting) == 2
+        assert counters.verify() == {}
+
+
+def test_batched_form_submission(batched, meeting):
+    client = batched.test_client()
+    data = {'firstname': 'Ada', 'lastname': 'Obi', 'surname': 'Eze', 'phone': '08031234567',
+            'zone': 'MCA', 'group_name': 'WUSE', 'church': 'Grace', 'category': 'Member'}
+    assert '/success' in client.post('/submit-attendance', data=data).location
+    assert client.post('/submit-attendance', data=data).location.endswith('/attendance')
+    with batched.app_context():
+        db.session.remove()
+        assert Attendance.query.count() == 1
+        assert Person.query.count() == 1
+
+
+def test_failed_batch_commit_saves_nothing(batched, meeting, monkeypatch):
+    def broken(records):
+        raise RuntimeError('counter update failed')
+    monkeypatch.setattr(counters, 'record_added', broken)
+    errors = submit_together([person('08031234567'), person('08037654321')], meeting)
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    with batched.app_context():
+        db.session.remove()
+        assert Attendance.query.count() == 0
+        assert Person.query.count() == 0
@@ -0,0 +1,106 @@
+"""Upgrading a database from before schema versioning runs every step once."""
+from sqlalchemy import inspect, text
+
+import counters
+import migrations
+from conftest import drop_all_tables
+from database import db
+from models import ArchivedAttendance, Attendance, MeetingSession, Person, SessionRollup
+
+# The tables as the first release created them, before the zone, group,
+# church and category fields; ended meetings' rows were flagged in place
+LEGACY_SCHEMA = [
+    '''CREATE TABLE meeting_location (
+        id INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, address VARCHAR(500),
+        latitude FLOAT NOT NULL, longitude FLOAT NOT NULL, radius_meters INTEGER,
+        is_active BOOLEAN, created_at DATETIME)''',
+    '''CREATE TABLE meeting_session (
+        id INTEGER PRIMARY KEY, meeting_name VARCHAR(200) NOT NULL,
+        location_id INTEGER REFERENCES meeting_location (id), start_time DATETIME NOT NULL,
+        end_time DATETIME, is_active BOOLEAN, attendee_count INTEGER)''',
+    '''CREATE TABLE attendance (
+        id INTEGER PRIMARY KEY, firstname VARCHAR(100) NOT NULL, lastname VARCHAR(100) NOT NULL,
+        surname VARCHAR(100) NOT NULL, email VARCHAR(200) UNIQUE, phone VARCHAR(20) NOT NULL UNIQUE,
+        timestamp DATETIME NOT NULL, latitude FLOAT, longitude FLOAT,
+        meeting_session_id INTEGER REFERENCES meeting_session (id), is_archived BOOLEAN)''',
+]
+
+
+def create_legacy_database():
+    drop_all_tables()
+    statements = LEGACY_SCHEMA + [
+        "INSERT INTO meeting_location VALUES (1, 'Hall', NULL, 9.0, 7.4, 30, 1, '2024-01-01 09:00:00')",
+        "INSERT INTO meeting_session VALUES (1, 'Old', 1, '2024-01-07 09:00:00', '2024-01-07 11:00:00', 0, 3)",
+        "INSERT INTO meeting_session VALUES (2, 'Now', 1, '2024-01-14 09:00:00', NULL, 1, 0)",
+        "INSERT INTO attendance VALUES (1, 'Ada', 'Obi', 'Eze', 'ada@example.com', '08030000001', "
+        "'2024-01-07 09:05:00', 9.0, 7.4, 1, 1)",
+        "INSERT INTO attendance VALUES (2, 'Bola', 'Ade', 'Ola', NULL, '+2348030000002', "
+        "'2024-01-07 09:06:00', NULL, NULL, 1, 1)",
+        "INSERT INTO attendance VALUES (3, 'Chi', 'Nna', 'Oke', NULL, '08030000003', "
+        "'2024-01-07 09:07:00', NULL, NULL, 1, 1)",
+        "INSERT INTO attendance VALUES (4, 'Dayo', 'Ige', 'Ayo', NULL, '08030000004', "
+        "'2024-01-14 09:05:00', NULL, NULL, 2, 0)",
+    ]
+    with db.engine.begin() as connection:
+        for statement in statements:
+            connection.execute(text(statement))
+
+
+def test_upgrade_legacy_database(app):
+    with app.app_context():
+        create_legacy_database()
+        assert migrations.current_version() == 0
+
+        applied = migrations.upgrade(log=lambda message: None)
+        assert applied == [number for number, _, _ in migrations.MIGRATIONS]
+        assert migrations.current_version() == migrations.LATEST == 6
+
+        # Details moved into the registry; events keep their ids
+        attendance_columns = {c['name'] for c in inspect(db.engine).get_columns('attendance')}
+        assert 'phone' not in attendance_columns and 'person_id' in attendance_columns
+        assert Person.query.count() == 4
+        assert db.session.get(Person, db.session.get(ArchivedAttendance, 2).person_id).phone == '08030000002'
+
+        # Rows flagged in place moved to the archive table, with the old defaults filled in
+        assert sorted(r.id for r in ArchivedAttendance.query) == [1, 2, 3]
+        assert [(r.id, r.zone, r.category) for r in Attendance.query] == [(4, 'MCA', 'Member')]
+
+        assert 'archive_file' in {c['name'] for c in inspect(db.engine).get_columns('meeting_session')}
+        assert db.session.get(MeetingSession, 1).archive_file is None
+        assert counters.session_total(1) == 3 and counters.session_total(2) == 1
+        assert counters.verify() == {}
+        assert db.session.get(SessionRollup, 1).total == 3
+
+
+def test_upgrade_is_idempotent(app):
+    with app.app_context():
+        create_legacy_database()
+        migrations.upgrade(log=lambda message: None)
+        assert migrations.upgrade(log=lambda message: None) == []
+        # A step interrupted and run again leaves the same schema
+        for _, _, step in migrations.MIGRATIONS[1:]:
+            step()
+        assert Person.query.count() == 4
+        assert counters.verify() == {}
+
+
+def test_new_database_is_stamped_latest(app):
+    with app.app_context():
+        assert migrations.current_version() == migrations.LATEST
+        assert migrations.upgrade(log=lambda message: None) == []
+
+
+def test_upgrade_keeps_earliest_details(app):
+    with app.app_context():
+        create_legacy_database()
+        # The same number written another way, signed in later under other names
+        with db.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO attendance VALUES (5, 'Adaeze', 'Okafor', 'Eze', 'ada.new@example.com', "
+                "'+2348030000001', '2024-01-14 09:06:00', NULL, NULL, 2, 0)"))
+            connection.execute(text("UPDATE attendance SET email = NULL WHERE id = 1"))
+        migrations.upgrade(log=lambda message: None)
+        person = Person.query.filter_by(phone='08030000001').one()
+        assert (person.firstname, person.lastname) == ('Ada', 'Obi')
+        # A detail the earlier row left blank is filled in from the later one
+        assert person.email == 'ada.new@example.com'
@@ -0,0 +1,101 @@
+"""The person registry: phone lookups and returning attendees' short sign-ins."""
+from conftest import sign_in
+
+from database import db
+from models import Attendance, MeetingSession, Person
+
+
+def returning_attendee(app, admin):
+    """Ada signs in to one meeting, which ends, and a new one starts"""
+    client = app.test_client()
+    assert '/success' in sign_in(client, '08031234567', email='ada@example.com').location
+    admin.post('/end-meeting')
+    admin.post('/start-meeting', data={'meeting_name': 'Next'})
+    with app.app_context():
+        assert MeetingSession.query.filter_by(is_active=True).count() == 1
+    return client
+
+
+def test_lookup_shows_only_a_greeting(app, admin, meeting):
+    client = returning_attendee(app, admin)
+    response = client.get('/api/people/lookup?phone=%2B2348031234567')
+    assert response.status_code == 200
+    assert response.get_json() == {'firstname': 'Ada', 'lastname_initial': 'O'}
+    assert client.get('/api/people/lookup?phone=08030000000').status_code == 404
+
+
+def test_lookup_is_rate_limited(app, admin, meeting, monkeypatch):
+    import app as app_module
+    from rate_limit import RateLimiter
+    monkeypatch.setattr(app_module, 'lookup_limiter', RateLimiter())
+    monkeypatch.setitem(app.config, 'LOOKUP_RATE_LIMIT', 3)
+    client = app.test_client()
+    statuses = [client.get(f'/api/people/lookup?phone=0803000000{i}').status_code for i in range(5)]
+    assert statuses == [404, 404, 404, 429, 429]
+    # Another client is counted on its own
+    other = client.get('/api/people/lookup?phone=08030000009', environ_base={'REMOTE_ADDR': '10.0.0.2'},
+                       headers={'X-Forwarded-For': '10.0.0.2'})
+    assert other.status_code == 404
+
+
+def short_sign_in(client, lastname):
+    return client.post('/submit-attendance', data={
+        'phone': '08031234567', 'lastname': lastname, 'firstname': '', 'surname': '',
+        'zone': '', 'group_name': '', 'church': '', 'category': ''})
+
+
+def test_phone_alone_is_not_enough(app, admin, meeting):
+    client = returning_attendee(app, admin)
+    assert client.post('/submit-attendance', data={'phone': '08031234567'}).location.endswith('/attendance')
+    assert short_sign_in(client, 'Someone').location.endswith('/attendance')
+    with app.app_context():
+        assert Attendance.query.count() == 0
+
+
+def test_phone_and_matching_last_name(app, admin, meeting):
+    client = returning_attendee(app, admin)
+    assert '/success' in short_sign_in(client, '  obi ').location
+    with app.app_context():
+        row = Attendance.query.one()
+        assert (row.zone, row.group_name, row.church, row.category) == ('MCA', 'WUSE', 'Grace', 'Member')
+        person = db.session.get(Person, row.person_id)
+        assert (person.firstname, person.email) == ('Ada', 'ada@example.com')
+
+
+def test_sign_in_does_not_rename_the_person_on_file(app, admin, meeting):
+    client = returning_attendee(app, admin)
+    response = sign_in(client, '08031234567', firstname='Mallory', lastname='Imposter', surname='X',
+                       email='mallory@example.com', zone='ZONE 9', church='Elsewhere')
+    assert '/success' in response.location
+    with app.app_context():
+        person = Person.query.one()
+        assert (person.firstname, person.lastname, person.email) == ('Ada', 'Obi', 'ada@example.com')
+        assert (person.zone, person.church) == ('MCA', 'Grace')
+
+
+def test_sign_in_fills_in_blank_details(app, admin, meeting):
+    client = app.test_client()
+    sign_in(client, '08031234567')
+    admin.post('/end-meeting')
+    admin.post('/start-meeting', data={'meeting_name': 'Next'})
+    sign_in(client, '08031234567', email='ada@example.com')
+    with app.app_context():
+        assert Person.query.one().email == 'ada@example.com'
+
+
+def test_queued_short_sign_in_is_filled_in(app, admin, meeting):
+    client = returning_attendee(app, admin)
+    with app.app_context():
+        session_id = MeetingSession.query.filter_by(is_active=True).one().id
+    records = [
+        {'client_id': 'a', 'meeting_session_id': session_id, 'age_seconds': 30,
+         'phone': '08031234567', 'lastname': 'Obi'},
+        {'client_id': 'b', 'meeting_session_id': session_id, 'age_seconds': 30,
+         'phone': '08031234567', 'lastname': 'Someone'},
+    ]
+    response = client.post('/api/attendance/batch', json={'records': records})
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == ['saved', 'rejected']
+    with app.app_context():
+        row = Attendance.query.one()
+        assert (row.zone, row.group_name, row.church, row.category) == ('MCA', 'WUSE', 'Grace', 'Member')